@@ -6,7 +6,45 @@
             A.class_stack.append(class_obj)
         tree = A.dot_source_prepare(generate_random_data)
         A.add_nodes_edges(tree, current_graph = A.dot,potential_module_map = module_map)
+            for very deep code or large unfold_times, pass iterative = True
+            to traverse with an explicit stack instead of recursion,
+            pass shared_callees = True to unfold every callee only once and link call sites to it,
+            recursive calls are linked back to the running unfold (detect_cycles = True),
+            add_nodes_edges returns a Traversal whose .cycles lists the recursion cycles found,
+            max_nodes / max_edges / deadline(seconds) stop further unfolding once exceeded,
+            Traversal.stats() reports node/edge counts and truncation
         A.save_ast("this_file")
+        A.reset_graph() empties A.dot / A.class_stack / A.node_ids before drawing the next graph
+    or, without the module globals (one GraphBuilder per graph, safe to use from several threads):
+        builder = A.GraphBuilder()
+        builder.add_function(generate_random_data)      # class method: cls = class_obj
+        builder.save("this_file")
+    many entry points in one process (shared caches, one output file per entry):
+        A.build_batch(["pkg_module.func", "pkg_module.Class.method"], output_dir = "graphs")
+        python ast_generator.py pkg_module.func pkg_module.Class.method -o graphs [-i paths.txt] [-f svg]
+    across processes: A.build_parallel(paths, output_dir = "graphs", workers = 8), or -j 8 on the command line
+    without keeping the graph in memory: A.DotStreamWriter("this_file.dot") or
+        A.DotStreamWriter.pipe_to("this_file.svg", format = "svg") as graph / current_graph
+    without layout: builder = A.GraphBuilder(A.GraphIR()), then builder.save("this_file", "json")
+        (or "graphml", "astg" compact binary, read back with A.load_binary); A.register_exporter adds formats
+    without importing the target code: builder.add_path("pkg_module.Class.method", static = True)
+        (or --static), calls are resolved from source files on sys.path through A.source_index
+    project symbol index: symbols = A.SymbolIndex.build(["project_root"], "symbols.json"),
+        then add_nodes_edges(..., symbols = symbols) / --symbols project_root [--symbol-index symbols.json]
+        resolves every call with one lookup, including functions imported by from...import
+    on demand: lazy = A.LazyGraph(); lazy.add_function(generate_random_data); lazy.save("graphs")
+        (or --lazy) writes graphs/index.html, clicking a call node loads the called function
+    while editing: A.GraphWatcher(paths, output_dir = "graphs").build(), then .watch() / --watch;
+        after an edit only the functions defined in the changed files are unfolded again and spliced into the graph
+        regenerates only the graphs (with lazy = True: the functions) whose source files changed
+    resident server with warm caches: A.GraphServer(port = 8765).serve_forever() / --serve 8765,
+        then A.request_graph("pkg_module.func", format = "json") or POST /graph from any client
+    in-memory rendering: data = A.render_bytes(builder.graph, format = "svg", engine = "neato")
+        (or builder.render("png")); A.save_ast("this_file", format = "svg") writes only this_file.svg
+    asyncio: await A.build_graph_async("pkg_module.func", format = "svg", timeout = 30),
+        A.add_nodes_edges_async(tree, builder = builder, ...), A.render_async(graph) / A.save_async(graph, "this_file")
+    huge graphs: A.save_ast_split("this_file", format = "svg") / builder.save_split(...) / --split
+        writes one file per top-level cluster, rendered in parallel, plus this_file.index.html
     only support some gramma in Python, as below:
      Function
      If
@@ -26,1440 +64,4391 @@
      List
      Tuple
     -and some other conditions I don't know if they are supported
-    if needed, you can add more gramma to support
-    can't correctly unfold functions which are directly imported by from...import, 
+    if needed, you can add more gramma to support,
+    by A.register_node_handler(node_type, handler) and A.register_label_handler(node_type, handler)
+    can't correctly unfold functions which are directly imported by from...import (unless a SymbolIndex or static is used), 
     can't correctly unfold module in package, if need, please import them respectively
     didn't deliverately support lambda function,
     calls by any instance object are not supported
+    parsed sources are shared through A.ast_cache (LRU), A.ast_cache.stats() shows hits/misses
+    A.enable_disk_cache() keeps parsed ASTs, alias maps and symbol tables under ~/.cache/ast_generator
+        between runs (on the command line: --cache); the cache files are pickles, only use a directory you trust
         
     version: 0.9
 """
 import types
 import ast as A
+import argparse
+import html
+import json
+import re
 import inspect
 import graphviz
 import textwrap
 import importlib
+import importlib.machinery
 import sys
+import os
+import linecache
+import contextlib
+import concurrent.futures
+import signal
+import subprocess
+import threading
+import asyncio
+import functools
+import http.server
+import urllib.parse
+import urllib.request
+import weakref
+import contextvars
+import hashlib
+import pickle
+import tempfile
+import time
+import xml.etree.ElementTree as ET
+from array import array
+from collections import OrderedDict
+from collections.abc import Mapping
 
 
 dot = graphviz.Digraph(comment='AST Graph')
 class_stack = []
+
+
+class NodeIdAllocator:
+    """
+    把 (展开上下文, AST 节点) 映射为紧凑的整数 ID（字符串形式，直接用作 graphviz 节点名）
+    展开函数时上下文就是调用处节点的 ID，因此 ID 长度不再随展开深度增长
+    """
+    def __init__(self):
+        self._ids = {}
+
+    def get(self, prefix, node):
+        key = (prefix, id(node))
+        node_id = self._ids.get(key)
+        if node_id is None:
+            node_id = self._ids[key] = str(len(self._ids))
+        return node_id
+
+    def clear(self):
+        self._ids.clear()
+
+    def __len__(self):
+        return len(self._ids)
+
+
+node_ids = NodeIdAllocator()
+
+
+class GraphBuilder:
+    """
+    一张图的构建上下文: graphviz 图、已画的边、类调用栈（self.xxx 调用时查找方法用）和节点 ID 分配器
+    每个线程各用一个 GraphBuilder 即可同时生成互不干扰的图,
+    未传 builder 时 add_nodes_edges 使用模块级的 dot / class_stack / node_ids
+    """
+    def __init__(self, graph=None, class_stack=None, node_ids=None, comment='AST Graph'):
+        self.graph = graph if graph is not None else graphviz.Digraph(comment=comment)
+        self.class_stack = class_stack if class_stack is not None else []
+        self.node_ids = node_ids if node_ids is not None else NodeIdAllocator()
+        self.edges_set = set()
+
+    def add_function(self, func, cls=None, unfold_times=2, end_function_list=[], **options):
+        """
+        把 func 的 AST 画到这张图上, func 是类方法时 cls 传入所属的类
+        其余参数同 add_nodes_edges, 返回本次遍历的 Traversal
+        """
+        module_map = get_namespace(func)
+        if cls is not None:
+            self.class_stack.append(cls)
+        try:
+            tree = dot_source_prepare(func)
+            return add_nodes_edges(tree, edges_set=self.edges_set, current_graph=self.graph,
+                                   unfold_times=unfold_times, end_function_list=end_function_list,
+                                   potential_module_map=module_map, builder=self, **options)
+        finally:
+            if cls is not None:
+                self.class_stack.pop()
+
+    def add_path(self, func_path, unfold_times=2, end_function_list=[], **options):
+        """
+        按字符串路径（"module.func" / "module.Class.method"）添加入口函数
+        options 中 static 为真时不导入模块, 从源文件静态解析, 见 SourceIndex
+        """
+        static = options.pop('static', None)
+        if not static:
+            func = _find_function(func_path)
+            return self.add_function(func, _owner_class(func), unfold_times, end_function_list, **options)
+        index = source_index if static is True else static
+        target = index.resolve(func_path)
+        if target is None:
+            raise FunctionNotFoundError(f"Function '{func_path}' not found in source files")
+        tree, namespace = target
+        return add_nodes_edges(tree, edges_set=self.edges_set, current_graph=self.graph,
+                               unfold_times=unfold_times, end_function_list=end_function_list,
+                               potential_module_map=namespace, builder=self, static=index, **options)
+
+    @property
+    def source(self):
+        return self.graph.source
+
+    def render(self, format='svg', engine='dot'):
+        """渲染结果的 bytes, 不写文件, 见 render_bytes"""
+        return render_bytes(self.graph, format, engine)
+
+    def save(self, file_path, format='pdf', engine='dot'):
+        """
+        path should include file name, format='dot' 时只保存 DOT 源码; 返回输出文件路径
+        graph 为 GraphIR 时还可以用 export 支持的格式（json / graphml / astg）, 不经过 graphviz 布局
+        DOT 源码经管道交给 graphviz, 只写出最终的 file_path.<format>
+        """
+        if isinstance(self.graph, GraphIR):
+            if format in _exporters:
+                return export(self.graph, file_path, format)
+            return GraphBuilder(self.graph.to_digraph()).save(file_path, format, engine)
+        if format == 'dot':
+            return self.graph.save(file_path + '.dot')
+        return _write_output(f"{file_path}.{format}", render_bytes(self.graph, format, engine))
+
+    def save_split(self, file_path, format='svg', min_nodes=1, workers=None):
+        """按顶层 cluster 拆分后并行渲染, 见 save_split; 返回索引页路径"""
+        return save_split(self.graph, file_path, format, min_nodes, workers)
+
+
+class _StreamBody:
+    """DotStreamWriter 的 body: 追加的语句立即交给 writer 写出, 自身不保存"""
+    __slots__ = ('writer',)
+
+    def __init__(self, writer):
+        self.writer = writer
+
+    def append(self, line):
+        self.writer._emit(self.writer._indent + line)
+
+    def __iadd__(self, lines):
+        for line in lines:
+            self.append(line)
+        return self
+
+    def __iter__(self):
+        return iter(())
+
+    def __len__(self):
+        return 0
+
+
+class DotStreamWriter(graphviz.Digraph):
+    """
+    把 DOT 语句直接写到文件或管道的 Digraph, 可以代替 graphviz.Digraph 传给
+    add_nodes_edges(current_graph=...) 或 GraphBuilder(graph=...), 图的内容不留在内存里
+    file: 文件路径或可写的文本文件对象; 用完后调用 close()（或用 with）写出结尾的 }
+    子图打开时写出头部, 关闭时写出 }; 子图打开期间写给外层图的语句先暂存, 子图关闭后紧接着写出
+    在不是最内层的图上打开的子图（如 shared_callees 模式下的函数子图）只能先整体缓存, 关闭时再写出
+    """
+    def __init__(self, file, comment='AST Graph', **kwargs):
+        super().__init__(comment=comment, **kwargs)
+        self.body = _StreamBody(self)
+        self._indent = ''
+        self._pending = []
+        self._closed = False
+        self._streaming = True
+        self._process = None
+        if isinstance(file, (str, os.PathLike)):
+            self._file = open(file, 'w', encoding='utf-8')
+            self._owns_file = True
+        else:
+            self._file = file
+            self._owns_file = False
+        # 正在直接写出的图, 最后一个是最内层
+        self._stack = [self]
+        # 注释、头部和图属性, 不含结尾的 }
+        for line in list(self.__iter__())[:-1]:
+            self._file.write(line)
+
+    @classmethod
+    def pipe_to(cls, output_path, format='svg', engine='dot', comment='AST Graph'):
+        """边遍历边通过 stdin 交给 graphviz 布局, 输出到 output_path; close() 时等待其结束"""
+        process = subprocess.Popen([engine, f'-T{format}', '-o', os.fspath(output_path)],
+                                   stdin=subprocess.PIPE, text=True, encoding='utf-8')
+        writer = cls(process.stdin, comment)
+        writer._process = process
+        return writer
+
+    def _emit(self, text):
+        if self._closed:
+            raise ValueError(f"graph {self.name!r} is already closed")
+        if self._streaming and self._stack[-1] is self:
+            self._file.write(text)
+        else:
+            self._pending.append(text)
+
+    def _flush_pending(self):
+        if self._pending and self._streaming and self._stack[-1] is self:
+            self._file.writelines(self._pending)
+            self._pending.clear()
+
+    def subgraph(self, graph=None, name=None, comment=None,
+                 graph_attr=None, node_attr=None, edge_attr=None, body=None):
+        if graph is not None:
+            return super().subgraph(graph)
+        sub = DotStreamWriter.__new__(DotStreamWriter)
+        graphviz.Digraph.__init__(sub, name=name, comment=comment, graph_attr=graph_attr,
+                                  node_attr=node_attr, edge_attr=edge_attr)
+        sub.body = _StreamBody(sub)
+        sub._indent = self._indent + '\t'
+        sub._pending = []
+        sub._closed = False
+        sub._streaming = self._streaming and self._stack[-1] is self
+        sub._process = None
+        sub._file = self._file
+        sub._owns_file = False
+        sub._stack = self._stack
+        head = [sub._indent + line for line in list(sub.__iter__(subgraph=True))[:-1]]
+        if sub._streaming:
+            self._file.writelines(head)
+            self._stack.append(sub)
+        else:
+            sub._pending.extend(head)
+        for line in body or ():
+            sub.body.append(line)
+        return self._subgraph_context(sub)
+
+    @contextlib.contextmanager
+    def _subgraph_context(self, sub):
+        try:
+            yield sub
+        finally:
+            tail = sub._indent + sub._tail
+            if sub._streaming:
+                if self._stack[-1] is not sub:
+                    raise ValueError(f"subgraph {sub.name!r} closed before its inner subgraphs")
+                sub._flush_pending()
+                self._file.write(tail)
+                self._stack.pop()
+                sub._closed = True
+                self._flush_pending()
+            else:
+                lines = sub._pending + [tail]
+                sub._pending = []
+                sub._closed = True
+                for line in lines:
+                    self._emit(line)
+
+    def close(self):
+        """写出结尾的 }, 关闭自己打开的文件; 输出到 graphviz 进程时等待其结束"""
+        if self._closed:
+            return
+        self._flush_pending()
+        self._file.write(self._tail)
+        self._closed = True
+        if self._owns_file or self._process is not None:
+            self._file.close()
+        if self._process is not None:
+            returncode = self._process.wait()
+            if returncode:
+                raise subprocess.CalledProcessError(returncode, self._process.args)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class IRNode:
+    """GraphIR 的节点记录, label / cluster 为字符串表下标（0 表示无）, attrs 为 (键, 值) 下标交替的 tuple"""
+    __slots__ = ('label', 'cluster', 'attrs')
+
+    def __init__(self, label, cluster, attrs):
+        self.label = label
+        self.cluster = cluster
+        self.attrs = attrs
+
+
+class GraphIR:
+    """
+    内存中的图, 与 graphviz.Digraph 一样提供 attr / node / edge / subgraph, 可以直接作为
+    add_nodes_edges 的 current_graph 或 GraphBuilder 的 graph（输出后端）
+    只记录节点、边、cluster 和标签, 不涉及布局; 用 export() 导出为 json / graphml / astg（紧凑二进制）,
+    或用 to_digraph() 转成 graphviz.Digraph 渲染
+    存储尽量紧凑: 所有字符串（ID、标签、属性）放进一张去重的字符串表, 节点是 __slots__ 记录,
+    边是四个 array('I')（起点、终点、标签、cluster 的字符串下标）, 只有少数边带的属性另存
+    """
+    def __init__(self, comment='AST Graph'):
+        self.comment = comment
+        self.name = None
+        self.graph_attrs = {}
+        # 下标 0 固定表示 None
+        self._strings = [None]
+        self._string_ids = {None: 0}
+        # 名字 -> [上层 cluster 名字, 属性]
+        self._clusters = {}
+        # 节点 ID -> IRNode, 第一次出现时所在的 cluster 为准
+        self._nodes = {}
+        self._edge_tails = array('I')
+        self._edge_heads = array('I')
+        self._edge_labels = array('I')
+        self._edge_clusters = array('I')
+        # 边的下标 -> 属性 tuple
+        self._edge_attrs = {}
+
+    def attr(self, kw=None, **attrs):
+        self._attr(None, kw, attrs)
+
+    def node(self, name, label=None, **attrs):
+        self._node(None, name, label, attrs)
+
+    def edge(self, tail_name, head_name, label=None, **attrs):
+        self._edge(None, tail_name, head_name, label, attrs)
+
+    def subgraph(self, graph=None, name=None, **kwargs):
+        return self._subgraph(None, graph, name, kwargs)
+
+    def _intern(self, value):
+        index = self._string_ids.get(value)
+        if index is None:
+            index = self._string_ids[value] = len(self._strings)
+            self._strings.append(value)
+        return index
+
+    def _intern_text(self, value):
+        # 与 graphviz 相同, 标签和属性的值都按字符串输出, 各后端（含 astg 往返）得到的都是 str
+        return self._intern(None if value is None else str(value))
+
+    def _pack_attrs(self, attrs):
+        # 与 graphviz 相同, 值为 None 的属性视为未设置
+        packed = ()
+        for key, value in attrs.items():
+            if value is not None:
+                packed += (self._intern(key), self._intern_text(value))
+        return packed
+
+    def _unpack_attrs(self, packed):
+        strings = self._strings
+        return {strings[packed[i]]: strings[packed[i + 1]] for i in range(0, len(packed), 2)}
+
+    def _attr(self, cluster, kw, attrs):
+        if kw not in (None, 'graph'):
+            raise ValueError(f"GraphIR only records graph attributes, got {kw!r}")
+        target = self.graph_attrs if cluster is None else self._clusters[cluster][1]
+        for key, value in attrs.items():
+            if value is not None:
+                target[key] = str(value)
+
+    def _node(self, cluster, name, label, attrs):
+        record = self._nodes.get(name)
+        if record is None:
+            self._intern(name)
+            self._nodes[name] = IRNode(self._intern_text(label), self._intern(cluster),
+                                       self._pack_attrs(attrs) if attrs else ())
+        else:
+            # 与 graphviz 相同, 重复声明时合并属性
+            if label is not None:
+                record.label = self._intern_text(label)
+            if attrs:
+                merged = self._unpack_attrs(record.attrs)
+                merged.update(attrs)
+                record.attrs = self._pack_attrs(merged)
+
+    def _edge(self, cluster, tail_name, head_name, label, attrs):
+        if attrs:
+            packed = self._pack_attrs(attrs)
+            if packed:
+                self._edge_attrs[len(self._edge_tails)] = packed
+        self._edge_tails.append(self._intern(tail_name))
+        self._edge_heads.append(self._intern(head_name))
+        self._edge_labels.append(self._intern_text(label))
+        self._edge_clusters.append(self._intern(cluster))
+
+    def _subgraph(self, parent, graph, name, kwargs):
+        # 只支持按名字新建（或再次进入）cluster; 挂入已有的子图和 node_attr 等默认属性无法记录, 直接报错
+        if graph is not None:
+            raise TypeError("GraphIR cannot attach an existing subgraph, use subgraph(name=...)")
+        unsupported = sorted(key for key, value in kwargs.items()
+                             if value is not None and key not in ('comment', 'graph_attr'))
+        if unsupported:
+            raise ValueError(f"GraphIR only records graph attributes, got {', '.join(unsupported)}")
+        if name not in self._clusters:
+            self._clusters[name] = [parent, {}]
+        if kwargs.get('graph_attr'):
+            self._attr(name, None, kwargs['graph_attr'])
+        return contextlib.nullcontext(_GraphIRView(self, name))
+
+    def nodes(self):
+        """依次给出 (ID, 标签, 所在 cluster, 属性)"""
+        strings = self._strings
+        for name, record in self._nodes.items():
+            yield (name, strings[record.label], strings[record.cluster],
+                   self._unpack_attrs(record.attrs))
+
+    def edges(self):
+        """依次给出 (起点, 终点, 标签, 所在 cluster, 属性)"""
+        strings = self._strings
+        edge_attrs = self._edge_attrs
+        for index, (tail, head, label, cluster) in enumerate(zip(
+                self._edge_tails, self._edge_heads, self._edge_labels, self._edge_clusters)):
+            packed = edge_attrs.get(index)
+            yield (strings[tail], strings[head], strings[label], strings[cluster],
+                   self._unpack_attrs(packed) if packed else {})
+
+    def clusters(self):
+        """依次给出 (名字, 上层 cluster, 属性), 上层总在下层之前"""
+        for name, (parent, attrs) in self._clusters.items():
+            yield name, parent, attrs
+
+    def edge_count(self):
+        return len(self._edge_tails)
+
+    def _position(self):
+        # 当前的 (节点数, 边数, cluster 数), 即各自插入顺序中下一项的下标
+        return (len(self._nodes), len(self._edge_tails), len(self._clusters))
+
+    def _splice(self, start, end, mark):
+        """
+        用 mark 之后追加的节点、边和 cluster 替换 [start, end) 这一段（位置均为 _position() 的结果）:
+        追加的内容移到 start 处, 原来的一段删除, 其余内容的先后顺序不变
+        """
+        (node_start, edge_start, cluster_start), (node_end, edge_end, cluster_end) = start, end
+        node_mark, edge_mark, cluster_mark = mark
+        nodes = list(self._nodes.items())
+        self._nodes = dict(nodes[:node_start] + nodes[node_mark:] + nodes[node_end:node_mark])
+        clusters = list(self._clusters.items())
+        self._clusters = dict(clusters[:cluster_start] + clusters[cluster_mark:] + clusters[cluster_end:cluster_mark])
+        added = len(self._edge_tails) - edge_mark
+        for name in ('_edge_tails', '_edge_heads', '_edge_labels', '_edge_clusters'):
+            edges = getattr(self, name)
+            setattr(self, name, edges[:edge_start] + edges[edge_mark:] + edges[edge_end:edge_mark])
+        edge_attrs = {}
+        for index, packed in self._edge_attrs.items():
+            if index < edge_start:
+                edge_attrs[index] = packed
+            elif index >= edge_mark:
+                edge_attrs[index - edge_mark + edge_start] = packed
+            elif index >= edge_end:
+                edge_attrs[index - (edge_end - edge_start) + added] = packed
+        self._edge_attrs = edge_attrs
+
+    def to_digraph(self):
+        """转成 graphviz.Digraph, 用于渲染"""
+        members = {None: []}
+        children = {None: []}
+        for name, parent, _ in self.clusters():
+            members[name] = []
+            children[name] = []
+            children[parent].append(name)
+        for name, label, cluster, attrs in self.nodes():
+            members[cluster].append((name, label, attrs))
+        edges = {name: [] for name in members}
+        for tail, head, label, cluster, attrs in self.edges():
+            edges[cluster].append((tail, head, label, attrs))
+
+        def fill(graph, cluster):
+            for name, label, attrs in members[cluster]:
+                graph.node(name, label, **attrs)
+            for tail, head, label, attrs in edges[cluster]:
+                graph.edge(tail, head, label=label, **attrs)
+            for child in children[cluster]:
+                with graph.subgraph(name=child) as sub:
+                    sub.attr(**self._clusters[child][1])
+                    fill(sub, child)
+
+        graph = graphviz.Digraph(comment=self.comment)
+        graph.attr(**self.graph_attrs)
+        fill(graph, None)
+        return graph
+
+    def __len__(self):
+        return len(self._nodes)
+
+
+class _GraphIRView:
+    """GraphIR 中某个 cluster 的 Digraph 接口, 由 GraphIR.subgraph 给出"""
+    __slots__ = ('ir', 'name')
+
+    def __init__(self, ir, name):
+        self.ir = ir
+        self.name = name
+
+    def attr(self, kw=None, **attrs):
+        self.ir._attr(self.name, kw, attrs)
+
+    def node(self, name, label=None, **attrs):
+        self.ir._node(self.name, name, label, attrs)
+
+    def edge(self, tail_name, head_name, label=None, **attrs):
+        self.ir._edge(self.name, tail_name, head_name, label, attrs)
+
+    def subgraph(self, graph=None, name=None, **kwargs):
+        return self.ir._subgraph(self.name, graph, name, kwargs)
+
+
+def _default_cache_dir():
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.environ.get('AST_GENERATOR_CACHE_DIR') or os.path.join(base, 'ast_generator')
+
+
+class DiskCache:
+    """
+    进程之间、多次运行之间共享的持久缓存: 函数的语法树、模块的别名表和 SymbolIndex 的条目,
+    键为 (种类, 源文件内容的哈希, ...) 加上 Python 版本
+    每个条目一个 pickle 文件, 先写临时文件再用 os.replace 换入, 并发读取时不会读到写了一半的条目;
+    pickle 文件会被加载执行, 只使用自己的目录
+    总大小超过 max_bytes 时删除最久未使用的条目（按 mtime, 每次命中时更新）
+    """
+    VERSION = 1
+
+    def __init__(self, directory=None, max_bytes=256 * 1024 * 1024):
+        self.directory = directory or _default_cache_dir()
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._written = None
+        self._hashes = {}
+        self._lock = threading.Lock()
+
+    def file_hash(self, file_path):
+        """文件内容的 sha256, 按 (mtime, size) 记住结果; 文件不可读时返回 None"""
+        version = _file_version(file_path)
+        if version is None:
+            return None
+        with self._lock:
+            cached = self._hashes.get(file_path)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        try:
+            with open(file_path, 'rb') as f:
+                digest = hashlib.sha256(f.read()).hexdigest()
+        except OSError:
+            return None
+        with self._lock:
+            self._hashes[file_path] = (version, digest)
+        return digest
+
+    def _path(self, kind, key):
+        tag = (self.VERSION, sys.implementation.cache_tag, kind) + tuple(key)
+        digest = hashlib.sha256(repr(tag).encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, kind, digest[:2], digest + '.pickle')
+
+    def get(self, kind, key, default=None):
+        path = self._path(kind, key)
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+        except FileNotFoundError:
+            self.misses += 1
+            return default
+        except Exception as e:
+            # 损坏或不兼容的条目直接删掉
+            print(f"Dropping unreadable cache entry {path}: {e}")
+            with contextlib.suppress(OSError):
+                os.remove(path)
+            self.misses += 1
+            return default
+        with contextlib.suppress(OSError):
+            os.utime(path)
+        self.hits += 1
+        return value
+
+    def put(self, kind, key, value):
+        path = self._path(kind, key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+                    size = f.tell()
+                os.replace(tmp_path, path)
+            except BaseException:
+                with contextlib.suppress(OSError):
+                    os.remove(tmp_path)
+                raise
+        except Exception as e:
+            print(f"Error writing cache entry {path}: {e}")
+            return
+        # 每写入约 max_bytes / 16 检查一次总大小, 进程中第一次写入时也检查
+        with self._lock:
+            due = self._written is None or self._written + size > self.max_bytes // 16
+            self._written = 0 if due else self._written + size
+        if due:
+            self.evict()
+
+    def _entries(self):
+        entries = []
+        for dir_path, _, file_names in os.walk(self.directory):
+            for file_name in file_names:
+                path = os.path.join(dir_path, file_name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime_ns, st.st_size, path))
+        return entries
+
+    def evict(self):
+        """删除最久未使用的条目, 直到总大小低于 max_bytes"""
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        if total <= self.max_bytes:
+            return
+        # 删到上限的 90%, 避免每次写入都要淘汰; 其他进程可能同时在删, 找不到的文件忽略
+        target = self.max_bytes * 9 // 10
+        for _, size, path in sorted(entries):
+            if total <= target:
+                break
+            with contextlib.suppress(OSError):
+                os.remove(path)
+            total -= size
+
+    def size(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "directory": self.directory,
+                "max_bytes": self.max_bytes}
+
+    def clear(self):
+        for _, _, path in self._entries():
+            with contextlib.suppress(OSError):
+                os.remove(path)
+        with self._lock:
+            self._hashes.clear()
+
+
+# enable_disk_cache() 之后使用的 DiskCache, 默认不使用
+disk_cache = None
+
+
+def enable_disk_cache(directory=None, max_bytes=256 * 1024 * 1024):
+    """之后的解析都使用 directory（默认 ~/.cache/ast_generator）中的 DiskCache"""
+    global disk_cache
+    disk_cache = DiskCache(directory, max_bytes)
+    return disk_cache
+
+
+def disable_disk_cache():
+    global disk_cache
+    disk_cache = None
+
+
+class ASTCache:
+    """
+    函数 / 类源码解析结果的 LRU 缓存, 所有展开调用时的查找共用
+    键: (源文件, mtime, size, 模块名, qualname, 起始行号)
+    add_nodes_edges 不修改缓存中的语法树, 同一棵树可以被多个遍历（和线程）同时使用;
+    未命中时先查 disk_cache（若已启用）, 再调用 inspect.getsource 解析
+    """
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _key(self, obj):
+        try:
+            file_path = inspect.getsourcefile(obj) or inspect.getfile(obj)
+        except TypeError:
+            return None
+        try:
+            st = os.stat(file_path)
+            version = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            # 无文件可查（如交互式定义），仅靠 linecache 中的内容区分
+            version = None
+        code = getattr(inspect.unwrap(obj), '__code__', None)
+        first_line = code.co_firstlineno if code is not None else None
+        return (file_path, version, getattr(obj, '__module__', None),
+                getattr(obj, '__qualname__', getattr(obj, '__name__', None)), first_line)
+
+    def get(self, obj):
+        """obj 源码的语法树（A.Module）, 取不到源码时抛出的异常同 inspect.getsource"""
+        key = self._key(obj)
+        with self._lock:
+            if key is not None and key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+        # 解析放在锁外, 两个线程同时未命中时各自解析, 后写入的覆盖前者
+        tree = self._parse(obj, key)
+        tree.cache_key = key
+        if key is not None:
+            with self._lock:
+                self._entries[key] = tree
+                if len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+        return tree
+
+    def _parse(self, obj, key):
+        cache = disk_cache
+        digest = None
+        if cache is not None and key is not None and key[1] is not None:
+            digest = cache.file_hash(key[0])
+        if digest is not None:
+            tree = cache.get('ast', (digest,) + key[2:])
+            if tree is not None:
+                return tree
+        if key is not None:
+            linecache.checkcache(key[0])
+        source = textwrap.dedent(inspect.getsource(obj))
+        tree = A.parse(source)
+        if digest is not None:
+            cache.put('ast', (digest,) + key[2:], tree)
+        return tree
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses,
+                "size": len(self._entries), "maxsize": self.maxsize}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+ast_cache = ASTCache()
+
+
 def dot_source_prepare(func):
-    source = inspect.getsource(func)
-    tree = A.parse(textwrap.dedent(source))
+    tree = ast_cache.get(func)
     return tree
 
+_BLOCK_TYPES = (A.FunctionDef, A.ClassDef, A.If, A.For, A.While, A.Try, A.With, A.Match)
+# 处理结束后不再进入通用的字段/连边逻辑
+STOP = object()
+
+_node_handlers = {}
+_label_handlers = {}
+# type(node) -> handler 的解析结果, 注册新处理函数时清空
+_node_dispatch = {}
+_label_dispatch = {}
+
+
+class Traversal:
+    """
+    一次 add_nodes_edges 调用（包括其中所有函数展开）共享的选项和状态
+    root_graph: 顶层图, 共享展开的函数子图画在这里
+    shared_callees: 共享展开模式下 (函数, 剩余展开次数) -> 函数节点 ID, 否则为 None
+    unfold_stack: 正在展开的函数 [(函数, 函数节点 ID, 函数名)], 不检测递归时为 None
+    cycles: 检测到的递归调用环, 每个环是函数名组成的 tuple
+    max_nodes / max_edges / deadline: 预算, 超出后不再展开新的函数调用, deadline 为 time.monotonic() 时刻
+    cancel: threading.Event, 被设置后同超出预算一样不再展开新的函数调用（truncated_by 为 'cancelled'）
+    builder: 本次遍历所在的 GraphBuilder
+    static: 静态解析调用时使用的 SourceIndex, 导入模块解析时为 None
+    symbols: 工程的 SymbolIndex, 调用处先在其中查找被调用的函数, 未使用时为 None
+    lazy: 按需展开时的 LazyGraph, 被调用的函数只登记到其中, 片段 ID 依次记在 lazy_links
+    sources: 图依赖的源文件 {文件: (mtime, size)}, 即入口和展开过的函数所在的文件
+    spans: 画到 GraphIR 上时每次函数展开的 UnfoldSpan（按展开的先后）, 不记录时为 None
+    """
+    __slots__ = ('builder', 'node_ids', 'static', 'symbols', 'lazy', 'lazy_links', 'sources', 'spans', 'root_graph', 'shared_callees', 'unfold_stack', 'cycles', 'edges_set',
+                 'max_nodes', 'max_edges', 'deadline', 'cancel', 'node_count', 'unfolded',
+                 'truncated_calls', 'truncated_by', 'start_time', 'end_time')
+
+    def __init__(self, root_graph, shared_callees=False, detect_cycles=True, edges_set=None,
+                 max_nodes=None, max_edges=None, deadline=None, builder=None, static=None, symbols=None,
+                 lazy=None, cancel=None, spans=None):
+        self.builder = builder if builder is not None else GraphBuilder(root_graph)
+        self.node_ids = self.builder.node_ids
+        self.static = static
+        self.symbols = symbols
+        self.lazy = lazy
+        self.lazy_links = []
+        self.sources = {}
+        self.spans = spans
+        self.root_graph = root_graph
+        self.shared_callees = {} if shared_callees else None
+        self.unfold_stack = [] if detect_cycles else None
+        self.cycles = []
+        self.edges_set = edges_set if edges_set is not None else set()
+        self.max_nodes = max_nodes
+        self.max_edges = max_edges
+        self.deadline = deadline
+        self.cancel = cancel
+        self.node_count = 0
+        self.unfolded = 0
+        self.truncated_calls = 0
+        self.truncated_by = None
+        self.start_time = time.monotonic()
+        self.end_time = None
+
+    def over_budget(self):
+        """返回超出的预算名（'max_nodes' / 'max_edges' / 'deadline' / 'cancelled'），未超出时返回 None"""
+        if self.truncated_by is None:
+            if self.cancel is not None and self.cancel.is_set():
+                self.truncated_by = 'cancelled'
+            elif self.max_nodes is not None and self.node_count >= self.max_nodes:
+                self.truncated_by = 'max_nodes'
+            elif self.max_edges is not None and len(self.edges_set) >= self.max_edges:
+                self.truncated_by = 'max_edges'
+            elif self.deadline is not None and time.monotonic() >= self.deadline:
+                self.truncated_by = 'deadline'
+        return self.truncated_by
+
+    def stats(self):
+        end_time = self.end_time if self.end_time is not None else time.monotonic()
+        return {"nodes": self.node_count, "edges": len(self.edges_set),
+                "unfolded_calls": self.unfolded, "truncated_calls": self.truncated_calls,
+                "truncated_by": self.truncated_by, "cycles": len(self.cycles),
+                "elapsed": end_time - self.start_time}
+
+
+class NodeVisit:
+    """
+    add_nodes_edges 中单个节点的访问状态，传给注册的节点处理函数
+    处理函数可以修改 label / child_iter_needs，返回 STOP 则跳过通用的字段标注、
+    画节点、连父节点和遍历子节点的步骤
+    """
+    __slots__ = ('node_id', 'label', 'parent', 'edges_set', 'loop_stack', 'prefix',
+                 'current_graph', 'unfold_times', 'upper_connect_node',
+                 'end_function_list', 'potential_module_map', 'child_iter_needs',
+                 'traversal', 'node_attrs')
+
+    def __init__(self, node_id, label, parent, edges_set, loop_stack, prefix,
+                 current_graph, unfold_times, upper_connect_node,
+                 end_function_list, potential_module_map, traversal):
+        self.node_id = node_id
+        self.label = label
+        self.parent = parent
+        self.edges_set = edges_set
+        self.loop_stack = loop_stack
+        self.prefix = prefix
+        self.current_graph = current_graph
+        self.unfold_times = unfold_times
+        self.upper_connect_node = upper_connect_node
+        self.end_function_list = end_function_list
+        self.potential_module_map = potential_module_map
+        self.child_iter_needs = True
+        self.traversal = traversal
+        self.node_attrs = None
+
+    def id_of(self, node):
+        """node 在当前展开上下文中的 ID"""
+        if type(node) is CallSite:
+            return node.node_id
+        return self.traversal.node_ids.get(self.prefix, node)
+
+
+class CallSite:
+    """
+    展开函数时作为函数定义节点的 parent 传入, 记录调用处节点（属于调用方的上下文）及其 ID
+    """
+    __slots__ = ('node', 'node_id')
+
+    def __init__(self, node, node_id):
+        self.node = node
+        self.node_id = node_id
+
+
+class UnfoldSpan:
+    """
+    一次函数展开在 GraphIR 中占据的一段: 遍历是深度优先的, 展开期间加入的节点、边和 cluster
+    在各自的插入顺序中是连续的, start / end 为展开前后的 GraphIR._position()
+    其余字段是在原处重新展开这个函数所需的上下文（见 GraphWatcher）
+    """
+    __slots__ = ('tree', 'module_map', 'call_site', 'loop_stack', 'prefix', 'cluster', 'unfold_times',
+                 'end_function_list', 'class_stack', 'unfold_stack', 'start', 'end')
+
+    def __init__(self, tree, module_map, call_site, loop_stack, prefix, cluster, unfold_times,
+                 end_function_list, class_stack, unfold_stack, start):
+        self.tree = tree
+        self.module_map = module_map
+        self.call_site = call_site
+        self.loop_stack = loop_stack
+        self.prefix = prefix
+        self.cluster = cluster
+        self.unfold_times = unfold_times
+        self.end_function_list = end_function_list
+        self.class_stack = class_stack
+        self.unfold_stack = unfold_stack
+        self.start = start
+        self.end = None
+
+    def contains(self, other):
+        # 节点总是至少多出一个（函数定义节点）, 按节点的范围判断即可
+        return self.start[0] <= other.start[0] and other.end[0] <= self.end[0]
+
+
+def _resolve_handler(table, dispatch, node_type):
+    # 按 MRO 查找，保持与 isinstance 相同的语义，结果缓存到 dispatch
+    handler = None
+    for klass in node_type.__mro__:
+        if klass in table:
+            handler = table[klass]
+            break
+    dispatch[node_type] = handler
+    return handler
+
+
+def register_node_handler(node_type, handler=None):
+    """
+    为 node_type 注册 add_nodes_edges 的处理函数 handler(node, visit)，visit 为 NodeVisit
+    handler 可以是生成器: 以 add_nodes_edges 的参数元组 yield 需要处理的子节点,
+    这样在 iterative 模式下也不会产生递归
+    可作为装饰器使用: @register_node_handler(A.AsyncFor)
+    """
+    if handler is None:
+        return lambda func: register_node_handler(node_type, func)
+    _node_handlers[node_type] = handler
+    _node_dispatch.clear()
+    return handler
+
+
+def register_label_handler(node_type, handler=None):
+    """
+    为 node_type 注册 get_label 的处理函数 handler(node, potential_module_map) -> str
+    可作为装饰器使用: @register_label_handler(A.Lambda)
+    """
+    if handler is None:
+        return lambda func: register_label_handler(node_type, func)
+    _label_handlers[node_type] = handler
+    _label_dispatch.clear()
+    _label_cache.clear()
+    return handler
+
+
 def add_nodes_edges(node, parent = None, edges_set = None, loop_stack = None, prefix = "",
                      current_graph = None, unfold_times = 2, upper_connect_node = None,
-                        end_function_list =[], potential_module_map = []):
-    current_graph.attr(rankdir='TB', rank="same")
+                        end_function_list =[], potential_module_map = [], iterative = False,
+                        shared_callees = False, detect_cycles = True,
+                        max_nodes = None, max_edges = None, deadline = None, builder = None,
+                        static = None, symbols = None, max_label_length = None, lazy = None,
+                        cancel = None, spans = None):
+    """
+    builder: 使用的 GraphBuilder, 未传时使用模块级的 dot / class_stack / node_ids
+    static=True（或传入一个 SourceIndex）时只从源文件静态解析被调用的函数, 不导入任何模块,
+    此时 potential_module_map 应为 SourceIndex.namespace() 给出的 ModuleNamespace
+    symbols: SymbolIndex, 调用处先按全限定名在其中查找（一次字典查找, 包括 from ... import 引入的函数）,
+    只导入定义所在的模块; 查不到时再按原来的方式解析
+    max_label_length: 标签（包括其中每个子表达式的部分）超过这个字符数后截断并以 ... 结尾,
+    很长的表达式不再拼出完整的字符串
+    lazy: LazyGraph, 调用处不展开, 只把被调用的函数登记为片段并在调用节点上加链接, 见 LazyGraph
+    cancel: threading.Event, 其他线程设置后不再展开新的函数调用, 见 add_nodes_edges_async
+    spans: 列表, 画到 GraphIR 上时把每次函数展开的 UnfoldSpan 依次加进去, 供 GraphWatcher 只重新展开变化了的函数
+    iterative=True 时用显式栈代替递归遍历（包括函数展开），得到的图与递归方式相同,
+    不受 Python 递归深度限制
+    shared_callees=True 时每个 (函数, 剩余展开次数) 只展开一次, 放在顶层图的独立子图里,
+    其余调用处只连一条边过去, 图的大小随不同函数的个数线性增长而不是随调用扇出指数增长
+    detect_cycles=True 时展开到正在展开中的函数（递归/互相递归）不再重复展开,
+    而是画一条 Recursion 边回到已有的展开, 检测到的环记录在返回的 Traversal.cycles 中
+    max_nodes / max_edges / deadline(秒): 超出任一预算后不再展开新的函数调用,
+    被跳过的调用节点标红并注明 truncated, 已经在处理中的函数体仍会画完
+    返回本次遍历的 Traversal, Traversal.stats() 给出节点数、边数、截断情况和耗时
+    """
     if loop_stack is None:
         loop_stack = []
+    if builder is None:
+        if not dot.body:
+            # 模块级的图还是空的（新的一张图）, 之前分配的 ID 不会再用到, 不必继续占着内存
+            node_ids.clear()
+        builder = GraphBuilder(dot, class_stack, node_ids)
+    if current_graph is None:
+        current_graph = builder.graph
     if edges_set is None:
-        edges_set = set()  
-    child_iter_needs = True
-    
-    node_id = f"{prefix}|{id(node)}" 
-    # 标记当前节点的ID，供子节点递归时获取
-    current_node_id = node_id
-    node.current_node_id = current_node_id
-    label = node.__class__.__name__
-    if isinstance(node, A.Module):
-        for child in A.iter_child_nodes(node):
-            add_nodes_edges(child, parent, edges_set, loop_stack, prefix, 
-                            current_graph, unfold_times, upper_connect_node,
-                            end_function_list, potential_module_map)
+        edges_set = builder.edges_set
+    if static is True:
+        static = source_index
+    traversal = Traversal(current_graph, shared_callees, detect_cycles, edges_set,
+                          max_nodes, max_edges,
+                          time.monotonic() + deadline if deadline is not None else None,
+                          builder, static or None, symbols, lazy, cancel, spans)
+    _add_source(traversal, getattr(node, 'cache_key', None))
+    visit = _visit_node(node, parent, edges_set, loop_stack, prefix,
+                        current_graph, unfold_times, upper_connect_node,
+                        end_function_list, potential_module_map, traversal)
+    token = _label_limit.set(max_label_length)
+    try:
+        if iterative:
+            _walk_iterative(visit, traversal)
+        else:
+            _walk_recursive(visit, traversal)
+    finally:
+        _label_limit.reset(token)
+    traversal.end_time = time.monotonic()
+    return traversal
+
+
+# 节点类型 -> 需要检查是否添加到标签的字段名
+_label_fields = {}
+
+
+def _fields_of(node_type):
+    fields = _label_fields[node_type] = tuple(f for f in getattr(node_type, '_fields', ()) if f != "ctx")
+    return fields
+
+
+def _is_ast_list(value):
+    # 以第一个非 None 元素判断（Dict.keys 中 ** 展开的位置为 None）
+    for item in value:
+        if item is not None:
+            return isinstance(item, A.AST)
+    return False
+
+
+def _walk_recursive(visit, traversal):
+    # 子节点抛出的异常交还给父节点的处理函数（如 Call 展开时的 try/except）
+    error = None
+    while True:
+        try:
+            child_args = visit.throw(error) if error is not None else next(visit)
+        except StopIteration:
             return
-            
-    if isinstance(node, A.FunctionDef):
-        if parent is not None:
-            parent_id = parent.current_node_id if hasattr(parent, 'current_node_id') else str(id(parent))
-            if (parent_id, node_id) not in edges_set:
-                current_graph.edge(parent_id, node_id)
-                edges_set.add((parent_id, node_id))
+        error = None
+        try:
+            _walk_recursive(_visit_node(*child_args, traversal), traversal)
+        except BaseException as e:
+            error = e
 
-        for children in A.iter_child_nodes(node):
-            if children not in node.body and children != node.returns:
-                child_id = f"{prefix}|{id(children)}"
-                children.current_node_id = child_id
-                add_nodes_edges(children, node, edges_set, loop_stack, prefix,
-                                 current_graph, unfold_times, None, end_function_list, 
-                                 potential_module_map)
-    
-        prev_child = None
-        next_child = upper_connect_node
-        
-        for index, child in enumerate(node.body):
-            child_id = f"{prefix}|{id(child)}"
-            child.current_node_id = child_id
-            if  index == (len(node.body) - 1):
-                next_child = upper_connect_node
-                if upper_connect_node is not None and not isinstance(child, (A.FunctionDef, A.ClassDef, A.If, A.For, A.While, A.Try, A.With, A.Match)):
-                    upper_connect_node_id = upper_connect_node.current_node_id if hasattr(upper_connect_node, 'current_node_id') else str(id(upper_connect_node))
-                    edge_label = "Next_Step"
-                    if  (child_id, upper_connect_node_id) not in edges_set:
-                        dot.edge(child_id, upper_connect_node_id, label = edge_label)
-                        edges_set.add((child_id, upper_connect_node_id))
-                    
-            else:
-                next_child = node.body[index + 1]
-                next_child_id = f"{prefix}|{id(next_child)}"
-                next_child.current_node_id = next_child_id
-            if isinstance(child, (A.FunctionDef, A.ClassDef, A.If, A.For, A.While, A.Try, A.With, A.Match)):
-                with current_graph.subgraph(name=f"cluster_{child_id}") as c:
-                    c.attr(style='solid', penwidth='2', color='lightgreen')              
-                    if prev_child is None:
-                        prev_child = child
-                        if (node_id, child_id) not in edges_set:
-                            dot.edge(node_id, child_id)
-                            edges_set.add((node_id, child_id))
-                            add_nodes_edges(child, node, edges_set, loop_stack, 
-                                            prefix, c, unfold_times, next_child,
-                                            end_function_list, potential_module_map)
-                    else:
-                        add_nodes_edges(child, prev_child, edges_set, loop_stack, 
-                                        prefix, c, unfold_times, next_child,
-                                        end_function_list, potential_module_map)
-                        prev_child = child
-            else:
-                if prev_child is None:
-                    prev_child = child
-                    if (node_id, child_id) not in edges_set:
-                        dot.edge(node_id, child_id)
-                        edges_set.add((node_id, child_id))
-                        add_nodes_edges(child, node, edges_set, loop_stack, 
-                                        prefix, current_graph, unfold_times, next_child,
-                                        end_function_list, potential_module_map)
-                else:
-                    add_nodes_edges(child, prev_child, edges_set, loop_stack, 
-                                    prefix, current_graph, unfold_times, next_child,
-                                    end_function_list, potential_module_map)
-                    prev_child = child
-        child_iter_needs = False
-        
-    if isinstance(node, A.arguments):
-        has_arg = False
-        for child in A.iter_child_nodes(node):
-            for field, value in A.iter_fields(child):
-                if field == "arg":
-                    label += f"\n{field}: {value!r}"
-                    has_arg = True
-        if not has_arg:
+
+def _walk_iterative(visit, traversal):
+    stack = [visit]
+    error = None
+    while stack:
+        try:
+            child_args = stack[-1].throw(error) if error is not None else next(stack[-1])
+        except StopIteration:
+            # 处理器捕获了子节点的异常后正常结束, 异常不再向上传递（与递归遍历一致）
+            stack.pop()
+            error = None
+            continue
+        except BaseException as e:
+            stack.pop()
+            if not stack:
+                raise
+            error = e
+            continue
+        error = None
+        stack.append(_visit_node(*child_args, traversal))
+
+
+def _visit_node(node, parent, edges_set, loop_stack, prefix,
+                current_graph, unfold_times, upper_connect_node,
+                end_function_list, potential_module_map, traversal):
+    """
+    处理单个节点的生成器: 需要处理的子节点以 add_nodes_edges 的参数元组 yield 出来,
+    由 _walk_recursive 或 _walk_iterative（显式栈）负责驱动
+    """
+    current_graph.attr(rankdir='TB', rank="same")
+    traversal.node_count += 1
+    node_id = traversal.node_ids.get(prefix, node)
+    v = NodeVisit(node_id, node.__class__.__name__, parent, edges_set, loop_stack, prefix,
+                  current_graph, unfold_times, upper_connect_node,
+                  end_function_list, potential_module_map, traversal)
+    node_type = type(node)
+    handler = _node_dispatch[node_type] if node_type in _node_dispatch else \
+        _resolve_handler(_node_handlers, _node_dispatch, node_type)
+    if handler is not None:
+        result = handler(node, v)
+        if isinstance(result, types.GeneratorType):
+            result = yield from result
+        if result is STOP:
             return
+    label = v.label
+
+    # 添加字段信息（排除 ctx 和空值）, 只添加非AST字段
+    node_type = type(node)
+    fields = _label_fields[node_type] if node_type in _label_fields else _fields_of(node_type)
+    for field in fields:
+        value = getattr(node, field, None)
+        if value is None or isinstance(value, A.AST):
+            continue
+        if isinstance(value, list) and (not value or _is_ast_list(value)):
+            continue
+        label += f"\n{field}: {repr(value)}"
+
+    #if not isinstance(node, A.Name):
+    if v.node_attrs:
+        current_graph.node(node_id, label, **v.node_attrs)
+    else:
         current_graph.node(node_id, label)
-        if parent is not None:
-            parent_id = parent.current_node_id if hasattr(parent, 'current_node_id') else str(id(parent))
+
+    if upper_connect_node is not None:
+        if isinstance(node, (A.Expr, A.Assign, A.Return)):
+            upper_connect_node_id = v.id_of(upper_connect_node)
+            if (node_id, upper_connect_node_id) not in edges_set:
+                edge_label = "Next_Step"
+                traversal.builder.graph.edge(node_id, upper_connect_node_id, label = edge_label)
+                edges_set.add((node_id, upper_connect_node_id))
+    # 连接父节点
+    if parent is not None:
+        if not isinstance(parent, _BLOCK_TYPES):
+            parent_id = v.id_of(parent)
             if (parent_id, node_id) not in edges_set:
                 current_graph.edge(parent_id, node_id)
                 edges_set.add((parent_id, node_id))
-        return
-        
-    if isinstance(node, A.With):
-        label = "With Statement"
-        # 创建 With 语句的子图
-        with current_graph.subgraph(name=f"cluster_{node_id}_with") as c:
-            c.attr(style='solid', penwidth='2', color='purple', label='With Block')
-            prev_child = None
-            # 处理 with 语句中的 items
-            for item in node.items:
-                item_id = f"{prefix}|{id(item)}"
-                item_label = f"WithItem: {get_label(item.context_expr)}"
-                if item.optional_vars:
-                    item_label += f" as {get_label(item.optional_vars)}"
-                c.node(item_id, item_label)
-                if prev_child is None:
-                    prev_child = item
-                    if (node_id, item_id) not in edges_set:
-                        c.edge(node_id, item_id, label="WithItem")
-                        edges_set.add((node_id, item_id))
-                else:
-                    prev_child_id = prev_child.current_node_id if hasattr(prev_child, 'current_node_id') else str(id(prev_child))
-                    if (prev_child_id, item_id) not in edges_set:
-                        c.edge(prev_child_id, item_id, label="Next_Item")
-                        edges_set.add((prev_child_id, item_id))
-            prev_child = None
-            # 处理 with 语句的 body
-            for index, child in enumerate(node.body):
-                child_id = f"{prefix}|{id(child)}"
-                child.current_node_id = child_id
-                
-                # 判断是否是最后一个子节点，是否需要连接 upper_connect_node
-                if index == len(node.body) - 1:
-                    next_child = upper_connect_node
-                    if upper_connect_node is not None and not isinstance(child, (A.FunctionDef, A.ClassDef, A.If, A.For, A.While, A.Try, A.With, A.Match)):
-                        upper_id = upper_connect_node.current_node_id if hasattr(upper_connect_node, 'current_node_id') else str(id(upper_connect_node))
-                        if (child_id, upper_id) not in edges_set:
-                            dot.edge(child_id, upper_id, label="Next_Step")
-                            edges_set.add((child_id, upper_id))
-                else:
-                    next_child = node.body[index + 1]
-                    next_child_id = f"{prefix}|{id(next_child)}"
-                    next_child.current_node_id = next_child_id
-
-                if isinstance(child, (A.FunctionDef, A.ClassDef, A.If, A.For, A.While, A.Try, A.With, A.Match)):
-                    with c.subgraph(name=f"cluster_{child_id}") as sc:
-                        sc.attr(style='solid', penwidth='2', color='lightcyan')  # 区分子图样式
-                        
-                        if prev_child is None:
-                            prev_child = child
-                            if (node_id, child_id) not in edges_set:
-                                dot.edge(node_id, child_id)
-                                edges_set.add((node_id, child_id))
-                            add_nodes_edges(child, node, edges_set, loop_stack, 
-                                            prefix, sc, unfold_times, next_child,
-                                            end_function_list, potential_module_map)
-                        else:
-                            add_nodes_edges(child, prev_child, edges_set, loop_stack,
-                                            prefix, sc, unfold_times, next_child,
-                                            end_function_list, potential_module_map)
-                            prev_child = child
-                else:
-                    if prev_child is None:
-                        prev_child = child
-                        if (node_id, child_id) not in edges_set:
-                            dot.edge(node_id, child_id)
-                            edges_set.add((node_id, child_id))
-                        add_nodes_edges(child, node, edges_set, loop_stack,
-                                        prefix, c, unfold_times, next_child,
-                                        end_function_list, potential_module_map)
-                    else:
-                        add_nodes_edges(child, prev_child, edges_set, loop_stack,
-                                        prefix, c, unfold_times, next_child,
-                                        end_function_list, potential_module_map)
-                        prev_child = child
-        child_iter_needs = False
-        
-    if isinstance(node, A.If):
-        condition = get_label(node.test)  
-        label += f"\nCondition: {condition}"
-        node.test.current_node_id = f"{prefix}|{id(node.test)}"
-        for child in A.iter_child_nodes(node.test):
-            if not isinstance(child, A.Name):
-                add_nodes_edges(node.test, node, edges_set, loop_stack, 
-                                prefix, current_graph, unfold_times, None, 
-                                end_function_list, potential_module_map)
-                if (node.test.current_node_id, node_id) not in edges_set:
-                    current_graph.edge(node_id, node.test.current_node_id, label="Condition")
-                    edges_set.add((node_id, node.test.current_node_id))
-                    break
-        with current_graph.subgraph(name=f"cluster_{node_id}_true") as c:
-            c.attr(style='solid', penwidth='2', color='darkgreen', label='True Branch')
-            prev_child = None
-            for index, child in enumerate(node.body):
-                child_id = f"{prefix}|{id(child)}"
-                child.current_node_id = child_id
-                
-                if index == len(node.body) - 1:
-                    next_child = upper_connect_node
-                    if upper_connect_node is not None and not isinstance(child, (A.FunctionDef, A.ClassDef, A.If, A.For, A.While, A.Try, A.With, A.Match)):
-                        upper_id = upper_connect_node.current_node_id if hasattr(upper_connect_node, 'current_node_id') else str(id(upper_connect_node))
-                        edge_label = "Next_Step"
-                        if (child_id, upper_id) not in edges_set:
-                            dot.edge(child_id, upper_id, label=edge_label)
-                            edges_set.add((child_id, upper_id))
-                else:
-                    next_child = node.body[index + 1]
-                    next_child_id = f"{prefix}|{id(next_child)}"
-                    next_child.current_node_id = next_child_id
-                
-                if isinstance(child, (A.FunctionDef, A.ClassDef, A.If, A.For, A.While, A.Try, A.With, A.Match)):
-                    with c.subgraph(name=f"cluster_{child_id}") as sc:
-                        sc.attr(style='solid', penwidth='2', color='lightblue', label="")  # 区分子图样式
-                        if prev_child is None:
-                            prev_child = child
-                            if (node_id, child_id) not in edges_set:
-                                dot.edge(node_id, child_id, label="True")
-                                edges_set.add((node_id, child_id))
-                            add_nodes_edges(child, node, edges_set, loop_stack,
-                                            prefix, sc, unfold_times, next_child,
-                                            end_function_list, potential_module_map)
-                        else:
-                            add_nodes_edges(child, prev_child, edges_set, loop_stack,
-                                            prefix, sc, unfold_times, next_child,
-                                            end_function_list, potential_module_map)
-                            prev_child = child
-                else:
-                    if prev_child is None:
-                        prev_child = child
-                        if (node_id, child_id) not in edges_set:
-                            dot.edge(node_id, child_id, label="True")
-                            edges_set.add((node_id, child_id))
-                        add_nodes_edges(child, node, edges_set, loop_stack,
-                                        prefix, c, unfold_times, next_child,
-                                        end_function_list, potential_module_map)
-                    else:
-                        add_nodes_edges(child, prev_child, edges_set, loop_stack,
-                                        prefix, c, unfold_times, next_child,
-                                        end_function_list, potential_module_map)
-                        prev_child = child
-
-        # False 分支处理类似 True 分支，仅 label 改为 "False"
-        with current_graph.subgraph(name=f"cluster_{node_id}_false") as c:
-            c.attr(style='solid', penwidth='2', color='coral', label='False Branch')
-            prev_child = None
-            for index, child in enumerate(node.orelse):
-                child_id = f"{prefix}|{id(child)}"
-                child.current_node_id = child_id
-                
-                if index == len(node.orelse) - 1:
-                    next_child = upper_connect_node
-                    if upper_connect_node is not None and not isinstance(child, (A.FunctionDef, A.ClassDef, A.If, A.For, A.While, A.Try, A.With, A.Match)):
-                        upper_id = upper_connect_node.current_node_id if hasattr(upper_connect_node, 'current_node_id') else str(id(upper_connect_node))
-                        edge_label = "Next_Step"
-                        if (child_id, upper_id) not in edges_set:
-                            dot.edge(child_id, upper_id, label=edge_label)
-                            edges_set.add((child_id, upper_id))
-                else:
-                    next_child = node.orelse[index + 1]
-                    next_child_id = f"{prefix}|{id(next_child)}"
-                    next_child.current_node_id = next_child_id
-                
-                if isinstance(child, (A.FunctionDef, A.ClassDef, A.If, A.For, A.While, A.Try, A.With, A.Match)):
-                    with c.subgraph(name=f"cluster_{child_id}") as sc:
-                        sc.attr(style='solid', penwidth='2', color='lightpink', label="")
-                        if prev_child is None:
-                            prev_child = child
-                            if (node_id, child_id) not in edges_set:
-                                current_graph.edge(node_id, child_id, label="False")
-                                edges_set.add((node_id, child_id))
-                            add_nodes_edges(child, node, edges_set, loop_stack,
-                                            prefix, sc, unfold_times, next_child,
-                                            end_function_list, potential_module_map)
-                        else:
-                            add_nodes_edges(child, prev_child, edges_set, loop_stack,
-                                            prefix, sc, unfold_times, next_child,
-                                            end_function_list, potential_module_map)
-                            prev_child = child
-                else:
-                    if prev_child is None:
-                        prev_child = child
-                        if (node_id, child_id) not in edges_set:
-                            current_graph.edge(node_id, child_id, label="False")
-                            edges_set.add((node_id, child_id))
-                        add_nodes_edges(child, node, edges_set, loop_stack,
-                                        prefix, c, unfold_times, next_child,
-                                        end_function_list, potential_module_map)
-                    else:
-                        add_nodes_edges(child, prev_child, edges_set, loop_stack,
-                                        prefix, c, unfold_times, next_child,
-                                        end_function_list, potential_module_map)
-                        prev_child = child
-        child_iter_needs = False
-        
-                
-
-    if isinstance(node, A.Assign):
-        label += '\n' + get_label(node, potential_module_map)
+    
+    # 递归处理子节点
+    if v.child_iter_needs:
         for child in A.iter_child_nodes(node):
-            if isinstance(child, A.Call):
-                add_nodes_edges(child, node, edges_set, loop_stack,
-                                prefix, current_graph, unfold_times, None,
-                                end_function_list, potential_module_map)
-            if isinstance(child, A.Compare):
-                add_nodes_edges(child, node, edges_set, loop_stack,
-                                prefix, current_graph, unfold_times, None,
-                                end_function_list, potential_module_map)
-        child_iter_needs = False
-
-    if isinstance(node, A.Call):
-        if unfold_times:
-            unfold_times -= 1
-            func = get_label(node.func)
+            # 跳过 Load 等无用节点
+            if child.__class__.__name__ in ["Load", "Store", "Del"]:
+                continue
             
-            if isinstance(node.func, A.Name):
-                #受限于水平暂不支持展开通过from import 直接引入的函数
-                func_name = node.func.id
-                full_path = get_attribute_fullpath(node.func, potential_module_map).split(".")
-                #print(full_path)
-                label += "\n" + get_label(node, potential_module_map)
-                if func_name not in end_function_list:
-                    func_def_tree = get_module_func_ast_by_name("__main__", func_name)
-                    if func_def_tree:
-                        func_def_node = next(A.iter_child_nodes(func_def_tree))
-                        # 传递prefix为当前节点ID，确保子节点唯一
-                        add_nodes_edges(func_def_node, node, edges_set, loop_stack,
-                                        node_id, current_graph, unfold_times, None, 
-                                        end_function_list, potential_module_map)
-            elif isinstance(node.func, A.Attribute):
-                func_name = node.func.attr
-                full_path = get_attribute_fullpath(node.func, potential_module_map).split(".")
-                label += "\n" + get_label(node, potential_module_map)
-                if func_name not in end_function_list:
-                    if len(full_path) == 3 and full_path[0] != "self":
-                        func_def_tree = get_module_class_func_ast_by_name(full_path[0], full_path[1], func_name)
-                        try: 
-                            mod = importlib.import_module(full_path[0])
-                            fuc_class = getattr(mod, full_path[1])
-                            class_stack.append(fuc_class)
-                            func_obj = getattr(fuc_class, func_name)
-                            if not callable(func_obj): 
-                                print(f"{func_name} is not a callable function")
-                            new_module_map = get_namespace(func_obj)
-                            if func_def_tree:
-                                func_def_node = next(A.iter_child_nodes(func_def_tree))
-                                # 传递prefix为当前节点ID，确保子节点唯一
-                                add_nodes_edges(func_def_node, node, edges_set, loop_stack,
-                                                node_id, current_graph, unfold_times, None, 
-                                                end_function_list, new_module_map)
-                            class_stack.pop()
-                        except:
-                            print(f"Module {full_path[0]} not found")
-                        
-                    elif len(full_path) == 2 and full_path[0] != "self":
-                        new_module_map = potential_module_map
-                        mod = None
-                        func_def_tree = None
-                        for mod_name in potential_module_map:
-                            try:
-                                mod = importlib.import_module(mod_name)
-                            except:
-                                continue
-                            if hasattr(mod, func_name):
-                                func_def_tree = get_module_func_ast_by_name(full_path[0], func_name)
-                                func_obj = getattr(mod, func_name)
+            edge_label = None
+            if hasattr(node, "test"):
+                if child == node.test:
+                    edge_label = "Condition"
+            if isinstance(node, A.Expr):
+                edge_label = "Expression_Is"
+                
+            # 优先处理带标签的边
+            
+            child_id = v.id_of(child)
+            if (node_id, child_id) not in edges_set:
+                current_graph.edge(node_id, child_id, label=edge_label)
+                edges_set.add((node_id, child_id))
+                yield (child, node, edges_set, loop_stack,
+                       prefix, current_graph, unfold_times, upper_connect_node,
+                       end_function_list, potential_module_map)
+
+
+def _add_body(body, owner, owner_id, v, graph, cluster_color, cluster_label=None,
+              edge_graph=None, edge_label=None, link_last=True, nested=False):
+    """
+    依次处理语句块 body: 第一条语句连到 owner, 之后每条语句以前一条为父节点,
+    最后一条连到 upper_connect_node; 复合语句各自放进子图
+    edge_graph: owner 到第一条语句的边画在哪个图上（默认 builder 的顶层图）
+    link_last: 是否为最后一条语句画 Next_Step 边
+    nested: 仅当 owner 到第一条语句的边是新边时才处理第一条语句
+    """
+    graph_root = v.traversal.builder.graph
+    if edge_graph is None:
+        edge_graph = graph_root
+    edges_set = v.edges_set
+    upper_connect_node = v.upper_connect_node
+    prev_child = None
+    for index, child in enumerate(body):
+        child_id = v.id_of(child)
+
+        # 判断是否是最后一个子节点，是否需要连接 upper_connect_node
+        if index == len(body) - 1:
+            next_child = upper_connect_node
+            if link_last and upper_connect_node is not None and not isinstance(child, _BLOCK_TYPES):
+                upper_id = v.id_of(upper_connect_node)
+                if (child_id, upper_id) not in edges_set:
+                    graph_root.edge(child_id, upper_id, label="Next_Step")
+                    edges_set.add((child_id, upper_id))
+        else:
+            next_child = body[index + 1]
+
+        if isinstance(child, _BLOCK_TYPES):
+            with graph.subgraph(name=f"cluster_{child_id}") as sc:
+                sc.attr(style='solid', penwidth='2', color=cluster_color, label=cluster_label)
+                prev_child = yield from _add_body_child(child, child_id, prev_child, owner, owner_id, v, sc,
+                                                        next_child, edge_graph, edge_label, nested)
+        else:
+            prev_child = yield from _add_body_child(child, child_id, prev_child, owner, owner_id, v, graph,
+                                                    next_child, edge_graph, edge_label, nested)
+
+
+def _add_body_child(child, child_id, prev_child, owner, owner_id, v, graph,
+                    next_child, edge_graph, edge_label, nested):
+    edges_set = v.edges_set
+    if prev_child is None:
+        if (owner_id, child_id) not in edges_set:
+            edge_graph.edge(owner_id, child_id, label=edge_label)
+            edges_set.add((owner_id, child_id))
+            if nested:
+                yield (child, owner, edges_set, v.loop_stack,
+                       v.prefix, graph, v.unfold_times, next_child,
+                       v.end_function_list, v.potential_module_map)
+        if not nested:
+            yield (child, owner, edges_set, v.loop_stack,
+                   v.prefix, graph, v.unfold_times, next_child,
+                   v.end_function_list, v.potential_module_map)
+    else:
+        yield (child, prev_child, edges_set, v.loop_stack,
+               v.prefix, graph, v.unfold_times, next_child,
+               v.end_function_list, v.potential_module_map)
+    return child
+
+
+@register_node_handler(A.Module)
+def _visit_module(node, v):
+    unfold_stack = v.traversal.unfold_stack
+    func_key = getattr(node, 'cache_key', None)
+    for child in A.iter_child_nodes(node):
+        # 入口函数本身也算作正在展开，递归调用入口函数时直接连回来
+        if unfold_stack is not None and func_key is not None:
+            unfold_stack.append((func_key, v.id_of(child), func_key[3]))
+        try:
+            yield (child, v.parent, v.edges_set, v.loop_stack, v.prefix, 
+                   v.current_graph, v.unfold_times, v.upper_connect_node,
+                   v.end_function_list, v.potential_module_map)
+        finally:
+            if unfold_stack is not None and func_key is not None:
+                unfold_stack.pop()
+        return STOP
+
+
+@register_node_handler(A.FunctionDef)
+def _visit_function_def(node, v):
+    node_id = v.node_id
+    edges_set = v.edges_set
+    if v.parent is not None:
+        parent_id = v.id_of(v.parent)
+        if (parent_id, node_id) not in edges_set:
+            v.current_graph.edge(parent_id, node_id)
+            edges_set.add((parent_id, node_id))
+
+    for children in A.iter_child_nodes(node):
+        if children not in node.body and children != node.returns:
+            yield (children, node, edges_set, v.loop_stack, v.prefix,
+                   v.current_graph, v.unfold_times, None, v.end_function_list, 
+                   v.potential_module_map)
+
+    yield from _add_body(node.body, node, node_id, v, v.current_graph, 'lightgreen', nested=True)
+    v.child_iter_needs = False
+
+
+@register_node_handler(A.arguments)
+def _visit_arguments(node, v):
+    label = v.label
+    has_arg = False
+    for child in A.iter_child_nodes(node):
+        for field, value in A.iter_fields(child):
+            if field == "arg":
+                label += f"\n{field}: {value!r}"
+                has_arg = True
+    if not has_arg:
+        return STOP
+    v.current_graph.node(v.node_id, label)
+    if v.parent is not None:
+        parent_id = v.id_of(v.parent)
+        if (parent_id, v.node_id) not in v.edges_set:
+            v.current_graph.edge(parent_id, v.node_id)
+            v.edges_set.add((parent_id, v.node_id))
+    return STOP
+
+
+@register_node_handler(A.With)
+def _visit_with(node, v):
+    node_id = v.node_id
+    edges_set = v.edges_set
+    v.label = "With Statement"
+    # 创建 With 语句的子图
+    with v.current_graph.subgraph(name=f"cluster_{node_id}_with") as c:
+        c.attr(style='solid', penwidth='2', color='purple', label='With Block')
+        prev_child = None
+        # 处理 with 语句中的 items
+        for item in node.items:
+            item_id = v.id_of(item)
+            item_label = f"WithItem: {get_label(item.context_expr)}"
+            if item.optional_vars:
+                item_label += f" as {get_label(item.optional_vars)}"
+            c.node(item_id, item_label)
+            if prev_child is None:
+                prev_child = item
+                if (node_id, item_id) not in edges_set:
+                    c.edge(node_id, item_id, label="WithItem")
+                    edges_set.add((node_id, item_id))
+            else:
+                prev_child_id = v.id_of(prev_child)
+                if (prev_child_id, item_id) not in edges_set:
+                    c.edge(prev_child_id, item_id, label="Next_Item")
+                    edges_set.add((prev_child_id, item_id))
+        # 处理 with 语句的 body
+        yield from _add_body(node.body, node, node_id, v, c, 'lightcyan')
+    v.child_iter_needs = False
+
+
+@register_node_handler(A.If)
+def _visit_if(node, v):
+    node_id = v.node_id
+    edges_set = v.edges_set
+    condition = get_label(node.test)  
+    v.label += f"\nCondition: {condition}"
+    test_id = v.id_of(node.test)
+    for child in A.iter_child_nodes(node.test):
+        if not isinstance(child, A.Name):
+            yield (node.test, node, edges_set, v.loop_stack, 
+                   v.prefix, v.current_graph, v.unfold_times, None, 
+                   v.end_function_list, v.potential_module_map)
+            if (test_id, node_id) not in edges_set:
+                v.current_graph.edge(node_id, test_id, label="Condition")
+                edges_set.add((node_id, test_id))
+                break
+    with v.current_graph.subgraph(name=f"cluster_{node_id}_true") as c:
+        c.attr(style='solid', penwidth='2', color='darkgreen', label='True Branch')
+        yield from _add_body(node.body, node, node_id, v, c, 'lightblue', "", edge_label="True")
+
+    # False 分支处理类似 True 分支，仅 label 改为 "False"
+    with v.current_graph.subgraph(name=f"cluster_{node_id}_false") as c:
+        c.attr(style='solid', penwidth='2', color='coral', label='False Branch')
+        yield from _add_body(node.orelse, node, node_id, v, c, 'lightpink', "",
+                             edge_graph=v.current_graph, edge_label="False")
+    v.child_iter_needs = False
+
+
+@register_node_handler(A.Assign)
+def _visit_assign(node, v):
+    v.label += '\n' + get_label(node, v.potential_module_map)
+    for child in A.iter_child_nodes(node):
+        if isinstance(child, A.Call):
+            yield (child, node, v.edges_set, v.loop_stack,
+                   v.prefix, v.current_graph, v.unfold_times, None,
+                   v.end_function_list, v.potential_module_map)
+        if isinstance(child, A.Compare):
+            yield (child, node, v.edges_set, v.loop_stack,
+                   v.prefix, v.current_graph, v.unfold_times, None,
+                   v.end_function_list, v.potential_module_map)
+    v.child_iter_needs = False
+
+
+def _add_source(traversal, func_key):
+    # func_key 为 ASTCache / StaticModule 的 cache_key: (文件, (mtime, size), 模块, qualname, 行号)
+    if isinstance(func_key, tuple) and func_key[1] is not None:
+        traversal.sources.setdefault(func_key[0], func_key[1])
+
+
+def _unfold_callee(func_def_tree, call_node, v, unfold_times, module_map):
+    """展开调用处 call_node 调用的函数, func_def_tree 为函数源码解析得到的 A.Module"""
+    traversal = v.traversal
+    shared = traversal.shared_callees
+    unfold_stack = traversal.unfold_stack
+    func_key = getattr(func_def_tree, 'cache_key', None) or id(func_def_tree)
+    func_def_node = next(A.iter_child_nodes(func_def_tree))
+    func_name = func_key[3] if isinstance(func_key, tuple) else getattr(func_def_node, 'name', '')
+    _add_source(traversal, func_key)
+    if traversal.lazy is not None:
+        # 按需展开: 调用节点链接到被调用函数的片段
+        fragment_id = traversal.lazy.register(func_def_tree, module_map, traversal.builder.class_stack, func_name)
+        if fragment_id not in traversal.lazy_links:
+            traversal.lazy_links.append(fragment_id)
+        v.node_attrs = dict(v.node_attrs or {}, URL=f"#{fragment_id}", tooltip=f"load {func_name}",
+                            color="blue", fontcolor="blue")
+        return
+    if unfold_stack is not None:
+        for index, (active_key, active_id, _) in enumerate(unfold_stack):
+            if active_key == func_key:
+                # 递归调用：连回正在展开的函数，不再重复展开
+                if (v.node_id, active_id) not in v.edges_set:
+                    v.current_graph.edge(v.node_id, active_id, label="Recursion",
+                                         style="dashed", constraint="False")
+                    v.edges_set.add((v.node_id, active_id))
+                cycle = tuple(name for _, _, name in unfold_stack[index:]) + (func_name,)
+                if cycle not in traversal.cycles:
+                    traversal.cycles.append(cycle)
+                return
+
+    reason = traversal.over_budget()
+    if reason is not None:
+        # 超出预算，调用处标红，不再展开
+        traversal.truncated_calls += 1
+        v.label += f"\n(truncated: {reason})"
+        v.node_attrs = {"color": "red", "fontcolor": "red"}
+        return
+
+    if shared is None:
+        # 传递prefix为当前节点ID，确保子节点唯一
+        prefix = v.node_id
+        graph = contextlib.nullcontext(v.current_graph)
+    else:
+        key = (func_key, unfold_times)
+        func_id = shared.get(key)
+        if func_id is not None:
+            # 已经展开过，只连一条边到共享的函数子图
+            if (v.node_id, func_id) not in v.edges_set:
+                v.current_graph.edge(v.node_id, func_id)
+                v.edges_set.add((v.node_id, func_id))
+            return
+        # 前缀只与函数和剩余展开次数有关，与调用处无关
+        prefix = f"callee|{len(shared)}"
+        shared[key] = traversal.node_ids.get(prefix, func_def_node)
+        graph = traversal.root_graph.subgraph(name=f"cluster_{prefix}")
+    with graph as c:
+        if shared is not None:
+            c.attr(style='dashed', color='grey', label=getattr(func_def_node, 'name', ''))
+        yield from _expand_callee(func_def_tree, module_map, CallSite(call_node, v.node_id), v.edges_set,
+                                  v.loop_stack, prefix, c, unfold_times, v.end_function_list, traversal)
+
+
+def _expand_callee(func_def_tree, module_map, call_site, edges_set, loop_stack, prefix, graph,
+                   unfold_times, end_function_list, traversal):
+    # 在 graph 中以 prefix 为上下文展开函数体; GraphWatcher 也从这里在原处重新展开一个函数
+    func_key = getattr(func_def_tree, 'cache_key', None) or id(func_def_tree)
+    func_def_node = next(A.iter_child_nodes(func_def_tree))
+    func_name = func_key[3] if isinstance(func_key, tuple) else getattr(func_def_node, 'name', '')
+    unfold_stack = traversal.unfold_stack
+    traversal.unfolded += 1
+    span = None
+    if traversal.spans is not None and traversal.shared_callees is None \
+            and isinstance(graph, (GraphIR, _GraphIRView)):
+        ir = graph.ir if isinstance(graph, _GraphIRView) else graph
+        span = UnfoldSpan(func_def_tree, module_map, call_site, list(loop_stack), prefix,
+                          graph.name if graph is not ir else None, unfold_times,
+                          end_function_list, list(traversal.builder.class_stack),
+                          list(unfold_stack) if unfold_stack is not None else None, ir._position())
+        traversal.spans.append(span)
+    if unfold_stack is not None:
+        unfold_stack.append((func_key, traversal.node_ids.get(prefix, func_def_node), func_name))
+    try:
+        yield (func_def_node, call_site, edges_set, loop_stack,
+               prefix, graph, unfold_times, None,
+               end_function_list, module_map)
+    finally:
+        if unfold_stack is not None:
+            unfold_stack.pop()
+    if span is not None:
+        span.end = ir._position()
+
+
+@register_node_handler(A.Call)
+def _visit_call(node, v):
+    node_id = v.node_id
+    edges_set = v.edges_set
+    loop_stack = v.loop_stack
+    current_graph = v.current_graph
+    unfold_times = v.unfold_times
+    end_function_list = v.end_function_list
+    potential_module_map = v.potential_module_map
+    class_stack = v.traversal.builder.class_stack
+    if v.traversal.static is not None:
+        return (yield from _visit_call_static(node, v))
+    if unfold_times:
+        unfold_times -= 1
+        func = get_label(node.func)
+        
+        if isinstance(node.func, A.Name):
+            #受限于水平暂不支持展开通过from import 直接引入的函数
+            func_name = node.func.id
+            full_path = get_attribute_fullpath(node.func, potential_module_map).split(".")
+            #print(full_path)
+            v.label += "\n" + get_label(node, potential_module_map)
+            if func_name not in end_function_list and not (yield from _unfold_symbol(node, v, unfold_times, full_path)):
+                func_def_tree = get_module_func_ast_by_name("__main__", func_name)
+                if func_def_tree:
+                    yield from _unfold_callee(func_def_tree, node, v, unfold_times, potential_module_map)
+        elif isinstance(node.func, A.Attribute):
+            func_name = node.func.attr
+            full_path = get_attribute_fullpath(node.func, potential_module_map).split(".")
+            v.label += "\n" + get_label(node, potential_module_map)
+            if func_name not in end_function_list and not (yield from _unfold_symbol(node, v, unfold_times, full_path)):
+                if len(full_path) == 3 and full_path[0] != "self":
+                    func_def_tree = get_module_class_func_ast_by_name(full_path[0], full_path[1], func_name)
+                    try: 
+                        mod = importlib.import_module(full_path[0])
+                        fuc_class = getattr(mod, full_path[1])
+                        class_stack.append(fuc_class)
+                        try:
+                            func_obj = getattr(fuc_class, func_name)
+                            if not callable(func_obj): 
+                                print(f"{func_name} is not a callable function")
+                            new_module_map = get_namespace(func_obj)
+                            if func_def_tree:
+                                yield from _unfold_callee(func_def_tree, node, v, unfold_times, new_module_map)
+                        finally:
+                            class_stack.pop()
+                    except Exception:
+                        print(f"Module {full_path[0]} not found")
+                    
+                elif len(full_path) == 2 and full_path[0] != "self":
+                    new_module_map = potential_module_map
+                    mod = None
+                    func_def_tree = None
+                    for mod_name in potential_module_map:
+                        try:
+                            mod = importlib.import_module(mod_name)
+                        except Exception:
+                            continue
+                        if hasattr(mod, func_name):
+                            func_def_tree = get_module_func_ast_by_name(full_path[0], func_name)
+                            func_obj = getattr(mod, func_name)
+                            if callable(func_obj):
+                                new_module_map = get_namespace(func_obj)
+                                break
+                            else:
+                                print("{} is not callable".format(func_name))
+                            
+
+                        if hasattr(mod, full_path[0]):
+                            func_class = getattr(mod, full_path[0])
+                            if hasattr(func_class, func_name):
+                                func_def_tree = get_module_class_func_ast_by_name(full_path[0], full_path[1], func_name)
+                                func_obj = getattr(func_class, func_name)
                                 if callable(func_obj):
                                     new_module_map = get_namespace(func_obj)
                                     break
                                 else:
                                     print("{} is not callable".format(func_name))
-                                
-
-                            if hasattr(mod, full_path[0]):
-                                func_class = getattr(mod, full_path[0])
-                                if hasattr(func_class, func_name):
-                                    func_def_tree = get_module_class_func_ast_by_name(full_path[0], full_path[1], func_name)
-                                    func_obj = getattr(func_class, func_name)
-                                    if callable(func_obj):
-                                        new_module_map = get_namespace(func_obj)
-                                        break
-                                    else:
-                                        print("{} is not callable".format(func_name))
-
-                        if func_def_tree:
-                            func_def_node = next(A.iter_child_nodes(func_def_tree))
-                            # 传递prefix为当前节点ID，确保子节点唯一
-                            add_nodes_edges(func_def_node, node, edges_set, loop_stack,
-                                            node_id, current_graph, unfold_times, None, 
-                                            end_function_list, new_module_map)
-                    elif len(full_path) == 2 and full_path[0] == "self":
-                        class_obj = class_stack[-1]
-                        func_obj = getattr(class_obj, func_name)
-                        if callable(func_obj):
-                            new_module_map = get_namespace(func_obj)
-                        else:
-                            print("{} is not callable".format(func_name)) 
-                        tree = dot_source_prepare(func_obj)
-                        if tree:
-                            func_def_node = next(A.iter_child_nodes(tree))
-                            # 传递prefix为当前节点ID，确保子节点唯一
-                            add_nodes_edges(func_def_node, node, edges_set, loop_stack,
-                                            node_id, current_graph, unfold_times, None, 
-                                            end_function_list, new_module_map)
 
-            else:
-                #理论上用不到这块
-                func_name = get_label(node.func) 
-                label += "\n" + get_label(node, potential_module_map)
-                if func_name not in end_function_list:
-                    func_def_tree = get_func_ast_by_name(func_name)
                     if func_def_tree:
-                        func_def_node = next(A.iter_child_nodes(func_def_tree))
-                        # 传递prefix为当前节点ID，确保子节点唯一
-                        add_nodes_edges(func_def_node, node, edges_set, loop_stack,
-                                        node_id, current_graph, unfold_times, None,
-                                        end_function_list, potential_module_map)
-            child_iter_needs = False
+                        yield from _unfold_callee(func_def_tree, node, v, unfold_times, new_module_map)
+                elif len(full_path) == 2 and full_path[0] == "self":
+                    class_obj = class_stack[-1]
+                    func_obj = getattr(class_obj, func_name)
+                    if callable(func_obj):
+                        new_module_map = get_namespace(func_obj)
+                    else:
+                        print("{} is not callable".format(func_name)) 
+                    tree = dot_source_prepare(func_obj)
+                    if tree:
+                        yield from _unfold_callee(tree, node, v, unfold_times, new_module_map)
+
         else:
-            label += "\n" + get_label(node,potential_module_map)
-            child_iter_needs = False
-        
+            #理论上用不到这块
+            func_name = get_label(node.func) 
+            v.label += "\n" + get_label(node, potential_module_map)
+            if func_name not in end_function_list:
+                func_def_tree = get_func_ast_by_name(func_name)
+                if func_def_tree:
+                    yield from _unfold_callee(func_def_tree, node, v, unfold_times, potential_module_map)
+        v.child_iter_needs = False
+    else:
+        v.label += "\n" + get_label(node,potential_module_map)
+        v.child_iter_needs = False
 
-    if isinstance(node, A.BinOp):
-        label = get_label(node, potential_module_map)
-        for child in A.iter_child_nodes(node):
-            if isinstance(child, A.Call):
-                add_nodes_edges(child, node, edges_set, loop_stack,
-                                prefix, current_graph, unfold_times, upper_connect_node,
-                                end_function_list, potential_module_map)
-        child_iter_needs = False
-        
-    if isinstance(node, A.UnaryOp):
-        label = get_label(node, potential_module_map)
-        for child in A.iter_child_nodes(node):
-            if isinstance(child, A.Call):
-                add_nodes_edges(child, node, edges_set, loop_stack,
-                                prefix, current_graph, unfold_times, upper_connect_node,
-                                end_function_list, potential_module_map)
-        child_iter_needs = False
-    
-    if isinstance(node, A.BoolOp):
-        label = get_label(node, potential_module_map)
-        for child in A.iter_child_nodes(node):
-            if isinstance(child, A.Compare):
-                add_nodes_edges(child, node, edges_set, loop_stack,
-                                prefix, current_graph, unfold_times, upper_connect_node,
-                                end_function_list, potential_module_map)
-            if isinstance(child, A.Call):
-                add_nodes_edges(child, node, edges_set, loop_stack,
-                                prefix, current_graph, unfold_times, upper_connect_node,
-                                end_function_list, potential_module_map)    
-        child_iter_needs = False
-
-    if isinstance(node, A.Compare):
-        label = get_label(node, potential_module_map)
-        for child in A.iter_child_nodes(node):
-            if isinstance(child, A.Call):
-                add_nodes_edges(child, node, edges_set, loop_stack,
-                                prefix, current_graph, unfold_times, upper_connect_node,
-                                end_function_list, potential_module_map)
-            if isinstance(child, A.Compare):
-                add_nodes_edges(child, node, edges_set, loop_stack,
-                                prefix, current_graph, unfold_times, upper_connect_node,
-                                end_function_list, potential_module_map)
-        child_iter_needs = False
-
-    # 处理 For 循环
-    if isinstance(node, A.For):
-        target = get_label(node.target)
-        iter_expr = get_label(node.iter)
-        label += f"\nFor: {target} in {iter_expr}"
-        node.upper_connect_node = upper_connect_node
-        loop_stack.append(node)
-        # 创建循环体子图
-        with current_graph.subgraph(name=f"cluster_{node_id}_body") as c:
-            c.attr(style='solid', penwidth='2', color='darkblue', label='Loop Body')
-            prev_child = None
-            for index, child in enumerate(node.body):
-                child_id = f"{prefix}|{id(child)}"
-                child.current_node_id = child_id
-
-                if index == len(node.body) - 1:
-                    next_child = upper_connect_node
-                    if upper_connect_node is not None and not isinstance(child, (A.FunctionDef, A.ClassDef, A.If, A.For, A.While, A.Try, A.With, A.Match)):
-                        upper_id = upper_connect_node.current_node_id if hasattr(upper_connect_node, 'current_node_id') else str(id(upper_connect_node))
-                        if (child_id, upper_id) not in edges_set:
-                            dot.edge(child_id, upper_id, label="Next_Step")
-                            edges_set.add((child_id, upper_id))
-                else:
-                    next_child = node.body[index + 1]
-                    next_child_id = f"{prefix}|{id(next_child)}"
-                    next_child.current_node_id = next_child_id
-
-                if isinstance(child, (A.FunctionDef, A.ClassDef, A.If, A.For, A.While, A.Try, A.With, A.Match)):
-                    with c.subgraph(name=f"cluster_{child_id}") as sc:
-                        sc.attr(style='solid', penwidth='2', color='lightblue', label="")
-                        if prev_child is None:
-                            prev_child = child
-                            if (node_id, child_id) not in edges_set:
-                                dot.edge(node_id, child_id)
-                                edges_set.add((node_id, child_id))
-                            add_nodes_edges(child, node, edges_set, loop_stack,
-                                            prefix, sc, unfold_times, next_child,
-                                            end_function_list, potential_module_map)
-                        else:
-                            add_nodes_edges(child, prev_child, edges_set, loop_stack,
-                                            prefix, sc, unfold_times, next_child,
-                                            end_function_list, potential_module_map)
-                            prev_child = child
-                else:
-                    if prev_child is None:
-                        prev_child = child
-                        if (node_id, child_id) not in edges_set:
-                            dot.edge(node_id, child_id)
-                            edges_set.add((node_id, child_id))
-                        add_nodes_edges(child, node, edges_set, loop_stack,
-                                        prefix, c, unfold_times, next_child,
-                                        end_function_list, potential_module_map)
-                    else:
-                        add_nodes_edges(child, prev_child, edges_set, loop_stack,
-                                        prefix, c, unfold_times, next_child,
-                                        end_function_list, potential_module_map)
-                        prev_child = child
-            # 处理 orelse（如果有）
-            if node.orelse:
-                with current_graph.subgraph(name=f"cluster_{node_id}_orelse") as c:
-                    c.attr(style='solid', penwidth='2', color='darkyellow', label='Else')
-                    prev_child = None
-                    for index, child in enumerate(node.orelse):
-                        child_id = f"{prefix}|{id(child)}"
-                        child.current_node_id = child_id
-
-                        if index == len(node.orelse) - 1:
-                            next_child = upper_connect_node
-                            if upper_connect_node is not None and not isinstance(child, (A.FunctionDef, A.ClassDef, A.If, A.For, A.While, A.Try, A.With, A.Match)):
-                                upper_id = upper_connect_node.current_node_id if hasattr(upper_connect_node, 'current_node_id') else str(id(upper_connect_node))
-                                if (child_id, upper_id) not in edges_set:
-                                    dot.edge(child_id, upper_id, label="Next_Step")
-                                    edges_set.add((child_id, upper_id))
-                        else:
-                            next_child = node.orelse[index + 1]
-                            next_child_id = f"{prefix}|{id(next_child)}"
-                            next_child.current_node_id = next_child_id
-                        if isinstance(child, (A.FunctionDef, A.ClassDef, A.If, A.For, A.While, A.Try, A.With, A.Match)):
-                            with c.subgraph(name=f"cluster_{child_id}") as sc:
-                                sc.attr(style='solid', penwidth='2', color='lightpink', label="")
-                                if prev_child is None:
-                                    prev_child = child
-                                    if (node_id, child_id) not in edges_set:
-                                        dot.edge(node_id, child_id)
-                                        edges_set.add((node_id, child_id))
-                                        add_nodes_edges(child, node, edges_set, loop_stack,
-                                                        prefix, sc, unfold_times, next_child,
-                                                        end_function_list, potential_module_map)
-                                else:
-                                    add_nodes_edges(child, prev_child, edges_set, loop_stack,
-                                                    prefix, sc, unfold_times, next_child,
-                                                    end_function_list, potential_module_map)
-                                    prev_child = child
-                        else:
-                            if prev_child is None:
-                                prev_child = child
-                                if (node_id, child_id) not in edges_set:
-                                    dot.edge(node_id, child_id)
-                                    edges_set.add((node_id, child_id))
-                                    add_nodes_edges(child, node, edges_set, loop_stack,
-                                                    prefix, c, unfold_times, next_child,
-                                                    end_function_list, potential_module_map)
-                            else:
-                                add_nodes_edges(child, prev_child, edges_set, loop_stack,
-                                                prefix, c, unfold_times, next_child,
-                                                end_function_list, potential_module_map)
-                                prev_child = child
-        loop_stack.pop()
-        child_iter_needs = False
-
-    # 处理 While 循环
-    if isinstance(node, A.While):
-        condition = get_label(node.test)
-        label += f"\nWhile: {condition}"
-        node.upper_connect_node = upper_connect_node
-        loop_stack.append(node)
-        with current_graph.subgraph(name=f"cluster_{node_id}_While_body") as c:
-            c.attr(style='solid', penwidth='2', color='pink', label='Loop Body')
-            prev_child = None
-
-            for index, child in enumerate(node.body):
-                child_id = f"{prefix}|{id(child)}"
-                child.current_node_id = child_id
-
-                if index == len(node.body) - 1:
-                    next_child = upper_connect_node
-                    if upper_connect_node is not None and not isinstance(child, (A.FunctionDef, A.ClassDef, A.If, A.For, A.While, A.Try, A.With, A.Match)):
-                        upper_id = upper_connect_node.current_node_id if hasattr(upper_connect_node, 'current_node_id') else str(id(upper_connect_node))
-                        if (child_id, upper_id) not in edges_set:
-                            dot.edge(child_id, upper_id, label="Next_Step")
-                            edges_set.add((child_id, upper_id))
-                else:
-                    next_child = node.body[index + 1]
-                    next_child_id = f"{prefix}|{id(next_child)}"
-                    next_child.current_node_id = next_child_id
-                if isinstance(child, (A.FunctionDef, A.ClassDef, A.If, A.For, A.While, A.Try, A.With, A.Match)):
-                    with c.subgraph(name=f"cluster_{child_id}") as sc:
-                        sc.attr(style='solid', penwidth='2', color='lightblue', label="")
-                        if prev_child is None:
-                            prev_child = child
-                            if (node_id, child_id) not in edges_set:
-                                dot.edge(node_id, child_id)
-                                edges_set.add((node_id, child_id))
-                            add_nodes_edges(child, node, edges_set, loop_stack,
-                                            prefix, sc, unfold_times, next_child,
-                                            end_function_list, potential_module_map)
-                        else:
-                            add_nodes_edges(child, prev_child, edges_set, loop_stack,
-                                            prefix, sc, unfold_times, next_child,
-                                            end_function_list, potential_module_map)
-                            prev_child = child
-                else:
-                    if prev_child is None:
-                        prev_child = child
-                        if (node_id, child_id) not in edges_set:
-                            dot.edge(node_id, child_id)
-                            edges_set.add((node_id, child_id))
-                        add_nodes_edges(child, node, edges_set, loop_stack,
-                                        prefix, c, unfold_times, next_child,
-                                        end_function_list, potential_module_map)
-                    else:
-                        add_nodes_edges(child, prev_child, edges_set, loop_stack,
-                                        prefix, c, unfold_times, next_child,
-                                        end_function_list, potential_module_map)
-                        prev_child = child
-
-            # 处理 orelse 分支
-            if node.orelse:
-                with current_graph.subgraph(name=f"cluster_{node_id}_orelse") as c:
-                    c.attr(style='solid', penwidth='2', color='darkgrey', label='Else')
-                    prev_orelse = None
-                    for index, child in enumerate(node.orelse):
-                        child_id = f"{prefix}|{id(child)}"
-                        child.current_node_id = child_id
-
-                        if index == len(node.orelse) - 1:
-                            next_child = upper_connect_node
-                            if upper_connect_node is not None and not isinstance(child, (A.FunctionDef, A.ClassDef, A.If, A.For, A.While, A.Try, A.With, A.Match)):
-                                upper_id = upper_connect_node.current_node_id if hasattr(upper_connect_node, 'current_node_id') else str(id(upper_connect_node))
-                                if (child_id, upper_id) not in edges_set:
-                                    dot.edge(child_id, upper_id, label="Next_Step")
-                                    edges_set.add((child_id, upper_id))
-
-                        else:
-                            next_child = node.orelse[index + 1]
-                            next_child_id = f"{prefix}|{id(next_child)}"
-                            next_child.current_node_id = next_child_id
-                        if isinstance(child, (A.FunctionDef, A.ClassDef, A.If, A.For, A.While, A.Try, A.With, A.Match)):
-                            with c.subgraph(name=f"cluster_{child_id}") as sc:
-                                sc.attr(style='solid', penwidth='2', color='lightpink', label="")
-                                if prev_orelse is None:
-                                    prev_orelse = child
-                                    if (node_id, child_id) not in edges_set:
-                                        dot.edge(node_id, child_id)
-                                        edges_set.add((node_id, child_id))
-                                    add_nodes_edges(child, node, edges_set, loop_stack,
-                                                    prefix, sc, unfold_times, next_child,
-                                                    end_function_list, potential_module_map)
-                                else:
-                                    add_nodes_edges(child, prev_orelse, edges_set, loop_stack,
-                                                     prefix, sc, unfold_times, next_child,
-                                                     end_function_list, potential_module_map)
-                                    prev_orelse = child
-                        else:
-                            if prev_orelse is None:
-                                prev_orelse = child
-                                if (node_id, child_id) not in edges_set:
-                                    dot.edge(node_id, child_id)
-                                    edges_set.add((node_id, child_id))
-                                add_nodes_edges(child, node, edges_set, loop_stack,
-                                                prefix, c, unfold_times, next_child,
-                                                end_function_list, potential_module_map)
-                            else:
-                                add_nodes_edges(child, prev_orelse, edges_set, loop_stack,
-                                                prefix, c, unfold_times, next_child,
-                                                end_function_list, potential_module_map)
-                                prev_orelse = child
-        loop_stack.pop()
-        child_iter_needs = False
-
-    #  处理 Match 匹配
-    if isinstance(node, A.Match):
-        label = f"Match: {get_label(node.subject)}"
-        for case in node.cases:
-            case_id = f"{prefix}|{id(case)}"
-            case_label = f"Case: {get_label(case.pattern)}"
-            if case.guard:
-                case_label += f" if {get_label(case.guard)}"
-            current_graph.node(case_id, case_label)
-            current_graph.edge(node_id, case_id)
-            edges_set.add((node_id, case_id))
-            case.current_node_id = case_id
-            prev_child = None
-            for index, child in enumerate(case.body):
-                child_id = f"{prefix}|{id(child)}"
-                child.current_node_id = child_id
-
-                if index == len(case.body) - 1:
-                    next_child = upper_connect_node
-                    if upper_connect_node is not None and not isinstance(child, (A.FunctionDef, A.ClassDef, A.If, A.For, A.While, A.Try, A.With, A.Match)):
-                        upper_id = upper_connect_node.current_node_id if hasattr(upper_connect_node, 'current_node_id') else str(id(upper_connect_node))
-                        if (child_id, upper_id) not in edges_set:
-                            dot.edge(child_id, upper_id, label="Next_Step")
-                            edges_set.add((child_id, upper_id))
 
-                else:
-                    next_child = case.body[index + 1]
-                    next_child_id = f"{prefix}|{id(next_child)}"
-                    next_child.current_node_id = next_child_id
-                if isinstance(child, (A.FunctionDef, A.ClassDef, A.If, A.For, A.While, A.Try, A.With, A.Match)):
-                    with current_graph.subgraph(name=f"cluster_{child_id}") as c:
-                        c.attr(style='solid', penwidth='2', color='lightcyan', label="")
-
-                        if prev_child is None:
-                            prev_child = child
-                            if (case_id, child_id) not in edges_set:
-                                dot.edge(case_id, child_id)
-                                edges_set.add((case_id, child_id))
-                            add_nodes_edges(child, case, edges_set, loop_stack,
-                                            prefix, c, unfold_times, next_child,
-                                            end_function_list, potential_module_map)
-                        else:
-                            add_nodes_edges(child, prev_child, edges_set, loop_stack,
-                                            prefix, c, unfold_times, next_child,
-                                            end_function_list, potential_module_map)
-                            prev_child = child
-                else:
-                    if prev_child is None:
-                        prev_child = child
-                        if (case_id, child_id) not in edges_set:
-                            dot.edge(case_id, child_id)
-                            edges_set.add((case_id, child_id))
-                        add_nodes_edges(child, case, edges_set, loop_stack,
-                                        prefix, current_graph, unfold_times, next_child,
-                                        end_function_list, potential_module_map)
-                    else:
-                        add_nodes_edges(child, prev_child, edges_set, loop_stack,
-                                        prefix, current_graph, unfold_times, next_child,
-                                        end_function_list, potential_module_map)
-                        prev_child = child
-        child_iter_needs = False
-        
-    if isinstance(node, A.MatchValue):
-        label = get_label(node, potential_module_map)
-    if isinstance(node, A.MatchSequence):
-        label = get_label(node, potential_module_map)
-    if isinstance(node, A.MatchMapping):
-        label = get_label(node, potential_module_map)
-    if isinstance(node, A.MatchClass):
-        label = get_label(node, potential_module_map)
-    if isinstance(node, A.MatchStar):
-        label = get_label(node, potential_module_map)
-    if isinstance(node, A.MatchAs):
-        label = get_label(node, potential_module_map)
-    if isinstance(node, A.MatchOr):
-        label = get_label(node, potential_module_map)
-
-    # 在 add_nodes_edges 函数中增加对 A.Try 的处理
-    if isinstance(node, A.Try):
-        # 主 Try 块样式
-        with current_graph.subgraph(name=f"cluster_{node_id}_try") as c:
-            c.attr(style='solid', penwidth='2', color='darkgoldenrod', label='Try Block')
-            prev_child = None
-            # 处理 try body
-            for index, child in enumerate(node.body):
-                child_id = f"{prefix}|{id(child)}"
-                child.current_node_id = child_id
-                
-                if index == len(node.body) - 1:
-                    next_child = upper_connect_node
-                    if upper_connect_node is not None and not isinstance(child, (A.FunctionDef, A.ClassDef, A.If, A.For, A.While, A.Try, A.With, A.Match)):
-                        upper_id = upper_connect_node.current_node_id if hasattr(upper_connect_node, 'current_node_id') else str(id(upper_connect_node))
-                        if (child_id, upper_id) not in edges_set:
-                            dot.edge(child_id, upper_id, label="Next_Step")
-                            edges_set.add((child_id, upper_id))
+def _import_qualname(module_name, qualname):
+    """导入 module_name 并按 qualname 逐级取属性, 返回 (所属对象, 对象)"""
+    owner = obj = importlib.import_module(module_name)
+    for part in qualname.split('.'):
+        owner, obj = obj, getattr(obj, part)
+    return owner, obj
 
-                else:
-                    next_child = node.body[index + 1]
-                    next_child_id = f"{prefix}|{id(next_child)}"
-                    next_child.current_node_id = next_child_id
-                if isinstance(child, (A.FunctionDef, A.ClassDef, A.If, A.For, A.While, A.Try, A.With, A.Match)):
-                    with c.subgraph(name=f"cluster_{child_id}") as sc:
-                        sc.attr(style='solid', penwidth='2', color='lightyellow')
-                        if prev_child is None:
-                            prev_child = child
-                            if (node_id, child_id) not in edges_set:
-                                dot.edge(node_id, child_id)
-                                edges_set.add((node_id, child_id))
-                            add_nodes_edges(child, node, edges_set, loop_stack,
-                                            prefix, sc, unfold_times, next_child,
-                                            end_function_list, potential_module_map)
-                        else:
-                            add_nodes_edges(child, prev_child, edges_set, loop_stack,
-                                            prefix, sc, unfold_times, next_child,
-                                            end_function_list, potential_module_map)
-                            prev_child = child
-                else:
-                    if prev_child is None:
-                        prev_child = child
-                        if (node_id, child_id) not in edges_set:
-                            dot.edge(node_id, child_id)
-                            edges_set.add((node_id, child_id))
-                        add_nodes_edges(child, node, edges_set, loop_stack,
-                                        prefix, c, unfold_times, next_child,
-                                        end_function_list, potential_module_map)
-                    else:
-                        add_nodes_edges(child, prev_child, edges_set, loop_stack,
-                                        prefix, c, unfold_times, next_child,
-                                        end_function_list, potential_module_map)
-                        prev_child = child
-
-        # 处理 Exception Handlers
-        for handler_index, handler in enumerate(node.handlers):
-            handler_id = f"{prefix}|{id(handler)}"
-            handler_type = get_label(handler.type) if handler.type else "All Exceptions"
-            with current_graph.subgraph(name=f"cluster_{handler_id}_except") as c:
-                c.attr(style='solid', penwidth='2', color='red', label=f'Except {handler_type}')
-                prev_child = None
-                # 连接前一个 handler 或 try 块
-                prev_handler = node.handlers[handler_index-1] if handler_index > 0 else node
-                prev_id = prev_handler.current_node_id if hasattr(prev_handler, 'current_node_id') else str(id(prev_handler))
-                if (prev_id, handler_id) not in edges_set:
-                    dot.edge(prev_id, handler_id, label="Exception")
-                    edges_set.add((prev_id, handler_id))
-                    
-                # 处理 handler body
-                for index, child in enumerate(handler.body):
-                    child_id = f"{prefix}|{id(child)}"
-                    child.current_node_id = child_id
-                    
-                    if index == len(handler.body) - 1:
-                        next_child = upper_connect_node
-                    else:
-                        next_child = handler.body[index + 1]
-                    if isinstance(child, (A.FunctionDef, A.ClassDef, A.If, A.For, A.While, A.Try, A.With, A.Match)):
-                        with c.subgraph(name=f"cluster_{child_id}") as sc:
-                            sc.attr(style='solid', penwidth='2', color='lightcoral')
-                            if prev_child is None:
-                                prev_child = child
-                                if (handler_id, child_id) not in edges_set:
-                                    dot.edge(handler_id, child_id)
-                                    edges_set.add((handler_id, child_id))
-                                add_nodes_edges(child, handler, edges_set, loop_stack,
-                                                prefix, sc, unfold_times, next_child,
-                                                end_function_list, potential_module_map)
-                            else:
-                                add_nodes_edges(child, prev_child, edges_set, loop_stack,
-                                                prefix, sc, unfold_times, next_child,
-                                                end_function_list, potential_module_map)
-                                prev_child = child
-                    else:
-                        if prev_child is None:
-                            prev_child = child
-                            if (handler_id, child_id) not in edges_set:
-                                dot.edge(handler_id, child_id)
-                                edges_set.add((handler_id, child_id))
-                            add_nodes_edges(child, handler, edges_set, loop_stack,
-                                            prefix, c, unfold_times, next_child,
-                                            end_function_list, potential_module_map)
-                        else:
-                            add_nodes_edges(child, prev_child, edges_set, loop_stack,
-                                            prefix, c, unfold_times, next_child,
-                                            end_function_list, potential_module_map)
-                            prev_child = child
-
-        # 处理 Else 块
+
+def _unfold_symbol(node, v, unfold_times, full_path):
+    """
+    在 traversal.symbols 中查找调用路径 full_path 并展开, 找到定义时返回 True
+    静态模式下从 SourceIndex 取定义, 否则只导入定义所在的模块
+    """
+    symbols = v.traversal.symbols
+    if symbols is None or full_path[0] == "self":
+        return False
+    found = symbols.resolve(".".join(full_path), getattr(v.potential_module_map, 'module', None))
+    if found is None:
+        return False
+    module_name, qualname = found
+    static = v.traversal.static
+    if static is not None:
+        module = static.module(module_name)
+        if module is None or qualname not in module.definitions:
+            return False
+        func_def_tree, callee_namespace = static._target(module, qualname)
+        yield from _unfold_callee(func_def_tree, node, v, unfold_times, callee_namespace)
+        return True
+    try:
+        owner, obj = _import_qualname(module_name, qualname)
+        func_def_tree = ast_cache.get(obj)
+    except Exception as e:
+        print(f"Error loading '{module_name}.{qualname}': {e}")
+        return False
+    # 与 模块.类.方法 的展开一致, 展开期间 self 指向所属的类
+    cls = obj if inspect.isclass(obj) else owner if inspect.isclass(owner) else None
+    class_stack = v.traversal.builder.class_stack
+    if cls is not None:
+        class_stack.append(cls)
+    try:
+        yield from _unfold_callee(func_def_tree, node, v, unfold_times, get_namespace(obj))
+    finally:
+        if cls is not None:
+            class_stack.pop()
+    return True
+
+
+def _visit_call_static(node, v):
+    """静态模式下的 Call: 通过 SourceIndex 解析被调用的函数, 不导入模块"""
+    namespace = v.potential_module_map
+    v.label += "\n" + get_label(node, namespace)
+    v.child_iter_needs = False
+    if not v.unfold_times:
+        return
+    if isinstance(node.func, A.Name):
+        func_name = node.func.id
+    elif isinstance(node.func, A.Attribute):
+        func_name = node.func.attr
+    else:
+        return
+    if func_name in v.end_function_list:
+        return
+    full_path = get_attribute_fullpath(node.func, namespace)
+    if not full_path or (yield from _unfold_symbol(node, v, v.unfold_times - 1, full_path.split('.'))):
+        return
+    target = v.traversal.static.resolve(full_path, namespace)
+    if target is not None:
+        func_def_tree, callee_namespace = target
+        yield from _unfold_callee(func_def_tree, node, v, v.unfold_times - 1, callee_namespace)
+
+
+def _visit_operand_calls(node, v, child_types):
+    v.label = get_label(node, v.potential_module_map)
+    for child in A.iter_child_nodes(node):
+        if isinstance(child, child_types):
+            yield (child, node, v.edges_set, v.loop_stack,
+                   v.prefix, v.current_graph, v.unfold_times, v.upper_connect_node,
+                   v.end_function_list, v.potential_module_map)
+    v.child_iter_needs = False
+
+
+@register_node_handler(A.BinOp)
+@register_node_handler(A.UnaryOp)
+def _visit_operator(node, v):
+    yield from _visit_operand_calls(node, v, A.Call)
+
+
+@register_node_handler(A.BoolOp)
+@register_node_handler(A.Compare)
+def _visit_bool_op(node, v):
+    yield from _visit_operand_calls(node, v, (A.Compare, A.Call))
+
+
+@register_node_handler(A.For)
+def _visit_for(node, v):
+    node_id = v.node_id
+    target = get_label(node.target)
+    iter_expr = get_label(node.iter)
+    v.label += f"\nFor: {target} in {iter_expr}"
+    # 同时记录循环结束后的下一条语句, 供 break 连边
+    v.loop_stack.append((node, v.upper_connect_node))
+    # 创建循环体子图
+    with v.current_graph.subgraph(name=f"cluster_{node_id}_body") as c:
+        c.attr(style='solid', penwidth='2', color='darkblue', label='Loop Body')
+        yield from _add_body(node.body, node, node_id, v, c, 'lightblue', "")
+        # 处理 orelse（如果有）
         if node.orelse:
-            with current_graph.subgraph(name=f"cluster_{node_id}_else") as c:
-                c.attr(style='solid', penwidth='2', color='darkgreen', label='Else Block')
-                prev_child = None
-                for index, child in enumerate(node.orelse):
-                    child_id = f"{prefix}|{id(child)}"
-                    child.current_node_id = child_id
-                    
-                    if index == len(node.orelse) - 1:
-                        next_child = upper_connect_node
-                        if upper_connect_node is not None and not isinstance(child, (A.FunctionDef, A.ClassDef, A.If, A.For, A.While, A.Try, A.With, A.Match)):
-                            upper_id = upper_connect_node.current_node_id if hasattr(upper_connect_node, 'current_node_id') else str(id(upper_connect_node))
-                            if (child_id, upper_id) not in edges_set:
-                                dot.edge(child_id, upper_id, label="Next_Step")
-                                edges_set.add((child_id, upper_id))
-                    else:
-                        next_child = node.orelse[index + 1]
-                        next_child_id = f"{prefix}|{id(next_child)}"
-                        next_child.current_node_id = next_child_id
-                    if isinstance(child, (A.FunctionDef, A.ClassDef, A.If, A.For, A.While, A.Try, A.With, A.Match)):
-                        with c.subgraph(name=f"cluster_{child_id}") as sc:
-                            sc.attr(style='solid', penwidth='2', color='lightgreen')
-                            if prev_child is None:
-                                prev_child = child
-                                if (node_id, child_id) not in edges_set:
-                                    dot.edge(node_id, child_id)
-                                    edges_set.add((node_id, child_id))
-                                add_nodes_edges(child, node, edges_set, loop_stack,
-                                                prefix, sc, unfold_times, next_child,
-                                                end_function_list, potential_module_map)
-                            else:
-                                add_nodes_edges(child, prev_child, edges_set, loop_stack,
-                                                prefix, sc, unfold_times, next_child,
-                                                end_function_list, potential_module_map)
-                                prev_child = child
-                    else:
-                        if prev_child is None:
-                            prev_child = child
-                            if (node_id, child_id) not in edges_set:
-                                dot.edge(node_id, child_id)
-                                edges_set.add((node_id, child_id))
-                            add_nodes_edges(child, node, edges_set, loop_stack,
-                                            prefix, c, unfold_times, next_child,
-                                            end_function_list, potential_module_map)
-                        else:
-                            add_nodes_edges(child, prev_child, edges_set, loop_stack,
-                                            prefix, c, unfold_times, next_child,
-                                            end_function_list, potential_module_map)
-                            prev_child = child
-        # 处理 Finally 块
-        if node.finalbody:
-            with current_graph.subgraph(name=f"cluster_{node_id}_finally") as c:
-                c.attr(style='solid', penwidth='2', color='brown', label='Finally Block')
-                prev_child = None
-                for index, child in enumerate(node.finalbody):
-                    child_id = f"{prefix}|{id(child)}"
-                    child.current_node_id = child_id
-                    
-                    if index == len(node.finalbody) - 1:
-                        next_child = upper_connect_node
-                        if upper_connect_node is not None and not isinstance(child, (A.FunctionDef, A.ClassDef, A.If, A.For, A.While, A.Try, A.With, A.Match)):
-                            upper_id = upper_connect_node.current_node_id if hasattr(upper_connect_node, 'current_node_id') else str(id(upper_connect_node))
-                            if(child_id, upper_id) not in edges_set:
-                                dot.edge(child_id, upper_id, label="Next_Step")
-                                edges_set.add((child_id, upper_id))
-                    else:
-                        next_child = node.finalbody[index + 1]
-                        next_child_id = f"{prefix}|{id(next_child)}"
-                        next_child.current_node_id = next_child_id
-                    if isinstance(child, (A.FunctionDef, A.ClassDef, A.If, A.For, A.While, A.Try, A.With, A.Match)):
-                        with c.subgraph(name=f"cluster_{child_id}") as sc:
-                            sc.attr(style='solid', penwidth='2', color='peachpuff')
-                            if prev_child is None:
-                                prev_child = child
-                                if (node_id, child_id) not in edges_set:
-                                    dot.edge(node_id, child_id)
-                                    edges_set.add((node_id, child_id))
-                                add_nodes_edges(child, node, edges_set, loop_stack, 
-                                                prefix, sc, unfold_times, next_child,
-                                                end_function_list, potential_module_map)
-                            else:
-                                add_nodes_edges(child, prev_child, edges_set, loop_stack, 
-                                                prefix, sc, unfold_times, next_child,
-                                                end_function_list, potential_module_map)
-                                prev_child = child
-                    else:
-                        if prev_child is None:
-                            prev_child = child
-                            if (node_id, child_id) not in edges_set:
-                                dot.edge(node_id, child_id)
-                                edges_set.add((node_id, child_id))
-                            add_nodes_edges(child, node, edges_set, loop_stack,
-                                            prefix, c, unfold_times, next_child,
-                                            end_function_list, potential_module_map)
-                        else:
-                            add_nodes_edges(child, prev_child, edges_set, loop_stack,
-                                            prefix, c, unfold_times, next_child,
-                                            end_function_list, potential_module_map)
-                            prev_child = child
-        
-        child_iter_needs = False
-     # 处理 Break 节点
-    if isinstance(node, A.Break):
-        if loop_stack:
-            target_node = loop_stack[-1].upper_connect_node  # 假设 upper_connect_node 已保存
-            target_id = f"{prefix}|{id(target_node)}"
-            node_id = f"{prefix}|{id(node)}"
-            
-            if (node_id, target_id) not in edges_set:
-                dot.edge(node_id, target_id, label="Break→", constraint="False")
-                edges_set.add((node_id, target_id))
-        else:
-            raise ValueError("Break outside loop")
-        child_iter_needs = False
-
-    # 处理 Continue 节点
-    if isinstance(node, A.Continue):
-        if loop_stack:
-            target_node = loop_stack[-1]  # 获取最近的循环节点
-            target_id = f"{prefix}|{id(target_node)}"
-            node_id = f"{prefix}|{id(node)}"
-            
-            if (node_id, target_id) not in edges_set:
-                dot.edge(node_id, target_id, label="Continue→", constraint="False")
-                edges_set.add((node_id, target_id))
-        else:
-            raise ValueError("Continue outside loop")
-        child_iter_needs = False
-    if isinstance(node, A.List):
-        label += get_label(node, potential_module_map)
-        child_iter_needs = False
-    if isinstance(node, A.Tuple):
-        label += get_label(node, potential_module_map)
-        child_iter_needs = False
-    if isinstance(node, A.Set):
-        label += get_label(node, potential_module_map)
-        child_iter_needs = False
-    if isinstance(node, A.Dict):
-        label += get_label(node, potential_module_map)
-        child_iter_needs = False
-
-    # 添加字段信息（排除 ctx 和空值）
-    for field, value in A.iter_fields(node):
-        if field == "ctx" or value is None or value == []:
-            continue
-        if not str(value).startswith("<ast") and not str(value).startswith("[<ast") :  # 只添加非AST字段
-            label += f"\n{field}: {repr(value)}"
-    
-    #if not isinstance(node, A.Name):
-    current_graph.node(node_id, label)
+            with v.current_graph.subgraph(name=f"cluster_{node_id}_orelse") as c:
+                c.attr(style='solid', penwidth='2', color='darkyellow', label='Else')
+                yield from _add_body(node.orelse, node, node_id, v, c, 'lightpink', "", nested=True)
+    v.loop_stack.pop()
+    v.child_iter_needs = False
 
-    if upper_connect_node is not None:
-        if isinstance(node, (A.Expr, A.Assign, A.Return)):
-            upper_connect_node_id = upper_connect_node.current_node_id if hasattr(upper_connect_node, 'current_node_id') else str(id(upper_connect_node))
-            if (node_id, upper_connect_node_id) not in edges_set:
-                edge_label = "Next_Step"
-                dot.edge(node_id, upper_connect_node_id, label = edge_label)
-                edges_set.add((node_id, upper_connect_node_id))
-    # 连接父节点
-    if parent is not None:
-        if not isinstance(parent, (A.FunctionDef, A.ClassDef, A.If, A.For, A.While, A.Try, A.With, A.Match)):
-            parent_id = parent.current_node_id if hasattr(parent, 'current_node_id') else str(id(parent))
-            if (parent_id, node_id) not in edges_set:
-                current_graph.edge(parent_id, node_id)
-                edges_set.add((parent_id, node_id))
-    
-    # 递归处理子节点
-    if child_iter_needs:
-        for child in A.iter_child_nodes(node):
-            # 跳过 Load 等无用节点
-            if child.__class__.__name__ in ["Load", "Store", "Del"]:
-                continue
-            
-            edge_label = None
-            if hasattr(node, "test"):
-                if child == node.test:
-                    edge_label = "Condition"
-            if isinstance(node, A.Expr):
-                edge_label = "Expression_Is"
+
+@register_node_handler(A.While)
+def _visit_while(node, v):
+    node_id = v.node_id
+    condition = get_label(node.test)
+    v.label += f"\nWhile: {condition}"
+    # 同时记录循环结束后的下一条语句, 供 break 连边
+    v.loop_stack.append((node, v.upper_connect_node))
+    with v.current_graph.subgraph(name=f"cluster_{node_id}_While_body") as c:
+        c.attr(style='solid', penwidth='2', color='pink', label='Loop Body')
+        yield from _add_body(node.body, node, node_id, v, c, 'lightblue', "")
+
+        # 处理 orelse 分支
+        if node.orelse:
+            with v.current_graph.subgraph(name=f"cluster_{node_id}_orelse") as c:
+                c.attr(style='solid', penwidth='2', color='darkgrey', label='Else')
+                yield from _add_body(node.orelse, node, node_id, v, c, 'lightpink', "")
+    v.loop_stack.pop()
+    v.child_iter_needs = False
+
+
+#  处理 Match 匹配
+@register_node_handler(A.Match)
+def _visit_match(node, v):
+    node_id = v.node_id
+    v.label = f"Match: {get_label(node.subject)}"
+    for case in node.cases:
+        case_id = v.id_of(case)
+        case_label = f"Case: {get_label(case.pattern)}"
+        if case.guard:
+            case_label += f" if {get_label(case.guard)}"
+        v.current_graph.node(case_id, case_label)
+        v.current_graph.edge(node_id, case_id)
+        v.edges_set.add((node_id, case_id))
+        yield from _add_body(case.body, case, case_id, v, v.current_graph, 'lightcyan', "")
+    v.child_iter_needs = False
+
+
+@register_node_handler(A.MatchValue)
+@register_node_handler(A.MatchSequence)
+@register_node_handler(A.MatchMapping)
+@register_node_handler(A.MatchClass)
+@register_node_handler(A.MatchStar)
+@register_node_handler(A.MatchAs)
+@register_node_handler(A.MatchOr)
+def _visit_pattern(node, v):
+    v.label = get_label(node, v.potential_module_map)
+
+
+@register_node_handler(A.Try)
+def _visit_try(node, v):
+    node_id = v.node_id
+    edges_set = v.edges_set
+    # 主 Try 块样式
+    with v.current_graph.subgraph(name=f"cluster_{node_id}_try") as c:
+        c.attr(style='solid', penwidth='2', color='darkgoldenrod', label='Try Block')
+        # 处理 try body
+        yield from _add_body(node.body, node, node_id, v, c, 'lightyellow')
+
+    # 处理 Exception Handlers
+    for handler_index, handler in enumerate(node.handlers):
+        handler_id = v.id_of(handler)
+        handler_type = get_label(handler.type) if handler.type else "All Exceptions"
+        with v.current_graph.subgraph(name=f"cluster_{handler_id}_except") as c:
+            c.attr(style='solid', penwidth='2', color='red', label=f'Except {handler_type}')
+            # 连接前一个 handler 或 try 块
+            prev_handler = node.handlers[handler_index-1] if handler_index > 0 else node
+            prev_id = v.id_of(prev_handler)
+            if (prev_id, handler_id) not in edges_set:
+                v.traversal.builder.graph.edge(prev_id, handler_id, label="Exception")
+                edges_set.add((prev_id, handler_id))
                 
-            # 优先处理带标签的边
-            
-            child_id = f"{prefix}|{id(child)}"
-            if (node_id, child_id) not in edges_set:
-                current_graph.edge(node_id, child_id, label=edge_label)
-                edges_set.add((node_id, child_id))
-                add_nodes_edges(child, node, edges_set, loop_stack,
-                                prefix, current_graph, unfold_times, upper_connect_node,
-                                end_function_list, potential_module_map)
+            # 处理 handler body
+            yield from _add_body(handler.body, handler, handler_id, v, c, 'lightcoral', link_last=False)
+
+    # 处理 Else 块
+    if node.orelse:
+        with v.current_graph.subgraph(name=f"cluster_{node_id}_else") as c:
+            c.attr(style='solid', penwidth='2', color='darkgreen', label='Else Block')
+            yield from _add_body(node.orelse, node, node_id, v, c, 'lightgreen')
+    # 处理 Finally 块
+    if node.finalbody:
+        with v.current_graph.subgraph(name=f"cluster_{node_id}_finally") as c:
+            c.attr(style='solid', penwidth='2', color='brown', label='Finally Block')
+            yield from _add_body(node.finalbody, node, node_id, v, c, 'peachpuff')
+    v.child_iter_needs = False
+
+
+# 处理 Break 节点
+@register_node_handler(A.Break)
+def _visit_break(node, v):
+    if v.loop_stack:
+        target_node = v.loop_stack[-1][1]  # 循环结束后的下一条语句
+        target_id = v.id_of(target_node)
+        node_id = v.node_id
+        
+        if (node_id, target_id) not in v.edges_set:
+            v.traversal.builder.graph.edge(node_id, target_id, label="Break→", constraint="False")
+            v.edges_set.add((node_id, target_id))
+    else:
+        raise ValueError("Break outside loop")
+    v.child_iter_needs = False
+
+
+# 处理 Continue 节点
+@register_node_handler(A.Continue)
+def _visit_continue(node, v):
+    if v.loop_stack:
+        target_node = v.loop_stack[-1][0]  # 获取最近的循环节点
+        target_id = v.id_of(target_node)
+        node_id = v.node_id
         
+        if (node_id, target_id) not in v.edges_set:
+            v.traversal.builder.graph.edge(node_id, target_id, label="Continue→", constraint="False")
+            v.edges_set.add((node_id, target_id))
+    else:
+        raise ValueError("Continue outside loop")
+    v.child_iter_needs = False
+
+
+@register_node_handler(A.List)
+@register_node_handler(A.Tuple)
+@register_node_handler(A.Set)
+@register_node_handler(A.Dict)
+def _visit_collection(node, v):
+    v.label += get_label(node, v.potential_module_map)
+    v.child_iter_needs = False
+
+
+def get_label(node, potential_module_map=None):
+    """
+    生成节点的文字描述
+    标签处理函数可以是生成器: yield (子节点, potential_module_map) 得到子节点的标签,
+    这样嵌套很深的表达式也不会受递归深度限制
+    每个 (节点, potential_module_map) 的标签（包括生成过程中得到的子节点标签）只生成一次,
+    之后直接取缓存; potential_module_map 按对象身份区分, 传入后不应再修改
+    """
+    limit = _label_limit.get()
+    result = _label_start(node, potential_module_map, limit)
+    if not isinstance(result, types.GeneratorType):
+        return result
+    stack = [(result, node, potential_module_map)]
+    value = None
+    while True:
+        try:
+            child, child_map = stack[-1][0].send(value)
+        except StopIteration as stop:
+            _, done, done_map = stack.pop()
+            value = _remember_label(done, done_map, limit, stop.value)
+            if not stack:
+                return value
+            continue
+        result = _label_start(child, child_map, limit)
+        if isinstance(result, types.GeneratorType):
+            stack.append((result, child, child_map))
+            value = None
+        else:
+            value = result
+
+
+# 节点 -> {(id(potential_module_map), 长度上限): (potential_module_map, 标签)}, 随 AST 一起释放
+_label_cache = weakref.WeakKeyDictionary()
+# 标签长度上限, 由 add_nodes_edges(max_label_length=...) 在遍历期间设置
+_label_limit = contextvars.ContextVar('label_limit', default=None)
+
+
+def _label_start(node, potential_module_map, limit):
+    # 返回缓存的标签, 或 _label_step 的结果; 生成器由 get_label 驱动, 完成后再存入缓存
+    try:
+        entries = _label_cache.get(node)
+    except TypeError:
+        # 不能弱引用的对象（如 None）不缓存
+        return _truncate_label(_label_step(node, potential_module_map), limit)
+    if entries is not None:
+        entry = entries.get((id(potential_module_map), limit))
+        if entry is not None and entry[0] is potential_module_map:
+            return entry[1]
+    result = _label_step(node, potential_module_map)
+    if isinstance(result, types.GeneratorType):
+        return result
+    return _remember_label(node, potential_module_map, limit, result)
+
+
+def _truncate_label(label, limit):
+    if limit is not None and isinstance(label, str) and len(label) > limit:
+        return label[:limit] + "..."
+    return label
+
+
+def _remember_label(node, potential_module_map, limit, label):
+    # 超过上限的标签在这里截断, 父节点只会拼接截断后的子标签
+    label = _truncate_label(label, limit)
+    try:
+        entries = _label_cache.get(node)
+        if entries is None:
+            entries = _label_cache[node] = {}
+    except TypeError:
+        return label
+    entries[(id(potential_module_map), limit)] = (potential_module_map, label)
+    return label
+
+
+def clear_label_cache():
+    _label_cache.clear()
+
+
+def _label_step(node, potential_module_map):
+    if potential_module_map is None:
+        potential_module_map = {}
+    node_type = type(node)
+    handler = _label_dispatch[node_type] if node_type in _label_dispatch else \
+        _resolve_handler(_label_handlers, _label_dispatch, node_type)
+    if handler is not None:
+        return handler(node, potential_module_map)
+    # 添加其他需要处理的节点类型...
+    # 默认返回类名
+    return node.__class__.__name__
+
+
+def _labels_of(nodes, potential_module_map=None):
+    labels = []
+    for node in nodes:
+        labels.append((yield node, potential_module_map))
+    return labels
+
+
+@register_label_handler(A.Compare)
+def _label_compare(node, potential_module_map):
+    left = yield node.left, None
+    parts = []
+    for op, comp in zip(node.ops, node.comparators):
+        op_symbol = get_op_label(op)
+        comp_expr = yield comp, None
+        parts.append(f"{op_symbol} {comp_expr}")
+    return f"{left} {' '.join(parts)}"
+
+
+@register_label_handler(A.Assign)
+def _label_assign(node, potential_module_map):
+    targets = ', '.join((yield from _labels_of(node.targets)))
+    value = yield node.value, None
+    return f"{targets} = {value}"
+
+
+@register_label_handler(A.BinOp)
+def _label_bin_op(node, potential_module_map):
+    # 处理二元运算（如 a + b）
+    left = yield node.left, None
+    op = get_op_label(node.op)
+    right = yield node.right, None
+    return f"{left} {op} {right}"
+
+
+@register_label_handler(A.UnaryOp)
+def _label_unary_op(node, potential_module_map):
+    # 处理一元运算（如 -x）
+    op = get_op_label(node.op)
+    operand = yield node.operand, None
+    return f"{op}{operand}"
+
+
+@register_label_handler(A.Call)
+def _label_call(node, potential_module_map):
+    # 处理函数调用（如 func(arg)）
+    func = yield node.func, potential_module_map
+    args = ', '.join((yield from _labels_of(node.args, potential_module_map)))
+    return f"{func}({args})"
+
+
+@register_label_handler(A.Name)
+def _label_name(node, potential_module_map):
+    # 处理变量名
+    return potential_module_map.get(node.id, node.id)
+
+
+@register_label_handler(A.BoolOp)
+def _label_bool_op(node, potential_module_map):
+    # 处理布尔操作（如 a or b）
+    op_symbol = ' ' + get_op_label(node.op) + ' '
+    values = yield from _labels_of(node.values)
+    return f"{op_symbol.join(values)}"
+
+
+@register_label_handler(A.Constant)
+def _label_constant(node, potential_module_map):
+    # 处理常量值
+    return  repr(node.value)
+
+
+@register_label_handler(A.Attribute)
+def _label_attribute(node, potential_module_map):
+    # 处理属性访问（如 obj.attr）
+    value = yield node.value, potential_module_map
+    return f"{value}.{node.attr}"
+
+
+@register_label_handler(A.For)
+def _label_for(node, potential_module_map):
+    target = yield node.target, None
+    iter_expr = yield node.iter, None
+    return f"For {target} in {iter_expr}"
+
+
+@register_label_handler(A.While)
+def _label_while(node, potential_module_map):
+    condition = yield node.test, None
+    return f"While {condition}"
+
+
+@register_label_handler(A.Match)
+def _label_match(node, potential_module_map):
+    subject = yield node.subject, None
+    cases = []
+    for case in node.cases:
+        pattern = yield case.pattern, None
+        guard = (yield case.guard, None) if case.guard else None
+        body = yield from _labels_of(case.body)
+        case_str = f"case {pattern}"
+        if guard:
+            case_str += f" if {guard}"
+        case_str += ": " + "; ".join(body)
+        cases.append(case_str)
+    return f"match {subject}:\n  " + "\n  ".join(cases)
+
+
+@register_label_handler(A.MatchValue)
+def _label_match_value(node, potential_module_map):
+    value = yield node.value, None
+    return f"MatchValue: {value}"
+
+
+@register_label_handler(A.MatchSequence)
+def _label_match_sequence(node, potential_module_map):
+    elements = ', '.join((yield from _labels_of(node.patterns)))
+    return f"MatchSequence: [{elements}]"
+
+
+@register_label_handler(A.MatchMapping)
+def _label_match_mapping(node, potential_module_map):
+    keys = ', '.join((yield from _labels_of(node.keys)))
+    values = ', '.join((yield from _labels_of(node.patterns)))
+    return f"MatchMapping: {{{keys}: {values}}}"
+
+
+@register_label_handler(A.MatchClass)
+def _label_match_class(node, potential_module_map):
+    class_name = yield node.cls, None
+    patterns = ', '.join((yield from _labels_of(node.patterns)))
+    return f"MatchClass: {class_name}({patterns})"
+
+
+@register_label_handler(A.MatchStar)
+def _label_match_star(node, potential_module_map):
+    name = (yield node.name, None) if node.name else "*"
+    return f"MatchStar: {name}"
+
+
+@register_label_handler(A.MatchAs)
+def _label_match_as(node, potential_module_map):
+    name = (yield node.name, None) if node.name else "_"
+    return f"MatchAs: {name}"
+
+
+@register_label_handler(A.MatchOr)
+def _label_match_or(node, potential_module_map):
+    patterns = ' | '.join((yield from _labels_of(node.patterns)))
+    return f"MatchOr: {patterns}"
+
+
+@register_label_handler(A.List)
+def _label_list(node, potential_module_map):
+    return '[' + ', '.join((yield from _labels_of(node.elts))) + ']'
+
+
+@register_label_handler(A.Tuple)
+def _label_tuple(node, potential_module_map):
+    return '(' + ', '.join((yield from _labels_of(node.elts))) + ')'
+
+
+@register_label_handler(A.Set)
+def _label_set(node, potential_module_map):
+    return '{' + ', '.join((yield from _labels_of(node.elts))) + '}'
+
+
+@register_label_handler(A.Dict)
+def _label_dict(node, potential_module_map):
+    items = []
+    for key, value in zip(node.keys, node.values):
+        key_label = yield key, None
+        value_label = yield value, None
+        items.append(f"{key_label}: {value_label}")
+    return '{' + ', '.join(items) + '}'
+
+
+def get_op_label(op):
+    """将 AST 操作符转换为符号"""
+    op_type = type(op)
+    return {
+        A.Add: '+',
+        A.Sub: '-',
+        A.Mult: '*',
+        A.Div: '/',
+        A.Eq: '==',
+        A.NotEq: '!=',
+        A.Lt: '<',
+        A.LtE: '<=',
+        A.Gt: '>',
+        A.GtE: '>=',
+        A.And: 'and',
+        A.Or: 'or',
+        A.Not: 'not',
+        A.USub: '-',  
+        A.Or: 'or',
+        A.In: 'in',
+        A.NotIn: 'not in',
+        A.Is: 'is',
+        A.IsNot: 'is not',
+        A.Invert: '~',
+        A.BitAnd: '&',
+        A.BitOr: '|',
+        A.FloorDiv: '//',
+        A.Mod: '%',
+        A.Pow: '**',
+        A.MatMult: '@',
+        A.BitXor: '^',
+        A.FloorDiv: '//',
+        A.LShift: '<<',
+        A.RShift: '>>'
+        # 添加其他操作符...
+    }.get(op_type, op.__class__.__name__)  # 找不到则返回类名
+
+
+_alias_map_cache = {}
+_namespace_cache = {}
+
+
+def _module_version(mod):
+    """模块源文件的 (mtime, size)，用于判断缓存是否失效；无源文件时为 None"""
+    file_path = getattr(mod, '__file__', None)
+    if not file_path:
+        return None
+    try:
+        st = os.stat(file_path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def _cached_for_module(cache, mod):
+    entry = cache.get(mod.__name__)
+    if entry is not None and entry[0] is mod and entry[1] == _module_version(mod):
+        return entry[2]
+    return None
+
+
+def build_alias_map_from_module(mod):
+    """从模块对象中提取别名映射, 结果按模块缓存 (源文件变化时重建), 返回只读映射"""
+    cached = _cached_for_module(_alias_map_cache, mod)
+    if cached is not None:
+        return cached
+    version = _module_version(mod)
+    cache = disk_cache
+    digest = None
+    if cache is not None and version is not None and mod.__file__.endswith('.py'):
+        digest = cache.file_hash(mod.__file__)
+    alias_map = cache.get('alias_map', (digest,)) if digest is not None else None
+    if alias_map is None:
+        alias_map = {}
+        try:
+            if version is not None:
+                linecache.checkcache(mod.__file__)
+            source = inspect.getsource(mod)
+            tree = A.parse(source)
+            for node in A.walk(tree):
+                if isinstance(node, (A.Import, A.ImportFrom)):
+                    for alias in node.names:
+                        if alias.asname:
+                            alias_map[alias.asname] = alias.name
+            if digest is not None:
+                cache.put('alias_map', (digest,), alias_map)
+        except Exception as e:
+            print(f"Error building alias map from module {mod.__name__}: {e}")
+    alias_map = types.MappingProxyType(alias_map)
+    _alias_map_cache[mod.__name__] = (mod, version, alias_map)
+    return alias_map
+
+
+def get_namespace(func):
+    """
+    返回 func 所在模块的 {别名: 模块名} 映射（ModuleNamespace, 同时记录模块名）
+    同一模块共享同一个只读映射, 模块源文件变化后重新构建
+    """
+    mod = inspect.getmodule(func)
+    cached = _cached_for_module(_namespace_cache, mod)
+    if cached is not None:
+        return cached
+    version = _module_version(mod)
+    current_module = mod.__name__
+    namespace_map = {}  
+
+    # 构建模块级的别名映射, 按真实模块名反查别名
+    alias_map = build_alias_map_from_module(mod)
+    aliases_of = {}
+    for alias, real in alias_map.items():
+        aliases_of.setdefault(real, []).append(alias)
+
+    # 遍历模块字典获取导入的模块
+    for name, value in mod.__dict__.items():
+        if name in ('__builtins__', '__name__', '__file__', '__package__'):
+            continue
+
+        # 处理直接导入的模块（如 import numpy as np）
+        if isinstance(value, types.ModuleType):
+            original_name = value.__name__
+            if original_name == current_module:
+                continue
+
+            # 添加原始模块名到字典
+            namespace_map[original_name] = original_name
+
+            # 添加所有匹配的别名到字典
+            for alias in aliases_of.get(original_name, ()):
+                namespace_map[alias] = original_name
+
+    # 添加 "__main__"
+    namespace_map["__main__"] = "__main__"
+
+    namespace_map = ModuleNamespace(types.MappingProxyType(namespace_map), current_module)
+    _namespace_cache[current_module] = (mod, version, namespace_map)
+    return namespace_map
+
+
+def clear_namespace_cache():
+    _alias_map_cache.clear()
+    _namespace_cache.clear()
+
+
+def _file_version(file_path):
+    try:
+        st = os.stat(file_path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+class ModuleNamespace(Mapping):
+    """
+    potential_module_map: {别名: 模块名}, 另外记录代码所在的模块,
+    以及（静态模式下）self 所属的类 (模块名, 类的 qualname), 供解析 foo() / self.foo() 使用
+    """
+    __slots__ = ('_aliases', 'module', 'cls')
+
+    def __init__(self, aliases, module, cls=None):
+        self._aliases = aliases
+        self.module = module
+        self.cls = cls
+
+    def __getitem__(self, key):
+        return self._aliases[key]
+
+    def __iter__(self):
+        return iter(self._aliases)
+
+    def __len__(self):
+        return len(self._aliases)
+
+
+class StaticModule:
+    """
+    SourceIndex 中解析过的一个模块
+    definitions: qualname -> FunctionDef / ClassDef 节点, 包括类中的方法（"Class.method"）
+    imports: from ... import 引入的名字（子模块除外）-> 全限定名, 与 aliases 一起由 SourceIndex 填充
+    """
+    __slots__ = ('name', 'file', 'version', 'tree', 'is_package', 'definitions', 'aliases', 'imports',
+                 '_trees', '_namespaces')
+
+    def __init__(self, name, file, version, tree):
+        self.name = name
+        self.file = file
+        self.version = version
+        self.tree = tree
+        self.is_package = os.path.basename(file) == '__init__.py'
+        self.definitions = {}
+        self.aliases = None
+        self.imports = None
+        self._trees = {}
+        self._namespaces = {}
+        pending = [("", tree.body)]
+        while pending:
+            prefix, body = pending.pop()
+            for node in body:
+                if isinstance(node, (A.FunctionDef, A.AsyncFunctionDef, A.ClassDef)):
+                    qualname = prefix + node.name
+                    self.definitions[qualname] = node
+                    if isinstance(node, A.ClassDef):
+                        pending.append((qualname + ".", node.body))
+
+    def tree_for(self, qualname):
+        """与 dot_source_prepare 的结果相同形式的 A.Module（只含这一个定义）, 同一定义总是返回同一棵树"""
+        tree = self._trees.get(qualname)
+        if tree is None:
+            node = self.definitions[qualname]
+            tree = self._trees[qualname] = A.Module(body=[node], type_ignores=[])
+            tree.cache_key = (self.file, self.version, self.name, qualname, node.lineno)
+        return tree
+
+
+def _import_base(module_name, is_package, node):
+    # from ... import 的目标模块名, 处理相对导入
+    if not node.level:
+        return node.module
+    package = module_name if is_package else module_name.rpartition('.')[0]
+    parts = package.split('.') if package else []
+    if node.level > 1:
+        parts = parts[:len(parts) - (node.level - 1)]
+    if node.module:
+        parts.append(node.module)
+    return '.'.join(parts)
+
+
+class SourceIndex:
+    """
+    静态解析: 在 sys.path（或给定的 path）上查找模块源文件并解析, 从不导入目标模块,
+    因此没有导入的副作用, 也不需要安装目标代码的依赖
+    每个模块只解析一次, 源文件变化（mtime/size）后重新解析
+    能解析的调用: 同模块的函数/类, 模块别名.函数, 模块.类.方法, 类.方法, self.方法（含基类中定义的）,
+    以及 from ... import 引入的函数/类
+    """
+    def __init__(self, path=None):
+        self.path = path
+        self._files = {}
+        self._modules = {}
+
+    def find_file(self, name):
+        """模块 name 的源文件路径, 找不到或不是 .py 源文件时返回 None; 不导入任何包"""
+        if name in self._files:
+            return self._files[name]
+        file_path = None
+        search = self.path
+        spec = None
+        for part in name.split('.'):
+            if spec is not None:
+                search = spec.submodule_search_locations
+                if not search:
+                    spec = None
+                    break
+            try:
+                spec = importlib.machinery.PathFinder.find_spec(part, search)
+            except (ImportError, ValueError):
+                spec = None
+            if spec is None:
+                break
+        if spec is not None and spec.origin and spec.origin.endswith('.py'):
+            file_path = spec.origin
+        self._files[name] = file_path
+        return file_path
+
+    def module(self, name):
+        """解析后的 StaticModule, 找不到源文件时返回 None"""
+        if not name or name == '__main__':
+            return None
+        file_path = self.find_file(name)
+        if file_path is None:
+            return None
+        version = _file_version(file_path)
+        module = self._modules.get(name)
+        if module is not None and module.version == version:
+            return module
+        try:
+            with open(file_path, 'rb') as f:
+                tree = A.parse(f.read(), file_path)
+        except (OSError, SyntaxError, ValueError) as e:
+            print(f"Error parsing module '{name}' from {file_path}: {e}")
+            return None
+        module = StaticModule(name, file_path, version, tree)
+        self._modules[name] = module
+        return module
+
+    def _aliases(self, module):
+        """与 get_namespace 相同的 {别名: 模块名}, 只看 import 语句; 同时填充 module.imports"""
+        if module.aliases is not None:
+            return module.aliases
+        aliases = {}
+        imports = {}
+        for node in A.walk(module.tree):
+            if isinstance(node, A.Import):
+                for alias in node.names:
+                    if alias.asname:
+                        aliases[alias.asname] = alias.name
+                        aliases[alias.name] = alias.name
+                    else:
+                        top = alias.name.split('.')[0]
+                        aliases[top] = top
+            elif isinstance(node, A.ImportFrom):
+                base = _import_base(module.name, module.is_package, node)
+                if not base:
+                    continue
+                for alias in node.names:
+                    if alias.name == '*':
+                        continue
+                    full_name = f"{base}.{alias.name}"
+                    # 只把导入的子模块放进别名映射, 与 get_namespace 一致; 其余名字记在 imports 中
+                    if self.find_file(full_name) is not None:
+                        aliases[alias.asname or alias.name] = full_name
+                        aliases[full_name] = full_name
+                    else:
+                        imports[alias.asname or alias.name] = full_name
+        aliases["__main__"] = "__main__"
+        module.imports = imports
+        module.aliases = types.MappingProxyType(aliases)
+        return module.aliases
+
+    def _imports(self, module):
+        self._aliases(module)
+        return module.imports
+
+    def namespace(self, name, cls=None):
+        """模块 name 的 ModuleNamespace, 找不到模块时为 None"""
+        module = self.module(name)
+        if module is None:
+            return None
+        return ModuleNamespace(self._aliases(module), name, cls)
+
+    def _target(self, module, qualname, cls=None):
+        node = module.definitions[qualname]
+        if cls is None:
+            if isinstance(node, A.ClassDef):
+                cls = (module.name, qualname)
+            elif '.' in qualname:
+                cls = (module.name, qualname.rpartition('.')[0])
+        # 同一 (模块, 类) 总是使用同一个 ModuleNamespace, get_label 的缓存按它的身份区分
+        namespace = module._namespaces.get(cls)
+        if namespace is None:
+            namespace = module._namespaces[cls] = ModuleNamespace(self._aliases(module), module.name, cls)
+        return module.tree_for(qualname), namespace
+
+    def _split(self, parts, module=None):
+        # 优先在当前模块中查找, 否则找最长的模块名前缀; 返回 (StaticModule, qualname)
+        if module is not None and parts[0] in module.definitions:
+            return module, '.'.join(parts)
+        for k in range(len(parts) - 1, 0, -1):
+            found = self.module('.'.join(parts[:k]))
+            if found is not None:
+                return found, '.'.join(parts[k:])
+        return None, None
+
+    def _locate(self, parts, module=None):
+        """
+        parts 所指的定义 (StaticModule, qualname), module 为代码所在的模块;
+        跟随 from ... import 引入的名字, 包括包 __init__ 中的转导出
+        """
+        if module is None or parts[0] not in self._imports(module):
+            module, qualname = self._split(parts, module)
+            if module is None:
+                return None, None
+            parts = qualname.split('.')
+        for _ in range(50):
+            if parts[0] in module.definitions:
+                break
+            target = self._imports(module).get(parts[0])
+            if target is None:
+                break
+            module, qualname = self._split(target.split('.'))
+            if module is None:
+                return None, None
+            parts = qualname.split('.') + parts[1:]
+        return module, '.'.join(parts)
+
+    def _find_method(self, module_name, class_qualname, method, cls=None, depth=0):
+        module = self.module(module_name)
+        if module is None or not isinstance(module.definitions.get(class_qualname), A.ClassDef):
+            return None
+        qualname = f"{class_qualname}.{method}"
+        if qualname in module.definitions:
+            return self._target(module, qualname, cls)
+        if depth > 50:
+            return None
+        # 在基类中查找
+        aliases = self._aliases(module)
+        for base in module.definitions[class_qualname].bases:
+            base_path = get_attribute_fullpath(base, aliases)
+            if not base_path:
+                continue
+            base_module, base_qualname = self._locate(base_path.split('.'), module)
+            if base_module is not None:
+                found = self._find_method(base_module.name, base_qualname, method, cls, depth + 1)
+                if found is not None:
+                    return found
+        return None
+
+    def resolve(self, full_path, namespace=None):
+        """
+        解析调用路径 full_path（get_attribute_fullpath 的结果, 或入口函数的 "module.Class.method"）,
+        namespace 为调用处的 ModuleNamespace; 返回 (A.Module, 被调用函数的 ModuleNamespace) 或 None
+        """
+        parts = full_path.split('.')
+        current = namespace if isinstance(namespace, ModuleNamespace) else None
+        if parts[0] == 'self':
+            if current is None or current.cls is None or len(parts) != 2:
+                return None
+            # self 的类保持不变, 基类中的方法里 self.xxx 仍从子类开始查找
+            return self._find_method(current.cls[0], current.cls[1], parts[1], current.cls)
+        module, qualname = self._locate(parts, self.module(current.module) if current else None)
+        if module is None:
+            return None
+        if qualname in module.definitions:
+            return self._target(module, qualname)
+        class_qualname, _, method = qualname.rpartition('.')
+        if class_qualname:
+            return self._find_method(module.name, class_qualname, method)
+        return None
+
+    def clear(self):
+        self._files.clear()
+        self._modules.clear()
+
+
+source_index = SourceIndex()
+
+
+class SymbolIndex:
+    """
+    工程级符号表: 全限定名（"pkg.mod.func" / "pkg.mod.Class.method"）-> (模块名, qualname),
+    from x import y 引入的名字也收录在引入它的模块下（"pkg.mod.y"）, 指向 y 最终的定义,
+    调用处的解析只需要一次字典查找
+    roots 为工程的导入根目录（相当于 sys.path 中的一项）, 扫描其中所有 .py 文件;
+    save / load 把每个文件解析出的定义和导入持久化为 JSON, 再次 update 时只重新解析变化了的文件
+    """
+    VERSION = 1
+
+    def __init__(self, roots=()):
+        self.roots = [os.path.abspath(root) for root in roots]
+        self._files = {}
+        self._modules = {}
+        self.symbols = {}
+
+    @classmethod
+    def build(cls, roots, path=None):
+        """扫描 roots 建立符号表; 给出 path 时先读取其中保存的结果, 更新后再写回"""
+        index = cls.load(path) if path and os.path.exists(path) else None
+        if index is None or index.roots != [os.path.abspath(root) for root in roots]:
+            index = cls(roots)
+        index.update()
+        if path:
+            index.save(path)
+        return index
+
+    def _scan(self):
+        # 按导入根目录得到 {源文件: 模块名}, 跳过不能作为模块名的目录和文件
+        found = {}
+        for root in self.roots:
+            for dir_path, dir_names, file_names in os.walk(root):
+                rel = os.path.relpath(dir_path, root)
+                package = [] if rel == os.curdir else rel.split(os.sep)
+                dir_names[:] = sorted(d for d in dir_names if d.isidentifier())
+                for file_name in sorted(file_names):
+                    stem, ext = os.path.splitext(file_name)
+                    if ext != '.py' or not stem.isidentifier():
+                        continue
+                    parts = package if stem == '__init__' else package + [stem]
+                    if parts:
+                        found.setdefault(os.path.join(dir_path, file_name), '.'.join(parts))
+        return found
+
+    def _parse(self, file_path, name, version):
+        # 文件内容相同（如 CI 中重新检出, mtime 改变）时直接使用 disk_cache 中的结果
+        cache = disk_cache
+        digest = cache.file_hash(file_path) if cache is not None else None
+        disk_key = (digest, name, os.path.basename(file_path))
+        entry = cache.get('symbols', disk_key) if digest is not None else None
+        if entry is None:
+            try:
+                with open(file_path, 'rb') as f:
+                    tree = A.parse(f.read(), file_path)
+            except (OSError, SyntaxError, ValueError) as e:
+                print(f"Error parsing module '{name}' from {file_path}: {e}")
+                return None
+            module = StaticModule(name, file_path, version, tree)
+            definitions = {qualname: node.lineno for qualname, node in module.definitions.items()}
+            imports = {}
+            for node in A.walk(tree):
+                if isinstance(node, A.ImportFrom):
+                    base = _import_base(name, module.is_package, node)
+                    if base:
+                        for alias in node.names:
+                            if alias.name != '*':
+                                imports[alias.asname or alias.name] = f"{base}.{alias.name}"
+            entry = {"definitions": definitions, "imports": imports}
+            if digest is not None:
+                cache.put('symbols', disk_key, entry)
+        return {"module": name, "version": list(version), **entry}
+
+    def update(self):
+        """重新扫描 roots, 只解析新增或变化了的文件, 然后重建 symbols"""
+        files = {}
+        for file_path, name in self._scan().items():
+            version = _file_version(file_path)
+            if version is None:
+                continue
+            entry = self._files.get(file_path)
+            if entry is None or entry["module"] != name or tuple(entry["version"]) != version:
+                entry = self._parse(file_path, name, version)
+            if entry is not None:
+                files[file_path] = entry
+        self._files = files
+        self._link()
+        return self
+
+    def _link(self):
+        self._modules = {entry["module"]: (file_path, entry) for file_path, entry in self._files.items()}
+        symbols = {}
+        for name, (_, entry) in self._modules.items():
+            for qualname in entry["definitions"]:
+                symbols[f"{name}.{qualname}"] = (name, qualname)
+        # 导入的名字指向最终的定义, 转导出可能成链, 反复处理直到不再变化
+        pending = [(f"{name}.{local}", target)
+                   for name, (_, entry) in self._modules.items()
+                   for local, target in entry["imports"].items()
+                   if local not in entry["definitions"]]
+        while pending:
+            rest = []
+            for key, target in pending:
+                found = self._lookup(target, symbols)
+                if found is not None:
+                    symbols[key] = found
+                else:
+                    rest.append((key, target))
+            if len(rest) == len(pending):
+                break
+            pending = rest
+        self.symbols = symbols
+
+    def _lookup(self, name, symbols):
+        found = symbols.get(name)
+        if found is not None:
+            return found
+        # 通过别名访问的类成员: "mod.Alias.method" -> 类定义所在模块中的 "Class.method"
+        owner, _, member = name.rpartition('.')
+        if not owner:
+            return None
+        found = self._lookup(owner, symbols)
+        if found is None:
+            return None
+        module, qualname = found
+        qualname = f"{qualname}.{member}"
+        if qualname in self._modules[module][1]["definitions"]:
+            return module, qualname
+        return None
+
+    def lookup(self, name):
+        """全限定名 name 所指的定义 (模块名, qualname), 不在工程中时返回 None"""
+        return self._lookup(name, self.symbols)
+
+    def resolve(self, full_path, module=None):
+        """调用路径 full_path 的定义, module 为调用处所在的模块, 其中定义或导入的名字优先"""
+        if module:
+            found = self.lookup(f"{module}.{full_path}")
+            if found is not None:
+                return found
+        return self.lookup(full_path)
+
+    def location(self, name):
+        """全限定名 name 所指定义的 (源文件, 行号), 不在工程中时返回 None"""
+        found = self.lookup(name)
+        if found is None:
+            return None
+        module, qualname = found
+        file_path, entry = self._modules[module]
+        return file_path, entry["definitions"][qualname]
+
+    def save(self, path):
+        data = {"version": self.VERSION, "roots": self.roots, "files": self._files}
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+        return path
+
+    @classmethod
+    def load(cls, path):
+        """读取 save 保存的符号表, 文件损坏或版本不符时返回 None"""
+        try:
+            with open(path, encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Error loading symbol index from {path}: {e}")
+            return None
+        if not isinstance(data, dict) or data.get("version") != cls.VERSION:
+            return None
+        roots, files = data.get("roots"), data.get("files")
+        if not (isinstance(roots, list) and all(isinstance(root, str) for root in roots)
+                and isinstance(files, dict) and all(map(_valid_symbol_entry, files.values()))):
+            print(f"Error loading symbol index from {path}: malformed data")
+            return None
+        index = cls()
+        index.roots = data["roots"]
+        index._files = data["files"]
+        index._link()
+        return index
+
+    def __len__(self):
+        return len(self.symbols)
+
+
+def _valid_symbol_entry(entry):
+    # SymbolIndex 保存的单个文件的条目, 结构同 SymbolIndex._parse 的返回值
+    return (isinstance(entry, dict) and isinstance(entry.get("module"), str)
+            and isinstance(entry.get("version"), list)
+            and isinstance(entry.get("definitions"), dict)
+            and all(isinstance(line, int) for line in entry["definitions"].values())
+            and isinstance(entry.get("imports"), dict)
+            and all(isinstance(target, str) for target in entry["imports"].values()))
+
+
+# 输入为str
+def get_func_ast_by_name(func_name):
+    functions = globals()
+    if func_name in functions:
+        func = functions[func_name]
+        if callable(func):
+            func_tree = ast_cache.get(func)
+            return func_tree
+        else:
+            print(ValueError(f"{func_name} is not callable."))
+            return None
+    else:
+        print(ValueError(f"Function {func_name} not found."))
+        return None
+
+# 输入为str
+def get_module_func_ast_by_name(module_name, func_name):
+    try:
+        mod = importlib.import_module(module_name)
+    except ImportError:
+        print(f"Module '{module_name}' not found.")
+        return None
+    func = getattr(mod, func_name, None)
+    if func:
+        try:
+            func_tree = ast_cache.get(func)
+            return func_tree
+        except Exception as e:
+            print(f"Error calling function '{func_name}' in module '{module_name}': {e}")
+            return None
+    else:
+        print(f"Function '{func_name}' not found in module '{module_name}'.")
+        return None
+
+# 输入为str
+def get_module_class_func_ast_by_name(module_name, class_name, func_name):
+    try:
+        mod = importlib.import_module(module_name)
+    except ImportError:
+        print(f"Module '{module_name}' not found.")
+        return None
+    func_obj = getattr(mod, class_name, None)
+    if func_obj:
+        func = getattr(func_obj, func_name, None)
+        if func:
+            try:
+                func_tree = ast_cache.get(func)
+                return func_tree
+            except Exception as e:
+                print(f"Error calling function '{func_name}' in class '{class_name}': {e}")
+                return None
+        else:
+            print(f"Function '{func_name}' not found in class '{class_name}'.")
+            return None
+    else:
+        print(f"Class '{class_name}' not found in module '{module_name}'.")
+        return None
+
+def get_function_from_string(func_path):
+    if '.' not in func_path:
+        # 处理无模块路径的情况（如 "my_func"）
+        main_module = sys.modules['__main__']
+        if hasattr(main_module, func_path):
+            return getattr(main_module, func_path)
+        else:
+            print(f"Function '{func_path}' not found in __main__ module")
+            return None
+    
+    # 分割模块/类和函数名
+    module_class, func_name = func_path.rsplit('.', 1)
+    
+    # 分割模块和类名（支持嵌套类）
+    if '.' in module_class:
+        module_name, class_name = module_class.rsplit('.', 1)
+    else:
+        module_name = module_class
+        class_name = None
+    
+    # 导入模块
+    module = importlib.import_module(module_name)
+    
+    if class_name:
+        # 获取类
+        cls = getattr(module, class_name)
+        # 从类中获取函数对象（静态方法、类方法或实例方法）
+        return getattr(cls, func_name)
+    else:
+        # 直接从模块获取函数
+        if hasattr(module, func_name):
+            return getattr(module, func_name)
+        else:
+            print(f"Function '{func_name}' not found in module '{module_name}'")
+
+
+class FunctionNotFoundError(ValueError):
+    """按路径找不到入口函数: 模块、类或函数不存在"""
+
+
+def _find_function(func_path):
+    # get_function_from_string 找不到时返回 None 或抛出 ModuleNotFoundError / AttributeError,
+    # 这里统一为 FunctionNotFoundError; 模块导入时自身抛出的错误原样传出
+    names = func_path.split('.')
+    try:
+        func = get_function_from_string(func_path)
+    except ModuleNotFoundError as e:
+        if e.name not in ['.'.join(names[:i]) for i in range(1, len(names))]:
+            raise
+        raise FunctionNotFoundError(f"Function '{func_path}' not found: {e}") from None
+    except AttributeError as e:
+        if e.name not in names:
+            raise
+        raise FunctionNotFoundError(f"Function '{func_path}' not found: {e}") from None
+    if func is None:
+        raise FunctionNotFoundError(f"Function '{func_path}' not found")
+    return func
+
+def get_attribute_fullpath(node, potential_module_map=None):
+    """
+    解析 A.Attribute 节点的完整路径，并替换别名
+    :param node: AST 节点
+    :param potential_module_map: 别名映射表（如 {"np": "numpy", "DF": "pandas.DataFrame"}）
+    :return: str
+    """
+    if potential_module_map is None:
+        potential_module_map = {}
+
+    if isinstance(node, A.Attribute):
+        # 递归处理属性链（如 df["col"].head()）
+        value = get_attribute_fullpath(node.value, potential_module_map)
+        return f"{value}.{node.attr}"
+
+    elif isinstance(node, A.Name):
+        # 优先从别名映射中查找（如 np → numpy）
+        if node.id in potential_module_map:
+            return potential_module_map[node.id]
+        # 若未找到，直接返回原始名称
+        return node.id
+    
+def render_bytes(graph=None, format='svg', engine='dot'):
+    """
+    把图直接渲染成 bytes（pdf / svg / png 等）, 不落盘: DOT 源码经管道交给布局引擎 engine
+    （dot / neato / fdp / sfdp / circo / twopi 等）, 输出从标准输出读回
+    graph 为 graphviz.Digraph / graphviz.Source / GraphIR / DOT 字符串, 默认为模块级的 dot;
+    format='dot' 返回 DOT 源码, GraphIR 还可以用 export 支持的格式（json / graphml / astg）
+    """
+    if graph is None:
+        graph = dot
+    elif isinstance(graph, str):
+        graph = graphviz.Source(graph)
+    if isinstance(graph, GraphIR):
+        if format in _exporters:
+            data = _exporters[format][0](graph)
+            return data if isinstance(data, bytes) else data.encode('utf-8')
+        graph = graph.to_digraph()
+    if format == 'dot':
+        return graph.source.encode('utf-8')
+    return graph.pipe(format=format, engine=engine)
+
+
+def _write_output(file_path, data):
+    with open(file_path, 'wb') as f:
+        f.write(data)
+    return file_path
+
+
+def reset_graph():
+    """清空模块级的 dot / class_stack / node_ids, 之后用模块级接口画的是一张新图"""
+    dot.clear()
+    class_stack.clear()
+    node_ids.clear()
+
+
+def save_ast(file_path, format='pdf', engine='dot'):
+    """path should include file name; 输出 file_path.<format>, 不生成中间的 DOT 文件"""
+    return _write_output(f"{file_path}.{format}", render_bytes(dot, format, engine))
+
+
+_DOT_ID = r'("(?:[^"\\]|\\.)*"|[\w.]+)'
+_DOT_EDGE = re.compile(r'\t*' + _DOT_ID + r' -> ' + _DOT_ID)
+_DOT_NODE = re.compile(r'\t*' + _DOT_ID + r'(?: \[|\n)')
+
+
+def _split_body(body):
+    # 顶层的 cluster_* 子图各成一组, 其余语句留在 main
+    main = []
+    pieces = []
+    depth = 0
+    for line in body:
+        stripped = line.strip()
+        opens = stripped.startswith('subgraph ') and stripped.endswith('{')
+        if depth:
+            lines.append(line)
+            if opens:
+                depth += 1
+            elif stripped == '}':
+                depth -= 1
+        elif opens and stripped[len('subgraph '):].strip('"{ ').startswith('cluster_'):
+            lines = [line]
+            pieces.append((stripped[len('subgraph '):].strip('"{ '), lines))
+            depth = 1
+        else:
+            main.append(line)
+    return main, pieces
+
+
+def _declared_nodes(lines):
+    nodes = {}
+    for line in lines:
+        if _DOT_EDGE.match(line):
+            continue
+        match = _DOT_NODE.match(line)
+        if match and match.group(1) not in ('graph', 'node', 'edge', 'subgraph'):
+            nodes.setdefault(match.group(1), line)
+    return nodes
+
+
+def split_graph(graph, file_path, format='svg', min_nodes=1):
+    """
+    把 graph 按顶层的 cluster_* 子图（With/If/For/Try 等语句块, shared_callees 模式下每个展开的函数）
+    拆成多张图, 返回 [(名字, 输出路径, 图, 节点数)], 第一项是去掉这些子图后剩下的主图
+    节点数少于 min_nodes 的子图留在主图里; 边的另一端在别的图里时画一个虚线的替身节点,
+    URL 指向那张图（svg 中可点击）
+    graph 为 graphviz.Digraph 或 GraphIR（先转成 Digraph）; DotStreamWriter 的语句已经写出, 不能拆分
+    """
+    if isinstance(graph, GraphIR):
+        graph = graph.to_digraph()
+    elif isinstance(graph, DotStreamWriter):
+        raise TypeError("cannot split a DotStreamWriter graph, its statements are already written out")
+    main, pieces = _split_body(graph.body)
+    groups = [("main", file_path, main)]
+    for name, lines in pieces:
+        if len(_declared_nodes(lines)) < min_nodes:
+            main.extend(lines)
+        else:
+            groups.append((name, file_path + '.' + re.sub(r'[^\w.-]', '_', name), lines))
+
+    declared = [_declared_nodes(lines) for _, _, lines in groups]
+    owner = {}
+    for index, nodes in enumerate(declared):
+        for node in nodes:
+            owner.setdefault(node, index)
+
+    result = []
+    for index, (name, piece_path, lines) in enumerate(groups):
+        stubs = {}
+        for line in lines:
+            match = _DOT_EDGE.match(line)
+            if match is None:
+                continue
+            for node in match.groups():
+                other = owner.get(node)
+                if other is None or other == index or node in declared[index] or node in stubs:
+                    continue
+                other_name, other_path = groups[other][:2]
+                attrs = f'style=dashed URL="{os.path.basename(other_path)}.{format}" tooltip="{other_name}"'
+                decl = declared[other][node].strip()
+                if decl.endswith(']'):
+                    stubs[node] = f"\t{decl[:-1]} {attrs}]\n"
+                else:
+                    stubs[node] = f"\t{decl} [{attrs}]\n"
+        body = list(lines) + list(stubs.values())
+        piece = graphviz.Digraph(comment=f"{graph.comment or 'AST Graph'} ({name})", body=body,
+                                 graph_attr=graph.graph_attr, node_attr=graph.node_attr,
+                                 edge_attr=graph.edge_attr)
+        result.append((name, piece_path, piece, len(declared[index])))
+    return result
+
+
+def save_split(graph, file_path, format='svg', min_nodes=1, workers=None):
+    """
+    把 graph 拆成主图和各个顶层子图（见 split_graph）, 用线程池同时运行多个 graphviz 进程渲染,
+    布局耗时随图的大小超线性增长, 拆开后总耗时明显缩短
+    另写一个 file_path.index.html 链接所有输出文件, 返回其路径
+    format 须为 dot 或 graphviz 支持的格式, json / graphml / astg 导出的是整张图, 不能拆分
+    """
+    if format in _exporters:
+        raise ValueError(f"cannot split {format!r} output, use dot or a graphviz format such as svg")
+    pieces = split_graph(graph, file_path, format, min_nodes)
+    with concurrent.futures.ThreadPoolExecutor(workers or os.cpu_count()) as pool:
+        outputs = list(pool.map(lambda piece: _render_source(piece[2].source, piece[1], format), pieces))
+    title = html.escape(os.path.basename(file_path))
+    items = "\n".join(
+        f'<li><a href="{html.escape(os.path.basename(output))}">{html.escape(name)}</a> ({count} nodes)</li>'
+        for (name, _, _, count), output in zip(pieces, outputs))
+    index_path = file_path + '.index.html'
+    with open(index_path, 'w', encoding='utf-8') as f:
+        f.write(f'<!DOCTYPE html>\n<html><head><meta charset="utf-8"><title>{title}</title></head>\n'
+                f'<body><h1>{title}</h1>\n<ul>\n{items}\n</ul></body></html>\n')
+    return index_path
+
+
+def save_ast_split(file_path, format='svg', min_nodes=1, workers=None):
+    """save_ast 的拆分版本, 渲染模块级的 dot"""
+    return save_split(dot, file_path, format, min_nodes, workers)
+
+
+_LAZY_VIEWER = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>{title}</title>
+<style>
+body {{ font-family: sans-serif; margin: 1em; }}
+section {{ border-top: 1px solid #ccc; margin-top: 1em; overflow: auto; }}
+#status {{ color: #a00; }}
+</style></head>
+<body><h1>{title}</h1>
+<p>Click a blue call node to load the called function.</p><p id="status"></p>
+<div id="fragments"></div>
+<script>
+var astViewer = (function () {{
+  var requested = {{}};
+  function show(id) {{
+    var section = document.getElementById("fragment-" + id);
+    if (section) {{ section.scrollIntoView(); return; }}
+    if (requested[id]) return;
+    requested[id] = true;
+    var script = document.createElement("script");
+    script.src = id + ".js";
+    script.onerror = function () {{
+      requested[id] = false;
+      document.getElementById("status").textContent = "function " + id + " was not generated (increase the depth)";
+    }};
+    document.head.appendChild(script);
+  }}
+  function add(id, title, svg) {{
+    var section = document.createElement("section");
+    section.id = "fragment-" + id;
+    var heading = document.createElement("h2");
+    heading.textContent = title;
+    section.appendChild(heading);
+    section.insertAdjacentHTML("beforeend", svg);
+    document.getElementById("fragments").appendChild(section);
+    section.scrollIntoView();
+  }}
+  document.addEventListener("click", function (event) {{
+    var link = event.target.closest ? event.target.closest("a") : null;
+    var href = link && (link.getAttribute("xlink:href") || link.getAttribute("href"));
+    if (href && /^#f[0-9a-f]{{12}}$/.test(href)) {{
+      event.preventDefault();
+      show(href.slice(1));
+    }}
+  }});
+  return {{show: show, add: add}};
+}})();
+astViewer.show({root});
+</script></body></html>
+"""
+
+
+class LazyGraph:
+    """
+    按需展开: 每个函数体单独生成一张只有一层的图（片段）, 调用处不展开,
+    而是标成可点击的链接, 指向被调用函数的片段（ID 为 "f" + 12 位十六进制）
+    fragment(fragment_id) 第一次被请求时才遍历对应的函数, 遍历中发现的被调用函数只登记不生成;
+    save() 写出静态的 HTML 查看页, 浏览器中点击调用节点时才加载对应片段
+    片段 ID 只由函数所在的文件、qualname 和 self 所属的类决定, 源码修改后不变,
+    refresh() 之后只有内容变化了的片段会重新生成和写出
+    options 同 add_nodes_edges（static / symbols / iterative / max_label_length 等）
+    """
+    def __init__(self, end_function_list=[], **options):
+        self.end_function_list = end_function_list
+        self.options = options
+        self.root = None
+        self._entries = {}
+        self._fragments = {}
+        self._links = {}
+        self._written = set()
+        self._output_dir = None
+        self._lock = threading.Lock()
+
+    def register(self, tree, module_map, class_stack=(), title=None):
+        """登记 tree（函数源码的 A.Module）及其解析上下文, 返回片段 ID; 同一函数在同一个类下只登记一次"""
+        func_key = getattr(tree, 'cache_key', None) or id(tree)
+        node = next(A.iter_child_nodes(tree))
+        if title is None:
+            title = func_key[3] if isinstance(func_key, tuple) else getattr(node, 'name', '')
+        # self 所属的类只影响类和方法的展开, 普通函数在哪里被调用都是同一个片段
+        cls_key = None
+        if isinstance(node, A.ClassDef) or '.' in title:
+            if class_stack:
+                cls_key = (class_stack[-1].__module__, class_stack[-1].__qualname__)
+            else:
+                cls_key = getattr(module_map, 'cls', None)
+        stable_key = (func_key[0], func_key[2], func_key[3]) if isinstance(func_key, tuple) else func_key
+        fragment_id = "f" + hashlib.sha1(repr((stable_key, cls_key)).encode('utf-8')).hexdigest()[:12]
+        with self._lock:
+            if fragment_id not in self._entries:
+                self._entries[fragment_id] = (title, tree, module_map, list(class_stack))
+        return fragment_id
+
+    def sources(self):
+        """已登记的函数所在的源文件 {文件: (mtime, size)}"""
+        sources = {}
+        with self._lock:
+            entries = list(self._entries.values())
+        for _, tree, _, _ in entries:
+            key = getattr(tree, 'cache_key', None)
+            if isinstance(key, tuple) and key[1] is not None:
+                sources.setdefault(key[0], key[1])
+        return sources
+
+    def refresh(self, files=None):
+        """
+        重新读取源文件在 files 中（None 为全部）的已登记函数, 返回内容有变化的片段 ID,
+        这些片段在下次 fragment() / save() 时重新生成; 动态模式下变化了的模块应先 importlib.reload
+        """
+        changed = []
+        with self._lock:
+            entries = list(self._entries.items())
+        for fragment_id, (title, tree, module_map, class_stack) in entries:
+            key = getattr(tree, 'cache_key', None)
+            if not isinstance(key, tuple) or (files is not None and key[0] not in files):
+                continue
+            try:
+                found = _resolve_again(tree, module_map, class_stack, self.options.get('static'))
+            except Exception as e:
+                print(f"Error reloading '{title}': {e}")
+                continue
+            if found is None:
+                continue
+            new_tree, new_map, new_stack = found
+            same = A.dump(new_tree) == A.dump(tree) and dict(new_map) == dict(module_map)
+            with self._lock:
+                self._entries[fragment_id] = (title, new_tree, new_map, new_stack)
+                if not same:
+                    self._fragments.pop(fragment_id, None)
+                    self._links.pop(fragment_id, None)
+                    self._written.discard(fragment_id)
+            if not same:
+                changed.append(fragment_id)
+        return changed
+
+    def add_function(self, func, cls=None):
+        """设置入口函数, func 是类方法时 cls 传入所属的类; 返回入口片段的 ID"""
+        self.root = self.register(dot_source_prepare(func), get_namespace(func),
+                                  [cls] if cls is not None else [])
+        return self.root
+
+    def add_path(self, func_path):
+        """按字符串路径设置入口函数, options 中 static 为真时静态解析（见 GraphBuilder.add_path）"""
+        static = self.options.get('static')
+        if not static:
+            func = _find_function(func_path)
+            return self.add_function(func, _owner_class(func))
+        if static is True:
+            self.options['static'] = static = source_index
+        target = static.resolve(func_path)
+        if target is None:
+            raise FunctionNotFoundError(f"Function '{func_path}' not found in source files")
+        self.root = self.register(*target)
+        return self.root
+
+    def title(self, fragment_id):
+        return self._entries[fragment_id][0]
+
+    def fragment(self, fragment_id):
+        """片段 fragment_id 的 GraphBuilder, 第一次请求时生成"""
+        with self._lock:
+            builder = self._fragments.get(fragment_id)
+            if builder is not None:
+                return builder
+            title, tree, module_map, class_stack = self._entries[fragment_id]
+        builder = GraphBuilder(class_stack=list(class_stack), comment=title)
+        # unfold_times=1 使调用处照常解析被调用的函数, 由 _unfold_callee 登记而不展开
+        traversal = add_nodes_edges(tree, edges_set=builder.edges_set, current_graph=builder.graph,
+                                    unfold_times=1, end_function_list=self.end_function_list,
+                                    potential_module_map=module_map, builder=builder, lazy=self,
+                                    **self.options)
+        with self._lock:
+            self._links[fragment_id] = traversal.lazy_links
+            return self._fragments.setdefault(fragment_id, builder)
+
+    def links(self, fragment_id):
+        """片段中调用处链接到的片段 ID"""
+        self.fragment(fragment_id)
+        return self._links[fragment_id]
+
+    def fragment_script(self, fragment_id, engine='dot'):
+        """查看页加载的 <fragment_id>.js 的内容: 渲染成 SVG 的片段"""
+        svg = self.fragment(fragment_id).graph.pipe(format='svg', engine=engine, encoding='utf-8')
+        svg = svg[svg.find('<svg'):]
+        return (f"astViewer.add({json.dumps(fragment_id)}, {json.dumps(self.title(fragment_id))}, "
+                f"{json.dumps(svg)});\n")
+
+    def save(self, output_dir, max_depth=None, workers=None):
+        """
+        写出 output_dir/index.html 和入口起 max_depth 层（None 为全部）调用内的函数片段,
+        每个函数只生成一次; 片段用线程池并行渲染; 返回 index.html 的路径
+        再次保存到同一目录时只写出上次之后新增或变化了的片段
+        """
+        if self.root is None:
+            raise ValueError("no entry function, call add_function / add_path first")
+        os.makedirs(output_dir, exist_ok=True)
+        if output_dir != self._output_dir:
+            self._written.clear()
+            self._output_dir = output_dir
+        seen = {self.root}
+        level = [self.root]
+        depth = 0
+        with concurrent.futures.ThreadPoolExecutor(workers or os.cpu_count()) as pool:
+            tasks = []
+            while level:
+                next_level = []
+                for fragment_id in level:
+                    self.fragment(fragment_id)
+                    if fragment_id not in self._written:
+                        tasks.append(pool.submit(self._write_fragment, output_dir, fragment_id))
+                    if max_depth is None or depth < max_depth:
+                        for callee in self._links[fragment_id]:
+                            if callee not in seen:
+                                seen.add(callee)
+                                next_level.append(callee)
+                level = next_level
+                depth += 1
+            for task in tasks:
+                task.result()
+        index_path = os.path.join(output_dir, 'index.html')
+        with open(index_path, 'w', encoding='utf-8') as f:
+            f.write(self.viewer_html())
+        return index_path
+
+    def viewer_html(self):
+        """查看页 index.html 的内容, 从同一目录加载 <片段 ID>.js"""
+        return _LAZY_VIEWER.format(title=html.escape(self.title(self.root)), root=json.dumps(self.root))
+
+    def _write_fragment(self, output_dir, fragment_id):
+        with open(os.path.join(output_dir, fragment_id + '.js'), 'w', encoding='utf-8') as f:
+            f.write(self.fragment_script(fragment_id))
+        with self._lock:
+            self._written.add(fragment_id)
+
+
+# 格式名 -> (导出函数 GraphIR -> str/bytes, 文件扩展名)
+_exporters = {}
+
+
+def register_exporter(format, exporter=None, extension=None):
+    """
+    注册 GraphIR 的导出格式, exporter(ir) 返回 str 或 bytes, extension 默认同 format
+    可作为装饰器使用: @register_exporter('csv')
+    """
+    if exporter is None:
+        return lambda func: register_exporter(format, func, extension)
+    _exporters[format] = (exporter, extension or format)
+    return exporter
+
+
+def export(ir, file_path, format='json'):
+    """把 GraphIR 按 format 写到 file_path.<扩展名>, 返回输出文件路径"""
+    if format not in _exporters:
+        raise ValueError(f"Unknown export format {format!r}, expected one of {sorted(_exporters)}")
+    exporter, extension = _exporters[format]
+    data = exporter(ir)
+    output = f"{file_path}.{extension}"
+    if isinstance(data, bytes):
+        with open(output, 'wb') as f:
+            f.write(data)
+    else:
+        with open(output, 'w', encoding='utf-8') as f:
+            f.write(data)
+    return output
+
+
+@register_exporter('json')
+def ir_to_json(ir):
+    return json.dumps({
+        "comment": ir.comment,
+        "graph_attrs": ir.graph_attrs,
+        "clusters": [{"name": name, "parent": parent, "attrs": attrs}
+                     for name, parent, attrs in ir.clusters()],
+        "nodes": [{"id": name, "label": label, "cluster": cluster, "attrs": attrs}
+                  for name, label, cluster, attrs in ir.nodes()],
+        "edges": [{"source": tail, "target": head, "label": label, "cluster": cluster, "attrs": attrs}
+                  for tail, head, label, cluster, attrs in ir.edges()],
+    }, ensure_ascii=False)
+
+
+@register_exporter('graphml')
+def ir_to_graphml(ir):
+    ns = "http://graphml.graphdrawing.org/xmlns"
+    root = ET.Element("graphml", xmlns=ns)
+    for key_id, domain, name in (("d0", "node", "label"), ("d1", "node", "cluster"),
+                                 ("d2", "edge", "label"), ("d3", "edge", "cluster")):
+        ET.SubElement(root, "key", {"id": key_id, "for": domain, "attr.name": name, "attr.type": "string"})
+    graph = ET.SubElement(root, "graph", id="G", edgedefault="directed")
+
+    def add_data(element, key, value):
+        if value is not None:
+            ET.SubElement(element, "data", key=key).text = str(value)
+
+    declared = set()
+    for name, label, cluster, _ in ir.nodes():
+        element = ET.SubElement(graph, "node", id=name)
+        add_data(element, "d0", label)
+        add_data(element, "d1", cluster)
+        declared.add(name)
+    edges = list(ir.edges())
+    # graphviz 会隐式创建只出现在边里的节点, GraphML 需要显式声明
+    for tail, head, _, _, _ in edges:
+        for name in (tail, head):
+            if name not in declared:
+                ET.SubElement(graph, "node", id=name)
+                declared.add(name)
+    for index, (tail, head, label, cluster, _) in enumerate(edges):
+        element = ET.SubElement(graph, "edge", id=f"e{index}", source=tail, target=head)
+        add_data(element, "d2", label)
+        add_data(element, "d3", cluster)
+    return ET.tostring(root, encoding="unicode", xml_declaration=True)
+
+
+_ASTG_MAGIC = b"ASTG"
+_ASTG_VERSION = 1
+
+
+def _write_uvarint(out, value):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_uvarint(data, pos):
+    result = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+@register_exporter('astg')
+def ir_to_binary(ir):
+    """
+    紧凑二进制格式: b"ASTG" + 版本号, 之后全部是无符号 varint
+    所有字符串（ID、标签、属性）放进一张字符串表, 记录中只存下标, 可选字符串存 下标 + 1（0 表示无）
+    顺序: 字符串表, 注释, 图属性, cluster(名字, 上层, 属性), 节点(ID, 标签, cluster, 属性),
+    边(起点, 终点, 标签, cluster, 属性); 属性为 个数 + (键, 值)*
+    直接读取 GraphIR 的内部数组, 不逐条解码
+    """
+    # 直接沿用 GraphIR 的字符串表: 表内下标 i 在文件中为 i - 1, 可选字符串正好存 i
+    strings = ir._strings[1:]
+    string_ids = ir._string_ids
+    extra = {}
+
+    def ref(value):
+        index = string_ids.get(value)
+        if index is not None:
+            return index - 1
+        index = extra.get(value)
+        if index is None:
+            index = extra[value] = len(strings)
+            strings.append(value)
+        return index
+
+    def opt(value):
+        return 0 if value is None else ref(value) + 1
+
+    records = array('I')
+
+    def put_attrs(attrs):
+        records.append(len(attrs))
+        for key, value in attrs.items():
+            records.append(ref(key))
+            records.append(ref(value))
+
+    def put_packed(packed):
+        records.append(len(packed) // 2)
+        records.extend(index - 1 for index in packed)
+
+    records.append(opt(ir.comment))
+    put_attrs(ir.graph_attrs)
+    clusters = list(ir.clusters())
+    records.append(len(clusters))
+    for name, parent, attrs in clusters:
+        records.extend((ref(name), opt(parent)))
+        put_attrs(attrs)
+    records.append(len(ir._nodes))
+    for name, record in ir._nodes.items():
+        records.extend((ref(name), record.label, record.cluster))
+        put_packed(record.attrs)
+    records.append(ir.edge_count())
+    edge_attrs = ir._edge_attrs
+    for index, (tail, head, label, cluster) in enumerate(zip(
+            ir._edge_tails, ir._edge_heads, ir._edge_labels, ir._edge_clusters)):
+        records.extend((tail - 1, head - 1, label, cluster))
+        put_packed(edge_attrs.get(index, ()))
+
+    out = bytearray(_ASTG_MAGIC)
+    out.append(_ASTG_VERSION)
+    _write_uvarint(out, len(strings))
+    for value in strings:
+        encoded = str(value).encode('utf-8')
+        _write_uvarint(out, len(encoded))
+        out += encoded
+    for value in records:
+        _write_uvarint(out, value)
+    return bytes(out)
+
+
+def load_binary(data):
+    """读回 ir_to_binary 的输出, 返回 GraphIR"""
+    if data[:4] != _ASTG_MAGIC or data[4] != _ASTG_VERSION:
+        raise ValueError("not an ASTG graph (or unsupported version)")
+    pos = 5
+    count, pos = _read_uvarint(data, pos)
+    strings = []
+    for _ in range(count):
+        length, pos = _read_uvarint(data, pos)
+        strings.append(data[pos:pos + length].decode('utf-8'))
+        pos += length
+
+    def read():
+        nonlocal pos
+        value, pos = _read_uvarint(data, pos)
+        return value
+
+    def read_opt():
+        value = read()
+        return None if value == 0 else strings[value - 1]
+
+    def read_attrs():
+        return {strings[read()]: strings[read()] for _ in range(read())}
+
+    ir = GraphIR(read_opt())
+    ir.graph_attrs = read_attrs()
+    for _ in range(read()):
+        name, parent = strings[read()], read_opt()
+        ir._clusters[name] = [parent, read_attrs()]
+    for _ in range(read()):
+        name, label, cluster = strings[read()], read_opt(), read_opt()
+        ir._node(cluster, name, label, read_attrs())
+    for _ in range(read()):
+        tail, head, label, cluster = strings[read()], strings[read()], read_opt(), read_opt()
+        ir._edge(cluster, tail, head, label, read_attrs())
+    return ir
+
+def build_alias_map(tree):
+    alias_map = {}
+
+    for node in A.walk(tree):
+        if isinstance(node, A.Import):
+            for alias in node.names:
+                if alias.asname:
+                    alias_map[alias.asname] = alias.name
+        elif isinstance(node, A.ImportFrom):
+            module = getattr(node, 'module', None)
+            if not module:
+                continue  # 跳过无效模块
+            for alias in node.names:
+                if alias.asname:
+                    alias_map[alias.asname] = f"{module}.{alias.name}"
+                else:
+                    full_name = f"{module}.{alias.name}"
+                    alias_map[alias.name] = full_name
+
+    return alias_map
+
+
+def _owner_class(func):
+    """func 为类中定义的方法时返回所属的类, 否则返回 None"""
+    qualname = getattr(func, '__qualname__', '')
+    if '.' not in qualname or '<locals>' in qualname:
+        return None
+    obj = sys.modules.get(getattr(func, '__module__', None))
+    for part in qualname.split('.')[:-1]:
+        obj = getattr(obj, part, None)
+    return obj if inspect.isclass(obj) else None
+
+
+def _traverse_entry(func_path, format, unfold_times, end_function_list, options):
+    # 导出格式不需要 graphviz, 直接填充 GraphIR
+    builder = GraphBuilder(GraphIR() if format in _exporters else None)
+    traversal = builder.add_path(func_path, unfold_times, end_function_list, **options)
+    return builder, traversal
+
+
+def build_entry(func_path, output_dir=".", format='pdf', unfold_times=2,
+                end_function_list=[], split=False, **options):
+    """
+    为单个入口函数（"module.func" / "module.Class.method"）生成一张图并保存到
+    output_dir/<func_path>.<format>, 失败时打印错误, 不抛出
+    format 为 json / graphml / astg 时导出 GraphIR, 不经过 graphviz
+    split=True 时按顶层子图拆成多个文件（见 save_split）, output 为索引页
+    返回 {"path", "output", "stats", "error"}
+    """
+    result = {"path": func_path, "output": None, "stats": None, "error": None}
+    try:
+        builder, traversal = _traverse_entry(func_path, format, unfold_times, end_function_list, options)
+        result["stats"] = traversal.stats()
+        file_path = os.path.join(output_dir, func_path)
+        if split:
+            result["output"] = builder.save_split(file_path, format)
+        else:
+            result["output"] = builder.save(file_path, format)
+    except Exception as e:
+        print(f"Failed to build graph for '{func_path}': {e}")
+        result["error"] = f"{type(e).__name__}: {e}"
+    return result
+
+
+def build_batch(func_paths, output_dir=".", format='pdf', unfold_times=2,
+                end_function_list=[], split=False, **options):
+    """
+    为多个入口函数各生成一张图, 每个入口一个输出文件, 参数同 build_entry / add_nodes_edges
+    同一进程内依次处理, 源码解析（ast_cache）和命名空间的缓存在各入口之间共享
+    返回与 func_paths 顺序一致的结果列表
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    return [build_entry(func_path, output_dir, format, unfold_times, end_function_list, split, **options)
+            for func_path in func_paths]
+
+
+def build_lazy(func_path, output_dir=".", unfold_times=2, end_function_list=[], **options):
+    """
+    按需展开的查看页: output_dir/<func_path>/index.html, 预先生成入口起 unfold_times 层调用内的函数片段
+    （每个函数只生成一次）, 见 LazyGraph; 返回值同 build_entry
+    """
+    result = {"path": func_path, "output": None, "stats": None, "error": None}
+    try:
+        lazy = LazyGraph(end_function_list, **options)
+        lazy.add_path(func_path)
+        result["output"] = lazy.save(os.path.join(output_dir, func_path), unfold_times)
+        result["stats"] = {"fragments": len(lazy._fragments)}
+    except Exception as e:
+        print(f"Failed to build graph for '{func_path}': {e}")
+        result["error"] = f"{type(e).__name__}: {e}"
+    return result
+
+
+def _resolve_again(tree, module_map, class_stack, static=None):
+    """
+    源文件修改后按 tree.cache_key 中原来的模块名和 qualname 重新取得 (函数源码的 AST, 命名空间, 类调用栈)
+    static 为 SourceIndex 时静态解析, 定义已不存在时返回 None; 动态模式下应先 importlib.reload 变化了的模块
+    """
+    module_name, qualname = tree.cache_key[2], tree.cache_key[3]
+    if static:
+        module = static.module(module_name)
+        if module is None or qualname not in module.definitions:
+            return None
+        return static._target(module, qualname, getattr(module_map, 'cls', None)) + (class_stack,)
+    _, obj = _import_qualname(module_name, qualname)
+    class_stack = [_import_qualname(cls.__module__, cls.__qualname__)[1] for cls in class_stack]
+    return dot_source_prepare(obj), get_namespace(obj), class_stack
+
+
+def _module_outline(file_path):
+    """
+    源文件中可以从模块外引用的名字: 定义的函数和类（包括类的成员, 如 "Class.method"）、
+    import 引入的名字和模块层赋值的变量; 无法读取或解析时返回 None
+    这些名字不变时, 其他文件中的调用解析到的目标也不变
+    """
+    try:
+        with open(file_path, 'rb') as f:
+            tree = A.parse(f.read())
+    except (OSError, SyntaxError, ValueError):
+        return None
+    names = set()
+    pending = [("", tree.body)]
+    while pending:
+        prefix, body = pending.pop()
+        for node in body:
+            if isinstance(node, (A.FunctionDef, A.AsyncFunctionDef)):
+                names.add(prefix + node.name)
+            elif isinstance(node, A.ClassDef):
+                names.add(prefix + node.name)
+                pending.append((f"{prefix}{node.name}.", node.body))
+            elif isinstance(node, (A.Import, A.ImportFrom)):
+                names.update(prefix + (alias.asname or alias.name) for alias in node.names)
+            elif isinstance(node, (A.Assign, A.AnnAssign, A.AugAssign)):
+                targets = node.targets if isinstance(node, A.Assign) else [node.target]
+                names.update(prefix + name.id for target in targets
+                             for name in A.walk(target) if isinstance(name, A.Name))
+            else:
+                # if / try / with 等语句块中的定义（如按条件导入）
+                for field in ('body', 'orelse', 'finalbody', 'handlers', 'cases'):
+                    block = getattr(node, field, None)
+                    if isinstance(block, list):
+                        pending.append((prefix, [child for child in block if isinstance(child, A.AST)]))
+    return frozenset(names)
+
+
+def _reload_modules(files):
+    """重新导入源文件在 files 中的已导入模块（__main__ 除外）, 返回模块名列表"""
+    files = {os.path.abspath(file_path) for file_path in files}
+    reloaded = []
+    for name, mod in list(sys.modules.items()):
+        file_path = getattr(mod, '__file__', None)
+        if name == '__main__' or not file_path or os.path.abspath(file_path) not in files:
+            continue
+        try:
+            importlib.reload(mod)
+            reloaded.append(name)
+        except Exception as e:
+            print(f"Error reloading module '{name}': {e}")
+    return reloaded
+
+
+class GraphWatcher:
+    """
+    watch 模式: 为各入口生成图并记录图依赖的源文件（Traversal.sources / LazyGraph.sources）,
+    poll() 检查这些文件, 只重新生成依赖了变化文件的入口
+    图保存在 GraphIR 中并记录每次函数展开的范围（UnfoldSpan）, 文件变化后只重新展开其中定义的函数,
+    替换图中原来的那一段再输出; 入口函数所在的文件变化、文件中定义或导入的名字有增减,
+    或使用了 shared_callees / max_nodes / max_edges / deadline（展开结果与整张图有关）时整体重新遍历
+    lazy=True 时每个入口是一个 LazyGraph, 只重新遍历和写出源码有变化的函数片段, 其余片段保持不动
+    动态模式下变化了的模块先 importlib.reload, 静态模式由 SourceIndex 按文件版本重新解析
+    其余参数同 build_entry / build_lazy
+    """
+    def __init__(self, func_paths, output_dir=".", format='pdf', unfold_times=2,
+                 end_function_list=[], split=False, lazy=False, **options):
+        self.func_paths = list(func_paths)
+        self.output_dir = output_dir
+        self.format = format
+        self.unfold_times = unfold_times
+        self.end_function_list = end_function_list
+        self.split = split
+        self.lazy = lazy
+        self.options = options
+        self.results = {}
+        self._sources = {}
+        self._lazy = {}
+        # 入口 -> (GraphBuilder, [UnfoldSpan], 依赖的源文件 {文件: (mtime, size)}, {文件: _module_outline})
+        self._graphs = {}
+        self._splicing = not (options.get('shared_callees') or options.get('max_nodes') is not None
+                              or options.get('max_edges') is not None or options.get('deadline') is not None)
+
+    def _static(self):
+        static = self.options.get('static')
+        return source_index if static is True else static or None
+
+    def _traverse(self, func_path):
+        # 整体遍历入口, 返回 (图, 统计信息, 依赖的源文件)
+        if not self._splicing:
+            builder, traversal = _traverse_entry(func_path, self.format, self.unfold_times,
+                                                 self.end_function_list, dict(self.options))
+            return builder.graph, traversal.stats(), traversal.sources
+        builder = GraphBuilder(GraphIR())
+        spans = []
+        traversal = builder.add_path(func_path, self.unfold_times, self.end_function_list,
+                                     spans=spans, **self.options)
+        sources = dict(traversal.sources)
+        if sources and traversal.truncated_by is None:
+            self._graphs[func_path] = (builder, spans, sources,
+                                       {file_path: _module_outline(file_path) for file_path in sources})
+        return builder.graph, traversal.stats(), sources
+
+    def _splice(self, func_path, changed):
+        """
+        只重新展开 changed 中的文件里定义的函数, 替换 GraphIR 中它们原来的那一段, 返回 (图, 统计信息, 依赖的源文件);
+        不能局部重建时返回 None, 由调用方整体重新遍历
+        """
+        entry = self._graphs.pop(func_path, None)
+        if entry is None:
+            return None
+        builder, spans, sources, outlines = entry
+        changed = changed & sources.keys()
+        # 第一个源文件是入口函数所在的文件（add_nodes_edges 最先记录）
+        if next(iter(sources)) in changed:
+            return None
+        for file_path in changed:
+            outline = _module_outline(file_path)
+            if outline is None or outline != outlines.get(file_path):
+                return None
+        affected = [span for span in spans
+                    if getattr(span.tree, 'cache_key', (None,))[0] in changed]
+        outermost = [span for span in affected
+                     if not any(other is not span and other.contains(span) for other in affected)]
+        try:
+            for span in outermost:
+                spans = self._replay(builder, spans, span, sources)
+                if spans is None:
+                    return None
+        except Exception as e:
+            print(f"Error updating '{func_path}' in place, rebuilding it: {e}")
+            return None
+        for file_path in changed:
+            sources[file_path] = _file_version(file_path)
+        self._graphs[func_path] = (builder, spans, sources, outlines)
+        ir = builder.graph
+        stats = {"nodes": len(ir), "edges": ir.edge_count(), "unfolded_calls": len(spans),
+                 "spliced": len(outermost)}
+        return ir, stats, sources
+
+    def _replay(self, builder, spans, span, sources):
+        # 在原处重新展开 span 对应的函数, 替换 GraphIR 中原来的那一段; 返回更新后的 spans
+        static = self._static()
+        found = _resolve_again(span.tree, span.module_map, span.class_stack, static)
+        if found is None:
+            return None
+        tree, module_map, class_stack = found
+        ir = builder.graph
+        strings = ir._strings
+        for index in range(span.start[1], span.end[1]):
+            # 这一段的边即将删除, 不再参与去重
+            builder.edges_set.discard((strings[ir._edge_tails[index]], strings[ir._edge_heads[index]]))
+        mark = ir._position()
+        replay = Traversal(ir, False, span.unfold_stack is not None, builder.edges_set,
+                           builder=builder, static=static, symbols=self.options.get('symbols'), spans=[])
+        if span.unfold_stack is not None:
+            replay.unfold_stack.extend(span.unfold_stack)
+        graph = ir if span.cluster is None else _GraphIRView(ir, span.cluster)
+        visit = _expand_callee(tree, module_map, span.call_site, builder.edges_set, list(span.loop_stack),
+                               span.prefix, graph, span.unfold_times, span.end_function_list, replay)
+        saved = list(builder.class_stack)
+        builder.class_stack[:] = class_stack
+        token = _label_limit.set(self.options.get('max_label_length'))
+        try:
+            if self.options.get('iterative'):
+                _walk_iterative(visit, replay)
+            else:
+                _walk_recursive(visit, replay)
+        finally:
+            _label_limit.reset(token)
+            builder.class_stack[:] = saved
+        total = ir._position()
+        ir._splice(span.start, span.end, mark)
+        sources.update(replay.sources)
+
+        def shifted(position):
+            return tuple(b - (end - start) + (last - new) for b, start, end, new, last
+                         in zip(position, span.start, span.end, mark, total))
+        kept = []
+        for other in spans:
+            if span.contains(other):
+                continue
+            if other.contains(span):
+                other.end = shifted(other.end)
+            elif other.start[0] >= span.end[0]:
+                other.start, other.end = shifted(other.start), shifted(other.end)
+            kept.append(other)
+        for new in replay.spans:
+            new.start = tuple(b - m + s for b, m, s in zip(new.start, mark, span.start))
+            new.end = tuple(b - m + s for b, m, s in zip(new.end, mark, span.start))
+        return sorted(kept + replay.spans, key=lambda other: other.start[0])
+
+    def build(self, func_paths=None, changed=None):
+        """生成 func_paths（默认全部）的图, changed 为变化了的源文件; 返回结果列表（同 build_entry）"""
+        os.makedirs(self.output_dir, exist_ok=True)
+        results = []
+        for func_path in self.func_paths if func_paths is None else func_paths:
+            result = {"path": func_path, "output": None, "stats": None, "error": None}
+            file_path = os.path.join(self.output_dir, func_path)
+            try:
+                if self.lazy:
+                    lazy = self._lazy.get(func_path)
+                    if lazy is None:
+                        lazy = LazyGraph(self.end_function_list, **self.options)
+                        lazy.add_path(func_path)
+                        self._lazy[func_path] = lazy
+                        refreshed = None
+                    else:
+                        refreshed = lazy.refresh(changed)
+                    result["output"] = lazy.save(file_path, self.unfold_times)
+                    result["stats"] = {"fragments": len(lazy._fragments),
+                                       "refreshed": None if refreshed is None else len(refreshed)}
+                    sources = lazy.sources()
+                else:
+                    found = self._splice(func_path, changed) if changed is not None else None
+                    graph, result["stats"], sources = found or self._traverse(func_path)
+                    result["output"] = _render_graph(graph, file_path, self.format, self.split)
+                self._sources[func_path] = sources
+            except Exception as e:
+                print(f"Failed to build graph for '{func_path}': {e}")
+                result["error"] = f"{type(e).__name__}: {e}"
+                # 失败的入口在任何文件变化后都重试
+                self._sources.pop(func_path, None)
+            self.results[func_path] = result
+            results.append(result)
+        return results
+
+    def changed_files(self):
+        """依赖的源文件中 (mtime, size) 与生成时不同的文件"""
+        changed = set()
+        for sources in self._sources.values():
+            for file_path, version in sources.items():
+                if _file_version(file_path) != version:
+                    changed.add(file_path)
+        return changed
+
+    def poll(self):
+        """检查一次依赖的源文件, 重新生成受影响的入口, 返回它们的结果列表"""
+        changed = self.changed_files()
+        if not changed:
+            return []
+        if not self.options.get('static'):
+            _reload_modules(changed)
+        symbols = self.options.get('symbols')
+        if symbols is not None:
+            symbols.update()
+        func_paths = [func_path for func_path in self.func_paths
+                      if func_path not in self._sources or not changed.isdisjoint(self._sources[func_path])]
+        return self.build(func_paths, changed)
+
+    def watch(self, interval=1.0, rounds=None):
+        """每 interval 秒 poll 一次, 直到 Ctrl-C（或 rounds 次之后）"""
+        count = 0
+        try:
+            while rounds is None or count < rounds:
+                time.sleep(interval)
+                count += 1
+                results = self.poll()
+                if results:
+                    failed = sum(1 for result in results if result["error"] is not None)
+                    print(f"{len(results) - failed} graph(s) regenerated, {failed} failed")
+        except KeyboardInterrupt:
+            pass
+
+
+_CONTENT_TYPES = {
+    'dot': 'text/vnd.graphviz; charset=utf-8', 'json': 'application/json', 'graphml': 'application/xml',
+    'svg': 'image/svg+xml', 'pdf': 'application/pdf', 'png': 'image/png', 'html': 'text/html; charset=utf-8',
+    'js': 'text/javascript; charset=utf-8',
+}
+
+# 请求中可以给出的 add_nodes_edges 选项
+_REQUEST_OPTIONS = ('static', 'iterative', 'shared_callees', 'detect_cycles', 'max_nodes', 'max_edges',
+                    'deadline', 'max_label_length')
+
+
+class BadRequest(ValueError):
+    """GraphServer 请求的参数缺失或不合法"""
+
+
+class _PooledHTTPServer(http.server.HTTPServer):
+    """每个连接交给固定大小的线程池处理"""
+    daemon_threads = True
+
+    def __init__(self, address, handler, workers):
+        self.pool = concurrent.futures.ThreadPoolExecutor(workers)
+        super().__init__(address, handler)
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self._process, request, client_address)
+
+    def _process(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown(wait=False)
+
+
+class _GraphRequestHandler(http.server.BaseHTTPRequestHandler):
+    server_version = "ast_generator"
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        if url.path == '/stats':
+            self._reply(200, json.dumps(self.server.graph_server.stats()).encode('utf-8'), 'json')
+        elif url.path == '/graph':
+            params = {key: values[-1] for key, values in urllib.parse.parse_qs(url.query).items()}
+            self._graph(params)
+        elif url.path.startswith('/view/'):
+            self._view(urllib.parse.unquote(url.path[len('/view/'):]))
+        else:
+            self._error(404, f"unknown path {url.path}")
 
+    def do_POST(self):
+        if urllib.parse.urlsplit(self.path).path != '/graph':
+            self._error(404, f"unknown path {self.path}")
+            return
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+            params = json.loads(self.rfile.read(length) or b'{}')
+            if not isinstance(params, dict):
+                raise ValueError("request body must be a JSON object")
+        except ValueError as e:
+            self._error(400, f"bad request: {e}")
+            return
+        self._graph(params)
 
+    def _graph(self, params):
+        try:
+            data, format, stats = self.server.graph_server.render(params)
+        except BadRequest as e:
+            self._error(400, str(e))
+        except FunctionNotFoundError as e:
+            self._error(404, str(e))
+        except Exception as e:
+            self._error(500, f"{type(e).__name__}: {e}")
+        else:
+            self._reply(200, data, format, {"X-Graph-Stats": json.dumps(stats)})
 
+    def _view(self, rest):
+        # /view/<func_path>/ 为查看页, /view/<func_path>/<片段 ID>.js 为按需生成的片段
+        func_path, _, name = rest.partition('/')
+        try:
+            lazy = self.server.graph_server.lazy_graph(func_path)
+            if not name:
+                self._reply(200, lazy.viewer_html().encode('utf-8'), 'html')
+            elif name.endswith('.js') and name[:-3] in lazy._entries:
+                self._reply(200, lazy.fragment_script(name[:-3]).encode('utf-8'), 'js')
+            else:
+                self._error(404, f"unknown fragment {name}")
+        except FunctionNotFoundError as e:
+            self._error(404, str(e))
+        except Exception as e:
+            self._error(500, f"{type(e).__name__}: {e}")
 
+    def _reply(self, status, data, format, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', _CONTENT_TYPES.get(format, 'application/octet-stream'))
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
 
+    def _error(self, status, message):
+        self._reply(status, json.dumps({"error": message}).encode('utf-8'), 'json')
 
+    def log_message(self, format, *args):
+        if self.server.graph_server.verbose:
+            super().log_message(format, *args)
 
 
+class GraphServer:
+    """
+    常驻进程: 在本地端口上提供 HTTP 接口, 解析缓存（ast_cache / 命名空间 / SymbolIndex / disk_cache）
+    和已导入的目标模块在请求之间保持, 短请求不再付出启动和首次解析的开销
+    POST /graph  JSON {"path": "module.func", "format": "dot", "unfold_times": 2,
+                       "end_function_list": [...], 以及 static / max_nodes 等 add_nodes_edges 选项}
+    GET  /graph?path=module.func&format=svg&unfold_times=1  同上（参数为查询字符串）
+         返回图的内容（dot / json / graphml / astg 或 graphviz 支持的格式）, 统计信息在 X-Graph-Stats 头中;
+         engine 选择布局引擎（默认 dot）, 渲染在内存中完成, 不写临时文件
+    GET  /view/module.func/  按需展开的查看页（见 LazyGraph）, 片段在第一次被点开时才生成
+    GET  /stats  缓存和请求计数
+    参数缺失或不合法返回 400, 找不到入口函数返回 404, 其他错误返回 500, 内容均为 {"error": 说明}
+    请求由 workers 个线程并发处理, 每个请求使用自己的 GraphBuilder; defaults 为各请求的默认选项
+    查看页的 LazyGraph 只保留最近使用的 max_lazy_graphs 个
+    """
+    def __init__(self, host='127.0.0.1', port=8765, workers=None, end_function_list=[], symbols=None,
+                 verbose=False, max_lazy_graphs=32, **defaults):
+        self.end_function_list = end_function_list
+        self.symbols = symbols
+        self.verbose = verbose
+        self.max_lazy_graphs = max_lazy_graphs
+        self.defaults = defaults
+        self.requests = 0
+        self.errors = 0
+        self._lazy = OrderedDict()
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self.httpd = _PooledHTTPServer((host, port), _GraphRequestHandler, workers or os.cpu_count())
+        self.httpd.graph_server = self
 
-def get_label(node, potential_module_map=None):
-    if potential_module_map is None:
-        potential_module_map = {}
-    if isinstance(node, A.Compare):
-        left = get_label(node.left)
-        parts = []
-        for op, comp in zip(node.ops, node.comparators):
-            op_symbol = get_op_label(op)
-            comp_expr = get_label(comp)
-            parts.append(f"{op_symbol} {comp_expr}")
-        return f"{left} {' '.join(parts)}"
-    
-    if isinstance(node, A.Assign):
-        targets = ', '.join(get_label(target) for target in node.targets)
-        value = get_label(node.value)
-        return f"{targets} = {value}"
-    
-    if isinstance(node, A.BinOp):
-        # 处理二元运算（如 a + b）
-        left = get_label(node.left)
-        op = get_op_label(node.op)
-        right = get_label(node.right)
-        return f"{left} {op} {right}"
-    
-    if isinstance(node, A.UnaryOp):
-        # 处理一元运算（如 -x）
-        op = get_op_label(node.op)
-        operand = get_label(node.operand)
-        return f"{op}{operand}"
-
-    if isinstance(node, A.Call):
-        # 处理函数调用（如 func(arg)）
-        func = get_label(node.func, potential_module_map)
-        args = ', '.join(get_label(arg, potential_module_map) for arg in node.args)
-        return f"{func}({args})"
-    
-    if isinstance(node, A.Name):
-        # 处理变量名
-        return potential_module_map.get(node.id, node.id)
-    if isinstance(node, A.BoolOp):
-        # 处理布尔操作（如 a or b）
-        op_symbol = ' ' + get_op_label(node.op) + ' '
-        values = [get_label(value) for value in node.values]
-        return f"{op_symbol.join(values)}"
-    
-    if isinstance(node, A.Constant):
-        # 处理常量值
-        return  repr(node.value)
-    
-    if isinstance(node, A.Attribute):
-        # 处理属性访问（如 obj.attr）
-        value = get_label(node.value, potential_module_map)
-        return f"{value}.{node.attr}"
-    
-    if isinstance(node, A.For):
-        target = get_label(node.target)
-        iter_expr = get_label(node.iter)
-        return f"For {target} in {iter_expr}"
-    if isinstance(node, A.While):
-        condition = get_label(node.test)
-        return f"While {condition}"
-    if isinstance(node, A.Match):
-        subject = get_label(node.subject)
-        cases = []
-        for case in node.cases:
-            pattern = get_label(case.pattern)
-            guard = get_label(case.guard) if case.guard else None
-            body = [get_label(stmt) for stmt in case.body]
-            case_str = f"case {pattern}"
-            if guard:
-                case_str += f" if {guard}"
-            case_str += ": " + "; ".join(body)
-            cases.append(case_str)
-        return f"match {subject}:\n  " + "\n  ".join(cases)
-    if isinstance(node, A.MatchValue):
-        return f"MatchValue: {get_label(node.value)}"
-    if isinstance(node, A.MatchSequence):
-        elements = ', '.join(get_label(element) for element in node.patterns)
-        return f"MatchSequence: [{elements}]"
-    if isinstance(node, A.MatchMapping):
-        keys = ', '.join(get_label(key) for key in node.keys)
-        values = ', '.join(get_label(value) for value in node.patterns)
-        return f"MatchMapping: {{{keys}: {values}}}"
-    if isinstance(node, A.MatchClass):
-        class_name = get_label(node.cls)
-        patterns = ', '.join(get_label(pattern) for pattern in node.patterns)
-        return f"MatchClass: {class_name}({patterns})"
-    if isinstance(node, A.MatchStar):
-        name = get_label(node.name) if node.name else "*"
-        return f"MatchStar: {name}"
-    if isinstance(node, A.MatchAs):
-        name = get_label(node.name) if node.name else "_"
-        return f"MatchAs: {name}"
-    if isinstance(node, A.MatchOr):
-        patterns = ' | '.join(get_label(pattern) for pattern in node.patterns)
-        return f"MatchOr: {patterns}"
-    if isinstance(node, A.List):
-        return '[' + ', '.join(get_label(value) for value in node.elts) + ']'
-    if isinstance(node, A.Tuple):
-        return '(' + ', '.join(get_label(value) for value in node.elts) + ')'
-    if isinstance(node, A.Set):
-        return '{' + ', '.join(get_label(value) for value in node.elts) + '}'
-    if isinstance(node, A.Dict):
-        items = [f"{get_label(key)}: {get_label(value)}" for key, value in zip(node.keys, node.values)]
-        return '{' + ', '.join(items) + '}'
-    # 添加其他需要处理的节点类型...
-    else:
-        # 默认返回类名
-        return node.__class__.__name__
+    @property
+    def address(self):
+        return self.httpd.server_address[:2]
 
+    def _options(self, params):
+        options = dict(self.defaults)
+        for name in _REQUEST_OPTIONS:
+            if name in params:
+                options[name] = params[name]
+        for name in ('static', 'iterative', 'shared_callees', 'detect_cycles'):
+            if isinstance(options.get(name), str):
+                options[name] = options[name].lower() in ('1', 'true', 'yes')
+        for name in ('max_nodes', 'max_edges', 'max_label_length'):
+            if options.get(name) is not None:
+                options[name] = int(options[name])
+        if options.get('deadline') is not None:
+            options['deadline'] = float(options['deadline'])
+        if self.symbols is not None:
+            options['symbols'] = self.symbols
+        return options
 
-def get_op_label(op):
-    """将 AST 操作符转换为符号"""
-    op_type = type(op)
-    return {
-        A.Add: '+',
-        A.Sub: '-',
-        A.Mult: '*',
-        A.Div: '/',
-        A.Eq: '==',
-        A.NotEq: '!=',
-        A.Lt: '<',
-        A.LtE: '<=',
-        A.Gt: '>',
-        A.GtE: '>=',
-        A.And: 'and',
-        A.Or: 'or',
-        A.Not: 'not',
-        A.USub: '-',  
-        A.Or: 'or',
-        A.In: 'in',
-        A.NotIn: 'not in',
-        A.Is: 'is',
-        A.IsNot: 'is not',
-        A.Invert: '~',
-        A.BitAnd: '&',
-        A.BitOr: '|',
-        A.FloorDiv: '//',
-        A.Mod: '%',
-        A.Pow: '**',
-        A.MatMult: '@',
-        A.BitXor: '^',
-        A.FloorDiv: '//',
-        A.LShift: '<<',
-        A.RShift: '>>'
-        # 添加其他操作符...
-    }.get(op_type, op.__class__.__name__)  # 找不到则返回类名
+    def _request(self, params):
+        # 在遍历之前检查 /graph 请求的参数, 只有这里的错误是请求方的错误（400）
+        func_path = params.get("path")
+        if not isinstance(func_path, str) or not func_path:
+            raise BadRequest("missing parameter 'path'")
+        format = params.get("format", "dot")
+        if not isinstance(format, str) or format not in _exporters and format not in graphviz.FORMATS:
+            raise BadRequest(f"unknown format {format!r}")
+        engine = params.get("engine", "dot")
+        if not isinstance(engine, str) or engine not in graphviz.ENGINES:
+            raise BadRequest(f"unknown engine {engine!r}")
+        end_function_list = params.get("end_function_list", self.end_function_list)
+        if isinstance(end_function_list, str):
+            end_function_list = [name for name in end_function_list.split(',') if name]
+        if not isinstance(end_function_list, list) or not all(isinstance(name, str) for name in end_function_list):
+            raise BadRequest("end_function_list must be a list of names")
+        try:
+            unfold_times = int(params.get("unfold_times", 2))
+            options = self._options(params)
+        except (TypeError, ValueError) as e:
+            raise BadRequest(f"bad parameter: {e}") from None
+        return func_path, format, engine, unfold_times, end_function_list, options
 
+    def render(self, params):
+        """
+        处理一个 /graph 请求, 返回 (内容, 格式, 统计信息)
+        参数缺失或不合法时抛出 BadRequest, 找不到入口函数时抛出 FunctionNotFoundError
+        """
+        with self._lock:
+            self.requests += 1
+        try:
+            func_path, format, engine, unfold_times, end_function_list, options = self._request(params)
+            builder, traversal = _traverse_entry(func_path, format, unfold_times, end_function_list, options)
+            return render_bytes(builder.graph, format, engine), format, traversal.stats()
+        except Exception:
+            with self._lock:
+                self.errors += 1
+            raise
 
-def build_alias_map_from_module(mod):
-    """从模块对象中提取别名映射"""
-    alias_map = {}
+    def lazy_graph(self, func_path):
+        """
+        func_path 的 LazyGraph, 同一入口在各请求之间共享, 已生成的片段不再重复生成（LRU, 见 max_lazy_graphs）
+        登记的函数所在的源文件 (mtime, size) 变化后, 先重新读取这些函数（同 GraphWatcher 的 lazy 模式）
+        """
+        with self._lock:
+            lazy = self._lazy.get(func_path)
+            if lazy is not None:
+                self._lazy.move_to_end(func_path)
+        if lazy is None:
+            lazy = LazyGraph(self.end_function_list, **self._options({}))
+            lazy.add_path(func_path)
+            with self._lock:
+                lazy = self._lazy.setdefault(func_path, lazy)
+                self._lazy.move_to_end(func_path)
+                while len(self._lazy) > self.max_lazy_graphs:
+                    self._lazy.popitem(last=False)
+            return lazy
+        self._refresh(lazy)
+        return lazy
+
+    def _refresh(self, lazy):
+        # 同时到达的请求只有一个去重新导入和读取, 其余的等它完成后看到的已是新版本
+        with self._refresh_lock:
+            changed = {file_path for file_path, version in lazy.sources().items()
+                       if _file_version(file_path) != version}
+            if not changed:
+                return
+            if not lazy.options.get('static'):
+                _reload_modules(changed)
+            if self.symbols is not None:
+                self.symbols.update()
+            lazy.refresh(changed)
+
+    def stats(self):
+        return {"requests": self.requests, "errors": self.errors, "ast_cache": ast_cache.stats(),
+                "disk_cache": disk_cache.stats() if disk_cache is not None else None,
+                "symbols": len(self.symbols) if self.symbols is not None else None,
+                "lazy_graphs": len(self._lazy)}
+
+    def serve_forever(self):
+        """处理请求直到 shutdown() 或 Ctrl-C"""
+        try:
+            self.httpd.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.httpd.server_close()
+
+    def shutdown(self):
+        self.httpd.shutdown()
+
+
+def request_graph(func_path, url="http://127.0.0.1:8765", timeout=None, **params):
+    """向 GraphServer 请求 func_path 的图, params 同 POST /graph 的字段; 返回内容 bytes"""
+    body = json.dumps(dict(params, path=func_path)).encode('utf-8')
+    request = urllib.request.Request(url.rstrip('/') + '/graph', data=body,
+                                     headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return response.read()
+
+
+async def add_nodes_edges_async(node, *args, executor=None, **kwargs):
+    """
+    在线程池（executor, 默认为事件循环的默认线程池）中运行 add_nodes_edges, 不阻塞事件循环
+    参数同 add_nodes_edges, 应传入 builder（模块级的 dot 不能在多个遍历间共享）
+    被取消（包括 asyncio.wait_for 超时）时通知遍历不再展开新的函数调用, 线程随后很快结束
+    """
+    cancel = kwargs.setdefault('cancel', threading.Event())
+    loop = asyncio.get_running_loop()
     try:
-        source = inspect.getsource(mod)
-        tree = A.parse(source)
-        for node in A.walk(tree):
-            if isinstance(node, (A.Import, A.ImportFrom)):
-                for alias in node.names:
-                    if alias.asname:
-                        alias_map[alias.asname] = alias.name
-    except Exception as e:
-        print(f"Error building alias map from module {mod.__name__}: {e}")
-    return alias_map
+        return await loop.run_in_executor(executor, functools.partial(add_nodes_edges, node, *args, **kwargs))
+    except asyncio.CancelledError:
+        cancel.set()
+        raise
 
 
-def get_namespace(func):
-    mod = inspect.getmodule(func)
-    current_module = mod.__name__
-    namespace_map = {}  
+async def _feed_dot(proc, graph):
+    # 按块把 DOT 源码逐行写入 dot 的标准输入, 不先拼出整个字符串
+    try:
+        chunk = []
+        size = 0
+        for line in graph:
+            chunk.append(line)
+            size += len(line)
+            if size >= 65536:
+                proc.stdin.write(''.join(chunk).encode('utf-8'))
+                chunk.clear()
+                size = 0
+                await proc.stdin.drain()
+        proc.stdin.write(''.join(chunk).encode('utf-8'))
+        await proc.stdin.drain()
+    except (BrokenPipeError, ConnectionResetError):
+        # dot 提前退出, 错误由返回码和 stderr 给出
+        pass
+    finally:
+        proc.stdin.close()
 
-    # 构建模块级的别名映射
-    alias_map = build_alias_map_from_module(mod)
 
-    # 遍历模块字典获取导入的模块
-    for name, value in mod.__dict__.items():
-        if name in ('__builtins__', '__name__', '__file__', '__package__'):
-            continue
+async def _read_stream(stream, sink):
+    while True:
+        chunk = await stream.read(65536)
+        if not chunk:
+            return
+        sink(chunk)
 
-        # 处理直接导入的模块（如 import numpy as np）
-        if isinstance(value, types.ModuleType):
-            original_name = value.__name__
-            if original_name == current_module:
-                continue
 
-            # 添加原始模块名到字典
-            namespace_map[original_name] = original_name
+async def render_async(graph, format='svg', engine='dot', output=None, timeout=None):
+    """
+    用 asyncio.create_subprocess_exec 运行 graphviz, 边写入 DOT 边读取输出, 不阻塞事件循环
+    graph 为 graphviz.Digraph 或 GraphIR; output 为文件路径时输出直接写入该文件并返回路径,
+    否则返回输出的 bytes; format='dot' 时不启动 graphviz, 直接给出 DOT 源码
+    超过 timeout 秒抛出 TimeoutError（asyncio.TimeoutError）; 超时或被取消时结束 dot 进程
+    """
+    if isinstance(graph, GraphIR):
+        graph = graph.to_digraph()
+    if format == 'dot':
+        data = graph.source.encode('utf-8')
+        if output is None:
+            return data
+        with open(output, 'wb') as f:
+            f.write(data)
+        return output
+    cmd = ['dot', f'-K{engine}', f'-T{format}']
+    try:
+        proc = await asyncio.create_subprocess_exec(*cmd, stdin=asyncio.subprocess.PIPE,
+                                                    stdout=asyncio.subprocess.PIPE,
+                                                    stderr=asyncio.subprocess.PIPE)
+    except FileNotFoundError:
+        raise graphviz.ExecutableNotFound(cmd) from None
+    chunks = []
+    errors = []
+    out = open(output, 'wb') if output is not None else None
+    try:
+        await asyncio.wait_for(asyncio.gather(
+            _feed_dot(proc, graph),
+            _read_stream(proc.stdout, out.write if out is not None else chunks.append),
+            _read_stream(proc.stderr, errors.append),
+            proc.wait()), timeout)
+    except BaseException:
+        if proc.returncode is None:
+            proc.kill()
+            await asyncio.shield(proc.wait())
+        raise
+    finally:
+        if out is not None:
+            out.close()
+    if proc.returncode:
+        raise subprocess.CalledProcessError(proc.returncode, cmd, stderr=b''.join(errors))
+    return output if output is not None else b''.join(chunks)
 
-            # 添加所有匹配的别名到字典
-            for alias, real in alias_map.items():
-                if real == original_name:
-                    namespace_map[alias] = original_name
 
-    # 添加 "__main__"
-    namespace_map["__main__"] = "__main__"
+async def save_async(graph, file_path, format='pdf', engine='dot', timeout=None):
+    """GraphBuilder.save 的异步版本: 输出 file_path.<format>（format='dot' 时为 file_path.dot）, 返回路径"""
+    if isinstance(graph, GraphIR) and format in _exporters:
+        return export(graph, file_path, format)
+    return await render_async(graph, format, engine, f"{file_path}.{format}", timeout)
 
-    return namespace_map
-# 输入为str
-def get_func_ast_by_name(func_name):
-    functions = globals()
-    if func_name in functions:
-        func = functions[func_name]
-        if callable(func):
-            source_code = inspect.getsource(func)
-            func_tree=A.parse(textwrap.dedent(source_code))
-            return func_tree
-        else:
-            print(ValueError(f"{func_name} is not callable."))
-            return None
-    else:
-        print(ValueError(f"Function {func_name} not found."))
-        return None
 
-# 输入为str
-def get_module_func_ast_by_name(module_name, func_name):
+async def build_graph_async(func_path, format='svg', unfold_times=2, end_function_list=[],
+                            engine='dot', timeout=None, executor=None, **options):
+    """
+    按字符串路径生成入口函数的图并返回输出的 bytes（同 GraphServer 的 /graph）:
+    遍历在线程池中进行, 渲染用 render_async; timeout 限制总耗时, 超时抛出 TimeoutError
+    options 同 add_nodes_edges（static / max_nodes / symbols 等）
+    """
+    cancel = threading.Event()
+    loop = asyncio.get_running_loop()
+
+    async def build():
+        try:
+            builder, traversal = await loop.run_in_executor(executor, functools.partial(
+                _traverse_entry, func_path, format, unfold_times, end_function_list,
+                dict(options, cancel=cancel)))
+        except asyncio.CancelledError:
+            cancel.set()
+            raise
+        if isinstance(builder.graph, GraphIR) and format in _exporters:
+            return render_bytes(builder.graph, format)
+        return await render_async(builder.graph, format, engine)
+
+    return await asyncio.wait_for(build(), timeout)
+
+
+class _EntryTimeout(BaseException):
+    """
+    _time_limit 的超时信号: 继承 BaseException, 不会被遍历中处理器的 except Exception 吞掉,
+    直接穿过各层生成器到达 _build_chunk
+    """
+
+
+@contextlib.contextmanager
+def _time_limit(seconds):
+    """
+    超过 seconds 秒抛出 TimeoutError, 依赖 SIGALRM, 只在主线程和支持的平台上生效
+    信号处理函数在当时正在运行的帧中抛出 _EntryTimeout, 离开 with 时才转换成 TimeoutError
+    """
+    if not seconds or not hasattr(signal, 'setitimer') \
+            or threading.current_thread() is not threading.main_thread():
+        yield
+        return
+
+    def on_alarm(signum, frame):
+        raise _EntryTimeout()
+    previous = signal.signal(signal.SIGALRM, on_alarm)
     try:
-        mod = importlib.import_module(module_name)
-    except ImportError:
-        print(f"Module '{module_name}' not found.")
-        return None
-    func = getattr(mod, func_name, None)
-    if func:
+        signal.setitimer(signal.ITIMER_REAL, seconds)
+        yield
+    except _EntryTimeout:
+        raise TimeoutError(f"timed out after {seconds}s") from None
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def _disk_cache_config():
+    return None if disk_cache is None else (disk_cache.directory, disk_cache.max_bytes)
+
+
+def _init_worker(sys_path, cache=None):
+    # spawn 方式启动的进程需要与主进程相同的模块搜索路径, 以及同一个磁盘缓存
+    sys.path[:] = sys_path
+    if cache is not None:
+        enable_disk_cache(*cache)
+
+
+def _build_chunk(func_paths, format, unfold_times, end_function_list, timeout, options):
+    """在工作进程中依次遍历一组入口, 返回 [(图, 结果)], 渲染留给主进程"""
+    entries = []
+    for func_path in func_paths:
+        result = {"path": func_path, "output": None, "stats": None, "error": None}
+        graph = None
         try:
-            source_code = inspect.getsource(func)
-            func_tree=A.parse(textwrap.dedent(source_code))
-            return func_tree
+            with _time_limit(timeout):
+                builder, traversal = _traverse_entry(func_path, format, unfold_times,
+                                                     end_function_list, options)
+            result["stats"] = traversal.stats()
+            graph = builder.graph
         except Exception as e:
-            print(f"Error calling function '{func_name}' in module '{module_name}': {e}")
-            return None
-    else:
-        print(f"Function '{func_name}' not found in module '{module_name}'.")
-        return None
+            print(f"Failed to build graph for '{func_path}': {e}")
+            result["error"] = f"{type(e).__name__}: {e}"
+        entries.append((graph, result))
+    return entries
 
-# 输入为str
-def get_module_class_func_ast_by_name(module_name, class_name, func_name):
-    try:
-        mod = importlib.import_module(module_name)
-    except ImportError:
-        print(f"Module '{module_name}' not found.")
-        return None
-    func_obj = getattr(mod, class_name, None)
-    if func_obj:
-        func = getattr(func_obj, func_name, None)
-        if func:
-            try:
-                source_code = inspect.getsource(func)
-                func_tree=A.parse(textwrap.dedent(source_code))
-                return func_tree
-            except Exception as e:
-                print(f"Error calling function '{func_name}' in class '{class_name}': {e}")
-                return None
-        else:
-            print(f"Function '{func_name}' not found in class '{class_name}'.")
-            return None
-    else:
-        print(f"Class '{class_name}' not found in module '{module_name}'.")
-        return None
 
-def get_function_from_string(func_path):
-    if '.' not in func_path:
-        # 处理无模块路径的情况（如 "my_func"）
-        main_module = sys.modules['__main__']
-        if hasattr(main_module, func_path):
-            return getattr(main_module, func_path)
-        else:
-            print(f"Function '{func_path}' not found in __main__ module")
-            return None
-    
-    # 分割模块/类和函数名
-    module_class, func_name = func_path.rsplit('.', 1)
-    
-    # 分割模块和类名（支持嵌套类）
-    if '.' in module_class:
-        module_name, class_name = module_class.rsplit('.', 1)
-    else:
-        module_name = module_class
-        class_name = None
-    
-    # 导入模块
-    module = importlib.import_module(module_name)
-    
-    if class_name:
-        # 获取类
-        cls = getattr(module, class_name)
-        # 从类中获取函数对象（静态方法、类方法或实例方法）
-        return getattr(cls, func_name)
-    else:
-        # 直接从模块获取函数
-        if hasattr(module, func_name):
-            return getattr(module, func_name)
-        else:
-            print(f"Function '{func_name}' not found in module '{module_name}'")
+def _render_source(source, file_path, format):
+    if format == 'dot':
+        file_path += '.dot'
+        with open(file_path, 'w', encoding='utf-8') as f:
+            f.write(source)
+        return file_path
+    return _write_output(f"{file_path}.{format}", render_bytes(source, format))
 
-def get_attribute_fullpath(node, potential_module_map=None):
+
+def _render_graph(graph, file_path, format, split):
+    if split:
+        # 已经在渲染线程池中, 拆出的各部分在本线程内依次渲染
+        return save_split(graph, file_path, format, workers=1)
+    if isinstance(graph, GraphIR):
+        return GraphBuilder(graph).save(file_path, format)
+    return _render_source(graph.source, file_path, format)
+
+
+def build_parallel(func_paths, output_dir=".", format='pdf', unfold_times=2,
+                   end_function_list=[], split=False, workers=None, chunksize=1, timeout=None,
+                   render_workers=None, **options):
     """
-    解析 A.Attribute 节点的完整路径，并替换别名
-    :param node: AST 节点
-    :param potential_module_map: 别名映射表（如 {"np": "numpy", "DF": "pandas.DataFrame"}）
-    :return: str
+    用进程池并行生成多个入口函数的图, 参数和返回值同 build_batch（结果顺序与 func_paths 一致）
+    workers: 遍历用的进程数, 默认 CPU 核数
+    chunksize: 每个任务包含的入口个数, 入口很多且很小时调大可减少进程间通信
+    timeout: 单个入口遍历的时间上限（秒）, 超时记为错误; 只想截断展开时用 deadline
+    render_workers: 同时运行的 graphviz 渲染进程数, 默认同 workers;
+    渲染在主进程的线程池中进行, 与其余入口的遍历同时进行
     """
-    if potential_module_map is None:
-        potential_module_map = {}
+    os.makedirs(output_dir, exist_ok=True)
+    func_paths = list(func_paths)
+    results = [None] * len(func_paths)
+    chunks = [range(start, min(start + chunksize, len(func_paths)))
+              for start in range(0, len(func_paths), chunksize)]
+    renders = {}
+    with concurrent.futures.ProcessPoolExecutor(workers, initializer=_init_worker,
+                                                initargs=(list(sys.path), _disk_cache_config())) as pool, \
+            concurrent.futures.ThreadPoolExecutor(render_workers or workers or os.cpu_count()) as render_pool:
+        tasks = {pool.submit(_build_chunk, [func_paths[index] for index in chunk], format,
+                             unfold_times, end_function_list, timeout, options): chunk
+                 for chunk in chunks}
+        for task in concurrent.futures.as_completed(tasks):
+            chunk = tasks[task]
+            try:
+                entries = task.result()
+            except Exception as e:
+                # 工作进程异常退出等, 整个任务记为失败
+                print(f"Worker failed on {[func_paths[index] for index in chunk]}: {e}")
+                entries = [(None, {"path": func_paths[index], "output": None, "stats": None,
+                                   "error": f"{type(e).__name__}: {e}"}) for index in chunk]
+            for index, (graph, result) in zip(chunk, entries):
+                results[index] = result
+                if graph is not None:
+                    file_path = os.path.join(output_dir, result["path"])
+                    renders[render_pool.submit(_render_graph, graph, file_path, format, split)] = index
+        for render in concurrent.futures.as_completed(renders):
+            result = results[renders[render]]
+            try:
+                result["output"] = render.result()
+            except Exception as e:
+                print(f"Failed to render graph for '{result['path']}': {e}")
+                result["error"] = f"{type(e).__name__}: {e}"
+    return results
 
-    if isinstance(node, A.Attribute):
-        # 递归处理属性链（如 df["col"].head()）
-        value = get_attribute_fullpath(node.value, potential_module_map)
-        return f"{value}.{node.attr}"
 
-    elif isinstance(node, A.Name):
-        # 优先从别名映射中查找（如 np → numpy）
-        if node.id in potential_module_map:
-            return potential_module_map[node.id]
-        # 若未找到，直接返回原始名称
-        return node.id
-    
-def save_ast(file_path):
-    """path should include file name"""
-    dot.render(file_path, format='pdf', cleanup=True)
-    return
+def _read_func_paths(args):
+    func_paths = list(args.func_paths)
+    if args.input:
+        with open(args.input, encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith('#'):
+                    func_paths.append(line)
+    return func_paths
 
-def build_alias_map(tree):
-    alias_map = {}
 
-    for node in A.walk(tree):
-        if isinstance(node, A.Import):
-            for alias in node.names:
-                if alias.asname:
-                    alias_map[alias.asname] = alias.name
-        elif isinstance(node, A.ImportFrom):
-            module = getattr(node, 'module', None)
-            if not module:
-                continue  # 跳过无效模块
-            for alias in node.names:
-                if alias.asname:
-                    alias_map[alias.asname] = f"{module}.{alias.name}"
-                else:
-                    full_name = f"{module}.{alias.name}"
-                    alias_map[alias.name] = full_name
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Generate AST graphs for functions given as dotted paths (module.func / module.Class.method)")
+    parser.add_argument("func_paths", nargs="*", help="dotted paths of the entry functions")
+    parser.add_argument("-i", "--input", help="file with one dotted path per line ('#' starts a comment)")
+    parser.add_argument("-o", "--output-dir", default=".", help="directory for the output files")
+    parser.add_argument("-f", "--format", default="pdf",
+                        help="graphviz output format, 'dot' writes DOT source only, "
+                             "json / graphml / astg export the graph without layout")
+    parser.add_argument("-u", "--unfold-times", type=int, default=2)
+    parser.add_argument("-e", "--end-function", action="append", default=[],
+                        help="function name not to unfold, can be repeated")
+    parser.add_argument("--iterative", action="store_true", help="traverse with an explicit stack")
+    parser.add_argument("--static", action="store_true",
+                        help="resolve functions from source files on sys.path without importing them")
+    parser.add_argument("--symbols", metavar="ROOT", action="append", default=[],
+                        help="project import root to index for call resolution, can be repeated")
+    parser.add_argument("--symbol-index", metavar="FILE",
+                        help="file the symbol index is kept in between runs (with --symbols)")
+    parser.add_argument("--shared-callees", action="store_true", help="unfold every callee only once")
+    parser.add_argument("--max-nodes", type=int)
+    parser.add_argument("--max-edges", type=int)
+    parser.add_argument("--deadline", type=float, help="seconds per entry point, stops unfolding")
+    parser.add_argument("--max-label-length", type=int, help="truncate node labels after this many characters")
+    parser.add_argument("--split", action="store_true",
+                        help="one file per top-level cluster plus an index page")
+    parser.add_argument("--cache", action="store_true",
+                        help="keep parsed sources in a persistent on-disk cache (pickle files) between runs")
+    parser.add_argument("--cache-dir", help="directory of the --cache parse cache "
+                        "(default $AST_GENERATOR_CACHE_DIR or ~/.cache/ast_generator)")
+    parser.add_argument("--cache-size", type=int, default=256, help="--cache size limit in MB")
+    parser.add_argument("--lazy", action="store_true",
+                        help="write an HTML viewer that loads each called function when its call node is "
+                             "clicked, -u sets how many levels are generated")
+    parser.add_argument("--watch", action="store_true",
+                        help="keep running and regenerate the graphs whose source files change")
+    parser.add_argument("--interval", type=float, default=1.0, help="seconds between checks in --watch mode")
+    parser.add_argument("--serve", metavar="PORT", type=int,
+                        help="run a local HTTP server on PORT instead (see GraphServer), -j sets its threads")
+    parser.add_argument("--host", default="127.0.0.1", help="address the --serve server listens on")
+    parser.add_argument("-j", "--workers", type=int, default=1,
+                        help="number of worker processes, 0 for one per CPU")
+    parser.add_argument("--chunksize", type=int, default=1, help="entry points per worker task")
+    parser.add_argument("--timeout", type=float, help="hard time limit in seconds per entry point (with -j)")
+    args = parser.parse_args(argv)
+
+    func_paths = _read_func_paths(args)
+    if not func_paths and args.serve is None:
+        parser.error("no function given")
+    if args.split and args.format in _exporters:
+        parser.error(f"--split cannot be used with --format {args.format}")
+    # 与 python -m 一致, 允许导入当前目录下的模块
+    if os.getcwd() not in sys.path:
+        sys.path.insert(0, os.getcwd())
+    if args.cache:
+        enable_disk_cache(args.cache_dir, args.cache_size * 1024 * 1024)
+    options = dict(iterative=args.iterative, shared_callees=args.shared_callees, static=args.static,
+                   max_nodes=args.max_nodes, max_edges=args.max_edges, deadline=args.deadline,
+                   max_label_length=args.max_label_length)
+    if args.symbols:
+        options["symbols"] = SymbolIndex.build(args.symbols, args.symbol_index)
+    if args.serve is not None:
+        symbols = options.pop('symbols', None)
+        server = GraphServer(args.host, args.serve, args.workers or None, args.end_function, symbols, **options)
+        print(f"serving on http://{args.host}:{server.address[1]}/")
+        server.serve_forever()
+        return 0
+    if args.watch:
+        watcher = GraphWatcher(func_paths, args.output_dir, args.format, args.unfold_times,
+                               args.end_function, args.split, args.lazy, **options)
+        results = watcher.build()
+        failed = sum(1 for result in results if result["error"] is not None)
+        print(f"{len(results) - failed} graph(s) written to {args.output_dir}, {failed} failed; watching")
+        watcher.watch(args.interval)
+        return 0
+    if args.lazy:
+        os.makedirs(args.output_dir, exist_ok=True)
+        results = [build_lazy(func_path, args.output_dir, args.unfold_times, args.end_function, **options)
+                   for func_path in func_paths]
+    elif args.workers == 1:
+        results = build_batch(func_paths, args.output_dir, args.format, args.unfold_times,
+                              args.end_function, args.split, **options)
+    else:
+        results = build_parallel(func_paths, args.output_dir, args.format, args.unfold_times,
+                                 args.end_function, args.split, workers=args.workers or None,
+                                 chunksize=args.chunksize, timeout=args.timeout, **options)
+    failed = sum(1 for result in results if result["error"] is not None)
+    print(f"{len(results) - failed} graph(s) written to {args.output_dir}, {failed} failed")
+    return 1 if failed else 0
+
 
-    return alias_map
\ No newline at end of file
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,33 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+# 把 DOT 中的标签原样包进 <svg>, 足以检查渲染结果里有哪些节点
+FAKE_SVG = """
+echo '<?xml version="1.0"?>'
+echo '<svg xmlns="http://www.w3.org/2000/svg">'
+grep -o 'label="[^"]*"'
+echo '</svg>'
+"""
+
+
+@pytest.fixture
+def fake_dot(tmp_path, monkeypatch):
+    # 在 PATH 最前面放一个 shell 脚本充当 graphviz 的 dot, 测试不依赖安装的 graphviz
+    if os.name == "nt":
+        pytest.skip("the fake dot is a POSIX shell script")
+    bin_dir = tmp_path / "fakebin"
+    bin_dir.mkdir()
+    monkeypatch.setenv("PATH", str(bin_dir) + os.pathsep + os.environ.get("PATH", ""))
+
+    def install(body=FAKE_SVG):
+        path = bin_dir / "dot"
+        path.write_text("#!/bin/sh\n" + body)
+        path.chmod(0o755)
+        return path
+
+    return install
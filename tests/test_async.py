@@ -0,0 +1,175 @@
+import asyncio
+import os
+import subprocess
+import sys
+import textwrap
+import threading
+import time
+
+import pytest
+
+import ast_generator as A
+
+
+SOURCE = """
+import asdeep
+
+def entry(items):
+    total = 0
+    for item in items:
+        total += asdeep.leaf(item)
+    return total
+"""
+
+DEEP = """
+def leaf(value):
+    return value * 2
+"""
+
+
+@pytest.fixture
+def project(tmp_path, monkeypatch):
+    monkeypatch.syspath_prepend(str(tmp_path))
+    for name, text in (("asmod", SOURCE), ("asdeep", DEEP)):
+        (tmp_path / f"{name}.py").write_text(textwrap.dedent(text))
+    yield tmp_path
+    for name in ("asmod", "asdeep"):
+        sys.modules.pop(name, None)
+
+
+def traverse(run, func, **options):
+    builder = A.GraphBuilder()
+    traversal = run(A.dot_source_prepare(func), edges_set=builder.edges_set, current_graph=builder.graph,
+                    potential_module_map=A.get_namespace(func), builder=builder, **options)
+    return builder, traversal
+
+
+def test_add_nodes_edges_async_matches_sync(project):
+    import asmod
+    expected, _ = traverse(A.add_nodes_edges, asmod.entry)
+
+    async def main():
+        builder = A.GraphBuilder()
+        traversal = await A.add_nodes_edges_async(
+            A.dot_source_prepare(asmod.entry), edges_set=builder.edges_set, current_graph=builder.graph,
+            potential_module_map=A.get_namespace(asmod.entry), builder=builder)
+        return builder, traversal
+
+    builder, traversal = asyncio.run(main())
+    assert traversal.unfolded == 1
+    assert builder.source == expected.source
+
+
+def test_add_nodes_edges_async_sets_cancel_on_timeout(monkeypatch):
+    started = threading.Event()
+    seen = []
+
+    def blocking(node, *args, cancel=None, **kwargs):
+        started.set()
+        seen.append(cancel.wait(10))
+
+    monkeypatch.setattr(A, "add_nodes_edges", blocking)
+
+    async def main():
+        with pytest.raises(TimeoutError):
+            await asyncio.wait_for(A.add_nodes_edges_async(None), 0.1)
+
+    asyncio.run(main())
+    assert started.is_set() and seen == [True]
+
+
+def test_cancelled_traversal_stops_unfolding(project):
+    import asmod
+    cancel = threading.Event()
+    cancel.set()
+
+    async def main():
+        builder = A.GraphBuilder()
+        return await A.add_nodes_edges_async(
+            A.dot_source_prepare(asmod.entry), edges_set=builder.edges_set, current_graph=builder.graph,
+            potential_module_map=A.get_namespace(asmod.entry), builder=builder, cancel=cancel)
+
+    traversal = asyncio.run(main())
+    assert traversal.truncated_by == "cancelled"
+    assert traversal.unfolded == 0
+
+
+def test_render_async_dot_does_not_run_graphviz(project, fake_dot, tmp_path):
+    fake_dot("exit 1\n")
+    import asmod
+    builder, _ = traverse(A.add_nodes_edges, asmod.entry)
+    data = asyncio.run(A.render_async(builder.graph, "dot"))
+    assert data == builder.source.encode("utf-8")
+    out = tmp_path / "graph.dot"
+    assert asyncio.run(A.render_async(builder.graph, "dot", output=str(out))) == str(out)
+    assert out.read_bytes() == data
+    ir_builder = A.GraphBuilder(A.GraphIR())
+    A.add_nodes_edges(A.dot_source_prepare(asmod.entry), edges_set=ir_builder.edges_set,
+                      current_graph=ir_builder.graph, potential_module_map=A.get_namespace(asmod.entry),
+                      builder=ir_builder)
+    assert asyncio.run(A.render_async(ir_builder.graph, "dot")) == ir_builder.graph.to_digraph().source.encode("utf-8")
+
+
+def test_render_async_pipes_through_dot(project, fake_dot, tmp_path):
+    fake_dot()
+    import asmod
+    builder, _ = traverse(A.add_nodes_edges, asmod.entry)
+    data = asyncio.run(A.render_async(builder.graph, "svg"))
+    assert data == builder.graph.pipe(format="svg")
+    assert b"value * 2" in data
+    path = asyncio.run(A.save_async(builder.graph, str(tmp_path / "graph"), "svg"))
+    assert path == str(tmp_path / "graph.svg")
+    assert (tmp_path / "graph.svg").read_bytes() == data
+
+
+def test_render_async_reports_dot_errors(fake_dot):
+    fake_dot("cat > /dev/null\necho broken >&2\nexit 3\n")
+    graph = A.graphviz.Digraph()
+    graph.node("a")
+    with pytest.raises(subprocess.CalledProcessError) as info:
+        asyncio.run(A.render_async(graph, "svg"))
+    assert info.value.returncode == 3 and info.value.stderr == b"broken\n"
+
+
+def test_render_async_timeout_kills_dot(fake_dot, tmp_path):
+    pid_file = tmp_path / "dot.pid"
+    fake_dot(f"echo $$ > {pid_file}\nexec sleep 30\n")
+    graph = A.graphviz.Digraph()
+    graph.node("a")
+    start = time.monotonic()
+    with pytest.raises(TimeoutError):
+        asyncio.run(A.render_async(graph, "svg", timeout=0.5))
+    # 不等 sleep 结束: 超时后 dot 进程被结束并回收
+    assert time.monotonic() - start < 10
+    pid = int(pid_file.read_text())
+    with pytest.raises(ProcessLookupError):
+        os.kill(pid, 0)
+
+
+def test_save_async_exports_graph_ir(project, tmp_path):
+    import asmod
+    builder = A.GraphBuilder(A.GraphIR())
+    A.add_nodes_edges(A.dot_source_prepare(asmod.entry), edges_set=builder.edges_set, current_graph=builder.graph,
+                      potential_module_map=A.get_namespace(asmod.entry), builder=builder)
+    path = asyncio.run(A.save_async(builder.graph, str(tmp_path / "graph"), "json"))
+    assert open(path, "rb").read() == A.render_bytes(builder.graph, "json")
+
+
+def test_build_graph_async(project):
+    data = asyncio.run(A.build_graph_async("asmod.entry", "dot"))
+    builder, _ = A._traverse_entry("asmod.entry", "dot", 2, [], {})
+    assert data == builder.source.encode("utf-8")
+    assert b'"nodes"' in asyncio.run(A.build_graph_async("asmod.entry", "json"))
+
+
+def test_build_graph_async_timeout_cancels_traversal(monkeypatch):
+    seen = []
+
+    def blocking(func_path, format, unfold_times, end_function_list, options):
+        seen.append(options["cancel"].wait(10))
+        raise RuntimeError("cancelled")
+
+    monkeypatch.setattr(A, "_traverse_entry", blocking)
+    with pytest.raises(TimeoutError):
+        asyncio.run(A.build_graph_async("asmod.entry", "dot", timeout=0.1))
+    assert seen == [True]
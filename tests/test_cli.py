@@ -0,0 +1,14 @@
+import ast_generator as A
+
+
+def test_disk_cache_is_opt_in(tmp_path):
+    A.disable_disk_cache()
+    A.main(["ast_generator.export", "-f", "dot", "-o", str(tmp_path / "out")])
+    assert A.disk_cache is None
+    assert (tmp_path / "out" / "ast_generator.export.dot").exists()
+    try:
+        A.main(["ast_generator.export", "-f", "dot", "-o", str(tmp_path / "out"),
+                "--cache", "--cache-dir", str(tmp_path / "cache")])
+        assert A.disk_cache is not None and A.disk_cache.directory == str(tmp_path / "cache")
+    finally:
+        A.disable_disk_cache()
@@ -0,0 +1,132 @@
+import json
+import re
+import xml.etree.ElementTree as ET
+from collections import Counter
+
+import pytest
+
+import ast_generator as A
+
+
+def contents(ir):
+    return list(ir.nodes()), list(ir.edges()), list(ir.clusters()), ir.graph_attrs, ir.comment
+
+
+_ATTR = re.compile(r'(\w+)=("(?:[^"\\]|\\.)*"|\S+)')
+
+
+def digraph_statements(graph):
+    # (所在子图, 语句) 的多重集合; 图属性语句合并后比较, GraphIR 对同一图的多次 attr() 只保留合并的结果
+    scopes = ["root"]
+    found = Counter()
+    attrs = {}
+    for line in graph.source.splitlines():
+        line = line.strip()
+        if line.startswith("subgraph ") and line.endswith("{"):
+            found[(scopes[-1], line)] += 1
+            scopes.append(line)
+        elif line == "}":
+            scopes.pop()
+        elif re.match(r"\w+=", line):
+            attrs.setdefault(scopes[-1], {}).update(_ATTR.findall(line))
+        elif line:
+            found[(scopes[-1], line)] += 1
+    return found, attrs
+
+
+@pytest.fixture(params=[{}, {"shared_callees": True}])
+def graphs(request):
+    digraph = A.GraphBuilder()
+    digraph.add_path("ast_generator.split_graph", 2, **request.param)
+    ir = A.GraphBuilder(A.GraphIR())
+    ir.add_path("ast_generator.split_graph", 2, **request.param)
+    return digraph.graph, ir.graph
+
+
+def test_graph_ir_matches_digraph(graphs):
+    digraph, ir = graphs
+    assert digraph_statements(ir.to_digraph()) == digraph_statements(digraph)
+
+
+def test_json_export(graphs):
+    _, ir = graphs
+    data = json.loads(A.ir_to_json(ir))
+    assert len(data["nodes"]) == len(ir) and len(data["edges"]) == ir.edge_count()
+    declared = {node["id"] for node in data["nodes"]}
+    assert all(edge["source"] in declared and edge["target"] in declared for edge in data["edges"])
+
+
+def test_graphml_export(graphs):
+    _, ir = graphs
+    ns = {"g": "http://graphml.graphdrawing.org/xmlns"}
+    graph = ET.fromstring(A.ir_to_graphml(ir)).find("g:graph", ns)
+    assert len(graph.findall("g:edge", ns)) == ir.edge_count()
+    assert len(graph.findall("g:node", ns)) >= len(ir)
+
+
+def test_binary_round_trip(graphs, tmp_path):
+    _, ir = graphs
+    path = A.export(ir, str(tmp_path / "graph"), "astg")
+    with open(path, "rb") as f:
+        loaded = A.load_binary(f.read())
+    assert contents(loaded) == contents(ir)
+
+
+def test_load_binary_rejects_other_data():
+    with pytest.raises(ValueError):
+        A.load_binary(b"digraph {}")
+
+
+def test_compact_storage_merges_like_graphviz():
+    ir = A.GraphIR()
+    ir.attr(rankdir="TB")
+    with ir.subgraph(name="cluster_a") as sub:
+        sub.attr(label="A", color=None)
+        sub.node("1", "first", color="red")
+        sub.edge("1", "2", label="next", style="dashed")
+    ir.node("1", None, shape="box")
+    ir.node("2", "second")
+    ir.edge("2", "1")
+    assert list(ir.nodes()) == [("1", "first", "cluster_a", {"color": "red", "shape": "box"}),
+                                ("2", "second", None, {})]
+    assert list(ir.edges()) == [("1", "2", "next", "cluster_a", {"style": "dashed"}),
+                                ("2", "1", None, None, {})]
+    assert list(ir.clusters()) == [("cluster_a", None, {"label": "A"})]
+    # 相同的字符串只存一份
+    assert len(ir._strings) == len(set(ir._strings))
+    assert contents(A.load_binary(A.ir_to_binary(ir))) == contents(ir)
+
+
+def test_subgraph_arguments():
+    ir = A.GraphIR()
+    with ir.subgraph(name="cluster_a", graph_attr={"label": "A"}, comment="ignored") as sub:
+        sub.node("1", "first")
+        with sub.subgraph(name="cluster_b", graph_attr={"color": "red"}) as inner:
+            inner.node("2", "second")
+    assert list(ir.clusters()) == [("cluster_a", None, {"label": "A"}), ("cluster_b", "cluster_a", {"color": "red"})]
+    other = A.GraphIR()
+    with pytest.raises(TypeError):
+        ir.subgraph(graph=other)
+    with pytest.raises(TypeError):
+        sub.subgraph(other)
+    with pytest.raises(ValueError):
+        ir.subgraph(name="cluster_c", node_attr={"shape": "box"})
+    assert [name for name, _, _ in ir.clusters()] == ["cluster_a", "cluster_b"]
+
+
+def test_attribute_values_are_strings(tmp_path):
+    ir = A.GraphIR()
+    ir.attr(nodesep=0.5)
+    with ir.subgraph(name="cluster_a") as sub:
+        sub.attr(penwidth=2)
+        sub.node("1", 10, width=1, fixedsize=True)
+    ir.edge("1", "2", label=3, weight=5)
+    expected = contents(ir)
+    assert expected[0] == [("1", "10", "cluster_a", {"width": "1", "fixedsize": "True"})]
+    assert expected[1] == [("1", "2", "3", None, {"weight": "5"})]
+    assert expected[2] == [("cluster_a", None, {"penwidth": "2"})]
+    assert expected[3] == {"nodesep": "0.5"}
+    assert contents(A.load_binary(A.ir_to_binary(ir))) == expected
+    path = A.export(ir, str(tmp_path / "graph"), "astg")
+    with open(path, "rb") as f:
+        assert contents(A.load_binary(f.read())) == expected
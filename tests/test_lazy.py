@@ -0,0 +1,127 @@
+import ast
+import json
+import os
+import sys
+import textwrap
+
+import pytest
+
+import ast_generator as A
+
+
+MAIN = """
+import lzlib
+
+def entry(items):
+    total = lzlib.first(items)
+    return lzlib.second(total) + lzlib.first(items)
+"""
+
+LIB = """
+import lzdeep
+
+def first(items):
+    return len(items)
+
+def second(value):
+    return lzdeep.leaf(value) * 2
+"""
+
+DEEP = """
+def leaf(value):
+    return value
+"""
+
+
+@pytest.fixture
+def project(tmp_path, monkeypatch):
+    monkeypatch.syspath_prepend(str(tmp_path))
+    for name, text in (("lzmain", MAIN), ("lzlib", LIB), ("lzdeep", DEEP)):
+        (tmp_path / f"{name}.py").write_text(textwrap.dedent(text))
+    yield tmp_path
+    for name in ("lzmain", "lzlib", "lzdeep"):
+        sys.modules.pop(name, None)
+
+
+@pytest.fixture
+def traversals(monkeypatch):
+    # 记下每次遍历的函数名, 检查片段是否只在第一次请求时生成
+    names = []
+    original = A.add_nodes_edges
+
+    def counting(node, *args, **kwargs):
+        names.append(next(ast.iter_child_nodes(node)).name)
+        return original(node, *args, **kwargs)
+
+    monkeypatch.setattr(A, "add_nodes_edges", counting)
+    return names
+
+
+def test_fragments_are_generated_on_demand(project, traversals):
+    lazy = A.LazyGraph()
+    root = lazy.add_path("lzmain.entry")
+    assert traversals == []
+    fragment = lazy.fragment(root)
+    assert traversals == ["entry"]
+    # 入口中的两个被调用函数只登记, 各出现一次, 还没有生成
+    first, second = lazy.links(root)
+    assert (lazy.title(first), lazy.title(second)) == ("first", "second")
+    assert lazy.fragment(root) is fragment
+    assert traversals == ["entry"]
+    # 调用节点链接到被调用函数的片段
+    assert f'URL="#{first}"' in fragment.source and f'URL="#{second}"' in fragment.source
+    (leaf,) = lazy.links(second)
+    assert lazy.title(leaf) == "leaf"
+    assert traversals == ["entry", "second"]
+    assert lazy.fragment(second) is lazy.fragment(second)
+    assert traversals == ["entry", "second"]
+
+
+def test_fragment_ids_are_stable(project):
+    first = A.LazyGraph()
+    second = A.LazyGraph()
+    assert first.add_path("lzmain.entry") == second.add_path("lzmain.entry")
+    assert first.links(first.root) == second.links(second.root)
+    assert first.fragment(first.root).source == second.fragment(second.root).source
+
+
+def test_unknown_fragment_is_rejected(project):
+    lazy = A.LazyGraph()
+    lazy.add_path("lzmain.entry")
+    with pytest.raises(KeyError):
+        lazy.fragment("f000000000000")
+    with pytest.raises(KeyError):
+        lazy.fragment_script("f000000000000")
+    with pytest.raises(A.FunctionNotFoundError):
+        A.LazyGraph().add_path("lzmain.missing")
+
+
+def test_viewer_html_loads_fragment_scripts(project, fake_dot):
+    fake_dot()
+    lazy = A.LazyGraph()
+    root = lazy.add_path("lzmain.entry")
+    page = lazy.viewer_html()
+    assert f"astViewer.show({json.dumps(root)});" in page
+    assert 'script.src = id + ".js";' in page
+    script = lazy.fragment_script(root)
+    prefix = f"astViewer.add({json.dumps(root)}, {json.dumps('entry')}, "
+    assert script.startswith(prefix)
+    svg = json.loads(script[len(prefix):-len(");\n")])
+    assert svg.startswith("<svg") and "lzlib.second(total)" in svg
+
+
+def test_save_writes_each_fragment_once(project, fake_dot, tmp_path):
+    fake_dot()
+    lazy = A.LazyGraph()
+    root = lazy.add_path("lzmain.entry")
+    out = tmp_path / "out"
+    index = lazy.save(str(out))
+    assert open(index, encoding="utf-8").read() == lazy.viewer_html()
+    written = sorted(name for name in os.listdir(out) if name.endswith(".js"))
+    first, second = lazy.links(root)
+    expected = [root, first, second] + lazy.links(second)
+    assert written == sorted(f"{fragment_id}.js" for fragment_id in expected)
+    # 只保存入口这一层
+    shallow = tmp_path / "shallow"
+    lazy.save(str(shallow), max_depth=0)
+    assert sorted(os.listdir(shallow)) == sorted(["index.html", f"{root}.js"])
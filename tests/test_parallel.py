@@ -0,0 +1,22 @@
+import time
+
+import pytest
+
+import ast_generator as A
+
+
+def test_time_limit_is_not_swallowed_by_handlers():
+    # 遍历中的处理器用 except Exception 兜底, 超时仍然要传到 with 之外
+    with pytest.raises(TimeoutError):
+        with A._time_limit(0.05):
+            while True:
+                try:
+                    time.sleep(0.01)
+                except Exception:
+                    pass
+
+
+def test_build_parallel_records_timeout(tmp_path):
+    results = A.build_parallel(["ast_generator.build_lazy"], str(tmp_path), format='dot',
+                               workers=1, timeout=1e-6)
+    assert results[0]["error"].startswith("TimeoutError")
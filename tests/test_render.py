@@ -0,0 +1,49 @@
+import pytest
+
+import ast_generator as A
+
+
+@pytest.fixture
+def builders():
+    digraph = A.GraphBuilder()
+    digraph.add_path("ast_generator.render_bytes", 1)
+    ir = A.GraphBuilder(A.GraphIR())
+    ir.add_path("ast_generator.render_bytes", 1)
+    return digraph, ir
+
+
+def test_dot_format_returns_source(builders):
+    digraph, ir = builders
+    assert A.render_bytes(digraph.graph, "dot") == digraph.source.encode("utf-8")
+    assert A.render_bytes(ir.graph, "dot") == ir.graph.to_digraph().source.encode("utf-8")
+
+
+@pytest.mark.parametrize("format", ["json", "graphml", "astg"])
+def test_graph_ir_uses_exporters(builders, format, tmp_path):
+    _, ir = builders
+    data = A.render_bytes(ir.graph, format)
+    assert isinstance(data, bytes)
+    path = A.export(ir.graph, str(tmp_path / "graph"), format)
+    with open(path, "rb") as f:
+        assert f.read() == data
+
+
+def test_dot_string_input():
+    source = 'digraph {\n\ta -> b\n}\n'
+    assert A.render_bytes(source, "dot") == source.encode("utf-8")
+
+
+def test_default_graph_is_module_dot():
+    A.reset_graph()
+    try:
+        A.dot.node("only", "single node")
+        assert A.render_bytes(format="dot") == A.dot.source.encode("utf-8")
+    finally:
+        A.reset_graph()
+
+
+def test_graphviz_formats_use_engine(fake_dot, tmp_path):
+    args_file = tmp_path / "args"
+    fake_dot(f'echo "$@" > {args_file}\ncat > /dev/null\necho rendered\n')
+    assert A.render_bytes('digraph { a }', "svg", "neato") == b"rendered\n"
+    assert args_file.read_text().split() == ["-Kneato", "-Tsvg"]
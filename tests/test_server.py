@@ -0,0 +1,187 @@
+import json
+import os
+import sys
+import textwrap
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+
+import pytest
+
+import ast_generator as A
+
+
+@pytest.fixture
+def server():
+    server = A.GraphServer(port=0, workers=2, max_lazy_graphs=2)
+    yield server
+    server.httpd.server_close()
+
+
+@pytest.fixture
+def project(tmp_path, monkeypatch):
+    monkeypatch.syspath_prepend(str(tmp_path))
+    yield tmp_path
+    for name in [name for name in sys.modules if name.startswith("srvmod")]:
+        del sys.modules[name]
+
+
+def write_module(path, body, mtime):
+    path.write_text(textwrap.dedent(body))
+    os.utime(path, ns=(mtime, mtime))
+
+
+def test_lazy_graph_is_refreshed_when_source_changes(server, project):
+    module = project / "srvmod.py"
+    write_module(module, """
+        def entry(x):
+            return x * 2
+    """, 1_000_000_000)
+    lazy = server.lazy_graph("srvmod.entry")
+    assert "x * 2" in lazy.fragment(lazy.root).source
+    write_module(module, """
+        def entry(x):
+            return x * 3 - 1
+    """, 2_000_000_000)
+    assert server.lazy_graph("srvmod.entry") is lazy
+    source = lazy.fragment(lazy.root).source
+    assert "x * 3 - 1" in source and "x * 2" not in source
+
+
+def test_lazy_graphs_are_bounded(server, project):
+    write_module(project / "srvmod_many.py", """
+        def a():
+            return 1
+
+        def b():
+            return 2
+
+        def c():
+            return 3
+    """, 1_000_000_000)
+    first = server.lazy_graph("srvmod_many.a")
+    server.lazy_graph("srvmod_many.b")
+    server.lazy_graph("srvmod_many.c")
+    assert server.stats()["lazy_graphs"] == 2
+    assert server.lazy_graph("srvmod_many.a") is not first
+
+
+@pytest.fixture
+def running(server):
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield "http://%s:%d" % server.address
+    server.shutdown()
+    thread.join()
+
+
+def fetch(url, body=None):
+    data = json.dumps(body).encode("utf-8") if body is not None else None
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, data=data), timeout=30) as response:
+            return response.status, dict(response.headers), response.read()
+    except urllib.error.HTTPError as e:
+        with e:
+            return e.code, dict(e.headers), e.read()
+
+
+SERVED = """
+    def entry(x):
+        if x:
+            return x + 1
+        return 0
+
+    class Holder:
+        def method(self):
+            return 1
+"""
+
+
+def test_post_graph_returns_dot_and_stats(running, project):
+    write_module(project / "srvmod_http.py", SERVED, 1_000_000_000)
+    status, headers, data = fetch(running + "/graph", {"path": "srvmod_http.entry", "format": "dot"})
+    assert status == 200
+    assert headers["Content-Type"].startswith("text/vnd.graphviz")
+    assert "digraph {" in data.decode("utf-8")
+    stats = json.loads(headers["X-Graph-Stats"])
+    assert stats["nodes"] > 0
+    assert A.request_graph("srvmod_http.entry", running, timeout=30, format="dot") == data
+
+
+def test_get_graph_with_query_matches_post(running, project):
+    write_module(project / "srvmod_http.py", SERVED, 1_000_000_000)
+    query = urllib.parse.urlencode({"path": "srvmod_http.entry", "format": "json", "unfold_times": 1})
+    status, headers, data = fetch(running + "/graph?" + query)
+    assert status == 200
+    assert headers["Content-Type"] == "application/json"
+    assert "nodes" in json.loads(data)
+    posted = fetch(running + "/graph", {"path": "srvmod_http.entry", "format": "json", "unfold_times": 1})
+    assert posted[2] == data
+
+
+@pytest.mark.parametrize("body, status", [
+    ({"format": "dot"}, 400),
+    ({"path": ["srvmod_http.entry"]}, 400),
+    ({"path": "srvmod_http.entry", "format": "svg", "engine": "no-such-engine"}, 400),
+    ({"path": "srvmod_http.entry", "format": "no-such-format"}, 400),
+    ({"path": "srvmod_http.entry", "unfold_times": "many"}, 400),
+    ({"path": "srvmod_http.entry", "max_nodes": [1]}, 400),
+    ({"path": "srvmod_absent_xyz.entry"}, 404),
+    ({"path": "srvmod_http.missing"}, 404),
+    ({"path": "srvmod_http.Holder.missing"}, 404),
+    ({"path": "srvmod_http.Missing.method"}, 404),
+    ({"path": "srvmod_broken.entry"}, 500),
+])
+def test_graph_errors(running, project, body, status):
+    write_module(project / "srvmod_http.py", SERVED, 1_000_000_000)
+    # 模块存在, 但导入时自身出错: 不是 404
+    write_module(project / "srvmod_broken.py", """
+        import srvmod_absent_dependency
+
+        def entry():
+            return 1
+    """, 1_000_000_000)
+    code, headers, data = fetch(running + "/graph", body)
+    assert code == status
+    assert headers["Content-Type"] == "application/json"
+    assert "error" in json.loads(data)
+
+
+def test_internal_errors_are_500(running, project, monkeypatch):
+    write_module(project / "srvmod_http.py", SERVED, 1_000_000_000)
+
+    def broken(*args):
+        raise KeyError("internal")
+
+    monkeypatch.setattr(A, "render_bytes", broken)
+    status, _, data = fetch(running + "/graph", {"path": "srvmod_http.entry", "format": "dot"})
+    assert status == 500
+    assert "KeyError" in json.loads(data)["error"]
+
+
+def test_view_of_missing_function_is_404(running, project):
+    write_module(project / "srvmod_http.py", SERVED, 1_000_000_000)
+    assert fetch(running + "/view/srvmod_http.Holder.missing/")[0] == 404
+    assert fetch(running + "/view/srvmod_http.Holder.method/")[0] == 200
+    assert fetch(running + "/view/srvmod_http.Holder.method/f000000000000.js")[0] == 404
+
+
+def test_bad_body_and_unknown_path(running):
+    request = urllib.request.Request(running + "/graph", data=b"[1, 2]")
+    with pytest.raises(urllib.error.HTTPError) as info:
+        urllib.request.urlopen(request, timeout=30)
+    assert info.value.code == 400
+    info.value.close()
+    assert fetch(running + "/nowhere")[0] == 404
+
+
+def test_stats_counts_requests(running, project):
+    write_module(project / "srvmod_http.py", SERVED, 1_000_000_000)
+    fetch(running + "/graph", {"path": "srvmod_http.entry", "format": "dot"})
+    fetch(running + "/graph", {"format": "dot"})
+    status, _, data = fetch(running + "/stats")
+    assert status == 200
+    stats = json.loads(data)
+    assert stats["requests"] == 2 and stats["errors"] == 1
+    assert stats["lazy_graphs"] == 0
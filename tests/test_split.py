@@ -0,0 +1,50 @@
+import io
+
+import pytest
+
+import ast_generator as A
+
+
+def sample(items):
+    total = 0
+    for item in items:
+        if item:
+            total += item
+        else:
+            total -= 1
+    while total > 10:
+        total //= 2
+    return total
+
+
+def pieces(graph):
+    return [(name, count) for name, _, _, count in A.split_graph(graph, "out", "dot")]
+
+
+def test_split_graph_ir_matches_digraph():
+    digraph = A.GraphBuilder()
+    digraph.add_function(sample)
+    ir = A.GraphBuilder(A.GraphIR())
+    ir.add_function(sample)
+    assert len(pieces(digraph.graph)) > 1
+    assert pieces(ir.graph) == pieces(digraph.graph)
+
+
+def test_split_rejects_stream_writer_and_export_formats(tmp_path):
+    writer = A.DotStreamWriter(io.StringIO())
+    A.GraphBuilder(writer).add_function(sample)
+    with pytest.raises(TypeError):
+        A.split_graph(writer, "out")
+    builder = A.GraphBuilder(A.GraphIR())
+    builder.add_function(sample)
+    with pytest.raises(ValueError):
+        builder.save_split(str(tmp_path / "sample"), "json")
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_split_dot_output(tmp_path):
+    builder = A.GraphBuilder(A.GraphIR())
+    builder.add_function(sample)
+    index = builder.save_split(str(tmp_path / "sample"), "dot")
+    outputs = sorted(path.name for path in tmp_path.iterdir())
+    assert index.endswith("sample.index.html") and "sample.dot" in outputs and len(outputs) > 2
@@ -0,0 +1,43 @@
+import io
+from collections import Counter
+
+import pytest
+
+import ast_generator as A
+
+
+def statements(source):
+    # (所在子图, 语句) 的多重集合: 流式写出时外层图的语句可能排在子图之后, 同一图内的先后不影响结果
+    scopes = ["root"]
+    found = Counter()
+    for line in source.splitlines():
+        line = line.strip()
+        if line.startswith("subgraph ") and line.endswith("{"):
+            found[(scopes[-1], line)] += 1
+            scopes.append(line)
+        elif line == "}":
+            scopes.pop()
+        elif line:
+            found[(scopes[-1], line)] += 1
+    return found
+
+
+@pytest.mark.parametrize("options", [{}, {"shared_callees": True}, {"iterative": True}])
+def test_stream_writer_matches_digraph(options):
+    builder = A.GraphBuilder()
+    builder.add_path("ast_generator.split_graph", 2, **options)
+    out = io.StringIO()
+    with A.DotStreamWriter(out) as writer:
+        A.GraphBuilder(writer).add_path("ast_generator.split_graph", 2, **options)
+    assert statements(out.getvalue()) == statements(builder.source)
+    assert out.getvalue().rstrip().endswith("}")
+
+
+def test_stream_writer_file(tmp_path):
+    builder = A.GraphBuilder()
+    builder.add_path("ast_generator.save_split", 1)
+    path = tmp_path / "graph.dot"
+    writer = A.DotStreamWriter(str(path))
+    A.GraphBuilder(writer).add_path("ast_generator.save_split", 1)
+    writer.close()
+    assert statements(path.read_text(encoding="utf-8")) == statements(builder.source)
@@ -0,0 +1,125 @@
+import json
+import os
+import textwrap
+
+import pytest
+
+import ast_generator as A
+
+
+def write(path, body, mtime=1_000_000_000):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(textwrap.dedent(body))
+    os.utime(path, ns=(mtime, mtime))
+
+
+@pytest.fixture
+def project(tmp_path):
+    root = tmp_path / "src"
+    write(root / "pkg" / "__init__.py", """
+        from .core import Engine as Motor
+    """)
+    write(root / "pkg" / "core.py", """
+        class Engine:
+            def start(self):
+                return 1
+
+        def run():
+            return Engine().start()
+    """)
+    write(root / "pkg" / "util.py", """
+        from pkg.core import run
+
+        def helper():
+            return run()
+    """)
+    return root
+
+
+def test_saved_index_loads_equal(project, tmp_path):
+    path = str(tmp_path / "symbols.json")
+    index = A.SymbolIndex.build([project], path)
+    loaded = A.SymbolIndex.load(path)
+    assert loaded is not None
+    assert loaded.roots == index.roots
+    assert loaded.symbols == index.symbols
+    for name in ("pkg.core.run", "pkg.util.run", "pkg.Motor.start", "pkg.util.helper"):
+        assert loaded.lookup(name) == index.lookup(name) is not None
+        assert loaded.location(name) == index.location(name)
+    assert loaded.resolve("run", "pkg.util") == ("pkg.core", "run")
+    assert loaded.lookup("pkg.missing") is None
+
+
+def test_build_reparses_only_changed_files(project, tmp_path, monkeypatch):
+    path = str(tmp_path / "symbols.json")
+    A.SymbolIndex.build([project], path)
+    parsed = []
+    original = A.SymbolIndex._parse
+
+    def counting(self, file_path, name, version):
+        parsed.append(name)
+        return original(self, file_path, name, version)
+
+    monkeypatch.setattr(A.SymbolIndex, "_parse", counting)
+    assert A.SymbolIndex.build([project], path).lookup("pkg.util.helper") == ("pkg.util", "helper")
+    assert parsed == []
+    write(project / "pkg" / "util.py", """
+        from pkg.core import run
+
+        def helper2():
+            return run()
+    """, 2_000_000_000)
+    index = A.SymbolIndex.build([project], path)
+    assert parsed == ["pkg.util"]
+    assert index.lookup("pkg.util.helper") is None
+    assert index.lookup("pkg.util.helper2") == ("pkg.util", "helper2")
+    assert A.SymbolIndex.load(path).symbols == index.symbols
+
+
+def test_other_roots_rebuild(project, tmp_path):
+    path = str(tmp_path / "symbols.json")
+    A.SymbolIndex.build([project], path)
+    other = tmp_path / "other"
+    write(other / "solo.py", """
+        def alone():
+            return 0
+    """)
+    index = A.SymbolIndex.build([other], path)
+    assert index.lookup("solo.alone") == ("solo", "alone")
+    assert index.lookup("pkg.core.run") is None
+
+
+@pytest.mark.parametrize("content", ["{not json", json.dumps({"version": -1, "roots": [], "files": {}}), "[]"])
+def test_load_rejects_bad_files(tmp_path, content):
+    path = tmp_path / "symbols.json"
+    path.write_text(content)
+    assert A.SymbolIndex.load(str(path)) is None
+
+
+def test_load_rejects_truncated_index(project, tmp_path):
+    path = tmp_path / "symbols.json"
+    A.SymbolIndex.build([project], str(path))
+    data = json.loads(path.read_text())
+    entry = next(iter(data["files"].values()))
+    broken = [
+        {"version": data["version"]},
+        {"version": data["version"], "roots": data["roots"]},
+        {"version": data["version"], "files": data["files"]},
+        dict(data, roots="src"),
+        dict(data, files=[]),
+        dict(data, files={"x.py": "entry"}),
+        dict(data, files={"x.py": {key: value for key, value in entry.items() if key != "imports"}}),
+        dict(data, files={"x.py": dict(entry, imports={"run": 1})}),
+    ]
+    for content in broken:
+        path.write_text(json.dumps(content))
+        assert A.SymbolIndex.load(str(path)) is None
+    # 截断在中途的文件
+    path.write_text(json.dumps(data)[:40])
+    assert A.SymbolIndex.load(str(path)) is None
+    # 读不出的文件不影响重新建立
+    assert A.SymbolIndex.build([project], str(path)).lookup("pkg.core.run") == ("pkg.core", "run")
+
+
+def test_load_missing_file(tmp_path):
+    assert A.SymbolIndex.load(str(tmp_path / "absent.json")) is None
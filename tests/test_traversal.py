@@ -0,0 +1,86 @@
+import ast
+
+import pytest
+
+import ast_generator as A
+
+
+def sample(items, limit):
+    total = 0
+    for item in items:
+        if item > limit:
+            with open(item) as f:
+                pass
+            total += item
+        else:
+            total -= helper(item)
+    while total > limit:
+        total //= 2
+    return total
+
+
+def helper(value):
+    try:
+        return value * 2
+    except ValueError:
+        return 0
+
+
+def build(func, **options):
+    builder = A.GraphBuilder()
+    builder.add_function(func, **options)
+    return builder.source
+
+
+@pytest.fixture
+def swallowing_handlers():
+    # Pass 的处理器抛出异常, With 的处理器捕获子节点的异常后正常结束
+    saved = {t: A._node_handlers.get(t) for t in (ast.Pass, ast.With)}
+
+    def visit_pass(node, v):
+        raise RuntimeError("child failed")
+
+    def visit_with(node, v):
+        for child in node.body:
+            try:
+                yield (child, node, v.edges_set, v.loop_stack, v.prefix, v.current_graph,
+                       v.unfold_times, None, v.end_function_list, v.potential_module_map)
+            except RuntimeError:
+                v.label += "\nchild failed"
+        v.child_iter_needs = False
+
+    A.register_node_handler(ast.Pass, visit_pass)
+    A.register_node_handler(ast.With, visit_with)
+    yield
+    for node_type, handler in saved.items():
+        if handler is None:
+            A._node_handlers.pop(node_type, None)
+            A._node_dispatch.clear()
+        else:
+            A.register_node_handler(node_type, handler)
+
+
+@pytest.mark.parametrize("unfold_times", [0, 2])
+def test_iterative_matches_recursive(unfold_times):
+    assert build(sample, unfold_times=unfold_times, iterative=True) == \
+        build(sample, unfold_times=unfold_times)
+
+
+def test_iterative_matches_recursive_when_handler_swallows_child_error(swallowing_handlers):
+    recursive = build(sample)
+    assert "child failed" in recursive
+    assert build(sample, iterative=True) == recursive
+
+
+def test_module_level_node_ids_restart_with_new_graph():
+    A.reset_graph()
+    tree = A.dot_source_prepare(sample)
+    A.add_nodes_edges(tree, current_graph=A.dot, potential_module_map=A.get_namespace(sample))
+    first = A.dot.source
+    allocated = len(A.node_ids)
+    assert allocated
+    # 只清空图, 下一次遍历开始时 ID 从头分配
+    A.dot.clear()
+    A.add_nodes_edges(tree, current_graph=A.dot, potential_module_map=A.get_namespace(sample))
+    assert A.dot.source == first and len(A.node_ids) == allocated
+    A.reset_graph()
@@ -0,0 +1,108 @@
+import os
+import re
+import sys
+import textwrap
+
+import pytest
+
+import ast_generator as A
+
+
+MAIN = """
+import wlib
+
+def entry(items):
+    total = wlib.first(items)
+    for item in items:
+        if item:
+            total += wlib.second(item)
+    return wlib.Box.size(total) + total
+"""
+
+LIB = """
+import wdeep
+
+def first(items):
+    return wdeep.leaf(items) + 1
+
+def second(item):
+    while item > 1:
+        item = wdeep.leaf(item)
+    return item
+
+class Box:
+    def size(self):
+        return wdeep.leaf(self) * 2
+"""
+
+DEEP = """
+def leaf(value):
+    return value
+"""
+
+
+@pytest.fixture
+def project(tmp_path, monkeypatch):
+    monkeypatch.syspath_prepend(str(tmp_path))
+    for name, text in (("wmain", MAIN), ("wlib", LIB), ("wdeep", DEEP)):
+        write(tmp_path / f"{name}.py", text)
+    yield tmp_path
+    for name in ("wmain", "wlib", "wdeep"):
+        sys.modules.pop(name, None)
+
+
+def write(path, text):
+    version = getattr(write, "version", 1_000_000_000) + 1_000_000_000
+    write.version = version
+    path.write_text(textwrap.dedent(text))
+    os.utime(path, ns=(version, version))
+
+
+def canonical(ir):
+    # 节点 ID 与分配的先后有关, 按节点在图中的顺序重新编号后比较
+    ids = {name: str(index) for index, (name, _, _, _) in enumerate(ir.nodes())}
+
+    def rename(name):
+        return re.sub(r"\d+", lambda match: ids.get(match.group(), "?"), name) if name else name
+    return ([(label, rename(cluster), attrs) for _, label, cluster, attrs in ir.nodes()],
+            [(ids[tail], ids[head], label, rename(cluster), attrs)
+             for tail, head, label, cluster, attrs in ir.edges()],
+            [(rename(name), rename(parent), attrs) for name, parent, attrs in ir.clusters()])
+
+
+def fresh(options):
+    builder = A.GraphBuilder(A.GraphIR())
+    builder.add_path("wmain.entry", 3, **options)
+    return builder.graph
+
+
+@pytest.mark.parametrize("options", [{}, {"static": True}, {"iterative": True}])
+def test_watch_splices_changed_functions(project, tmp_path, options):
+    watcher = A.GraphWatcher(["wmain.entry"], str(tmp_path / "out"), "json", 3, **options)
+    assert watcher.build()[0]["error"] is None
+    builder, spans, _, _ = watcher._graphs["wmain.entry"]
+    assert len(spans) > 3
+
+    write(project / "wlib.py", LIB.replace("item = wdeep.leaf(item)", "item = wdeep.leaf(item - 1)"))
+    write(project / "wdeep.py", DEEP.replace("return value", "return value + 1"))
+    result, = watcher.poll()
+    assert result["error"] is None and result["stats"]["spliced"] == 3
+    assert watcher._graphs["wmain.entry"][0] is builder
+    assert canonical(builder.graph) == canonical(fresh(options))
+    assert "value + 1" in open(result["output"], encoding="utf-8").read()
+
+    write(project / "wdeep.py", DEEP.replace("return value", "return value * 3"))
+    result, = watcher.poll()
+    assert result["stats"]["spliced"] == 3
+    assert canonical(builder.graph) == canonical(fresh(options))
+
+
+def test_watch_rebuilds_when_names_change(project, tmp_path):
+    watcher = A.GraphWatcher(["wmain.entry"], str(tmp_path / "out"), "json", 3)
+    watcher.build()
+    builder = watcher._graphs["wmain.entry"][0]
+    write(project / "wdeep.py", DEEP + "\ndef extra():\n    return 0\n")
+    result, = watcher.poll()
+    assert "spliced" not in result["stats"]
+    assert watcher._graphs["wmain.entry"][0] is not builder
+    assert canonical(watcher._graphs["wmain.entry"][0].graph) == canonical(fresh({}))